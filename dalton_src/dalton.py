@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# DaltonFix - Point d'entrée unique
+# Une commande par outil ; seul le module de la commande demandée est
+# importé. Le lanceur lui-même n'importe ni NumPy, ni PIL, ni tkinter, et
+# les commandes sans interface ne chargent jamais tkinter.
+# `startup` mesure le démarrage à froid de chaque commande (processus neuf)
+# et échoue au-delà du budget.
+#
+#   cd dalton_src
+#   python3 -m dalton ui
+#   python3 -m dalton cam /dev/fb1
+#   python3 -m dalton batch captures/ -o corrige/ --mode deutan
+#   python3 -m dalton startup --budget-ms 400
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# name -> (module, has main(argv), needs Tk, help)
+COMMANDS = {
+    "ui": ("dalton_ui", True, True, "Dashboard : réglages du driver et aperçu"),
+    "cam": ("dalton_cam", True, True, "DaltonCam : correction en direct, loupe [fb]"),
+    "viewer": ("dalton_viewer", True, True, "sortie du moniteur virtuel [fb] [min_ms] [max_ms]"),
+    "batch": ("dalton_batch", True, False, "correction d'images en lot"),
+    "stream": ("dalton_stream", True, False, "filtre vidéo brut stdin -> stdout"),
+    "metric": ("dalton_metric", True, False, "score de confusion, réglage de l'intensité, check CIEDE2000"),
+    "bench": ("dalton_bench", True, False, "benchmarks (run, compare, scaling, soak)"),
+    "record": ("dalton_record", True, False, "enregistrement du framebuffer (rec, info, play, export, check)"),
+    "verify": ("dalton_verify", True, False, "sortie du driver contre le modèle (run, check)"),
+    "preview": ("dalton_preview", False, False, "aperçu dense du Dashboard : coût par mise à jour [taille]"),
+    "lms": ("dalton_lms", False, False, "coefficients LMS pour le driver (export, check)"),
+    "fixed": ("dalton_fixed", False, False, "conformité virgule fixe du driver [budget]"),
+    "lut": ("dalton_lut", False, False, "LUT 3D contre matrice, 1080p et 4K"),
+    "driver": ("dalton_driver", False, False, "état du driver [mode intensité]"),
+    "apply": ("dalton_apply", False, False, "glissement simulé sur un faux sysfs"),
+    "trace": ("dalton_trace", False, False, "coût de l'instrumentation"),
+}
+STARTUP_BUDGET_MS = 400 # headless command: interpreter start + imports
+GUI_BUDGET_MS = 600 # Tk commands also load tkinter, PIL and their modules
+STARTUP_RUNS = 3 # best of, the first run also warms the page cache
+OPTIONAL_GUI_MODULES = ("tkinter", "ImageTk") # may be missing on headless machines
+
+
+def load(name):
+    # Import the command's module (what `run` does before calling it)
+    return importlib.import_module(COMMANDS[name][0])
+
+
+def run(name, argv):
+    module, has_main, _, _ = COMMANDS[name]
+    if has_main:
+        return load(name).main(list(argv)) or 0
+    # Scripts driven by their `__main__` block: same argv as when run directly
+    import runpy
+    sys.argv = [module + ".py"] + list(argv)
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+    return 0
+
+
+_PROBE = ("import sys, time\n"
+          "t = time.perf_counter()\n"
+          "import dalton\n"
+          "{load}\n"
+          "print(time.perf_counter() - t, 'tkinter' in sys.modules, 'numpy' in sys.modules)\n")
+
+
+def measure_startup(name=None, runs=STARTUP_RUNS):
+    # Fresh interpreter per run. Returns (wall ms, import ms, tkinter loaded,
+    # numpy loaded), best run. name=None measures the bare launcher.
+    code = _PROBE.format(load=f"dalton.load({name!r})" if name else "")
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                             capture_output=True, text=True).stdout.split()
+        wall = (time.perf_counter() - t0) * 1000.0
+        row = (wall, float(out[0]) * 1000.0, out[1] == "True", out[2] == "True")
+        if best is None or row[0] < best[0]:
+            best = row
+    return best
+
+
+def startup(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="dalton startup", description="Cold start time of each command")
+    parser.add_argument("commands", nargs="*", default=list(COMMANDS))
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--gui-budget-ms", type=float, default=GUI_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=STARTUP_RUNS)
+    args = parser.parse_args(argv)
+
+    failures = []
+    report = {}
+    wall, imports, tk, np_loaded = measure_startup(None, args.runs)
+    report["(launcher)"] = {"wall_ms": wall, "import_ms": imports}
+    if tk or np_loaded:
+        failures.append("(launcher): imports tkinter or numpy")
+    for name in args.commands:
+        gui = COMMANDS[name][2]
+        try:
+            wall, imports, tk, _ = measure_startup(name, args.runs)
+        except subprocess.CalledProcessError as e:
+            error = (e.stderr or "").strip().splitlines()[-1:]
+            report[name] = {"error": error}
+            # Only a missing Tk (no python3-tk) is tolerated, and only for Tk commands
+            if not (gui and any(mod in line for line in error for mod in OPTIONAL_GUI_MODULES)):
+                failures.append(f"{name}: {' '.join(error) or 'import failed'}")
+            continue
+        budget = args.gui_budget_ms if gui else args.budget_ms
+        report[name] = {"wall_ms": wall, "import_ms": imports, "tkinter": tk, "budget_ms": budget}
+        if wall > budget:
+            failures.append(f"{name}: {wall:.0f} ms > {budget:.0f} ms")
+        if tk and not gui:
+            failures.append(f"{name}: headless command imports tkinter")
+        print(f"{name:>8}: {wall:6.0f} ms (imports {imports:5.0f} ms){'  tkinter' if tk else ''}", file=sys.stderr)
+    print(json.dumps(report, indent=1))
+    for f in failures:
+        print(f"FAIL {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def usage(out=sys.stdout):
+    print("Usage: python3 -m dalton <commande> [options]\n", file=out)
+    for name, (_, _, gui, text) in COMMANDS.items():
+        print(f"  {name:<8} {text}{' (Tk)' if gui else ''}", file=out)
+    print(f"  {'startup':<8} temps de démarrage à froid de chaque commande, contre un budget", file=out)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        usage()
+        return 0
+    name, rest = argv[0], argv[1:]
+    if name == "startup":
+        return startup(rest)
+    if name not in COMMANDS:
+        usage(sys.stderr)
+        return 2
+    return run(name, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# DaltonFix - Application asynchrone des réglages du Dashboard
+# Chaque cran du curseur d'intensité soumet un état (mode, intensité, gamma).
+# Le thread d'application attend que le curseur se stabilise (debounce),
+# ne garde que le dernier état, ignore ce qui ne change rien, puis écrit
+# sysfs et lance xrandr --gamma hors du thread Tk.
+import abc
+import os
+import subprocess
+import threading
+import time
+import dalton_driver
+
+SYSFS_PARAMS = dalton_driver.SYSFS_PARAMS
+DEBOUNCE_S = 0.05
+MAX_DELAY_S = 0.2 # a long drag still applies at least this often
+
+
+def gamma_values(mode, intensity):
+    # Gamma Hack: Simple channel scaling (not a true Dalton matrix, but gives
+    # a visual tint effect "Globally"). xrandr gamma is 1.0 (normal) ... 0.1 (dark)
+    p = intensity / 100.0
+    r_g = 1.0; g_g = 1.0; b_g = 1.0
+    if mode == 1: # Protan (Red blind) -> Reduce Red
+        r_g = 1.0 - (0.8 * p)
+    elif mode == 2: # Deutan (Green blind)
+        g_g = 1.0 - (0.8 * p)
+    elif mode == 3: # Tritan (Blue blind)
+        b_g = 1.0 - (0.8 * p)
+    return r_g, g_g, b_g
+
+
+class ApplyBackend(abc.ABC):
+    # A target the scheduler writes states to. key(state) is what the
+    # backend actually applies (equal keys = nothing to do); current()
+    # reads it back, None when the backend can't (the scheduler then
+    # compares with the last key it applied).
+    name = "base"
+
+    @abc.abstractmethod
+    def key(self, state):
+        ...
+
+    @abc.abstractmethod
+    def apply(self, state):
+        ...
+
+    def current(self):
+        return None
+
+    def available(self):
+        return True
+
+
+class SysfsBackend(ApplyBackend):
+    # Driver parameters through a DriverClient (shared with the caller, so
+    # external changes it has seen are taken into account)
+    name = "sysfs"
+
+    def __init__(self, root=SYSFS_PARAMS, client=None):
+        self.client = client or dalton_driver.DriverClient(root)
+
+    def key(self, state):
+        return state[0], state[1]
+
+    def current(self):
+        return self.client.get()
+
+    def available(self):
+        return self.client.writable()
+
+    def apply(self, state):
+        self.client.set(*self.key(state))
+
+
+class GammaBackend(ApplyBackend):
+    # xrandr --gamma on the detected monitor; command is configurable for tests
+    name = "gamma"
+
+    def __init__(self, monitor, command="xrandr"):
+        self.monitor = monitor
+        self.command = command
+
+    def key(self, state):
+        mode, intensity, enabled = state
+        return gamma_values(mode, intensity) if enabled else (1.0, 1.0, 1.0)
+
+    def available(self):
+        return bool(self.monitor)
+
+    def apply(self, state):
+        r_g, g_g, b_g = self.key(state)
+        cmd = [self.command, "--output", self.monitor, "--gamma", f"{r_g}:{g_g}:{b_g}"]
+        subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class ApplyScheduler:
+    # submit() is cheap and never blocks; the worker coalesces pending states,
+    # waits DEBOUNCE_S of quiet (MAX_DELAY_S at most), and only calls the
+    # backends whose key changed.
+    def __init__(self, backends, debounce=DEBOUNCE_S, max_delay=MAX_DELAY_S):
+        self.backends = list(backends)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        self.pending = None
+        self.submitted_at = 0.0
+        self.applied = {}
+        self.busy = False
+        self.running = True
+        self.submitted = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.applies = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.thread = threading.Thread(target=self._loop, name="dalton-apply", daemon=True)
+        self.thread.start()
+
+    def submit(self, state):
+        with self.cond:
+            if self.pending is not None:
+                self.coalesced += 1
+            else:
+                self.submitted_at = time.perf_counter()
+            self.pending = tuple(state)
+            self.submitted += 1
+            self.cond.notify()
+
+    def _take(self):
+        # Wait for a state, then for DEBOUNCE_S without new submissions
+        with self.cond:
+            while self.running and self.pending is None:
+                self.cond.wait()
+            if not self.running:
+                return None, 0.0
+            deadline = self.submitted_at + self.max_delay
+            while self.running:
+                count = self.submitted
+                self.cond.wait(max(0.0, min(self.debounce, deadline - time.perf_counter())))
+                if self.submitted == count or time.perf_counter() >= deadline:
+                    break
+            state, since = self.pending, self.submitted_at
+            self.pending = None
+            self.busy = True
+            return state, since
+
+    def _loop(self):
+        while True:
+            state, since = self._take()
+            if state is None:
+                return
+            changed = False
+            for backend in self.backends:
+                key = backend.key(state)
+                # Backends that can read back their state are compared to it
+                current = backend.current()
+                if current is None:
+                    current = self.applied.get(backend.name)
+                if current == key or not backend.available():
+                    continue
+                try:
+                    backend.apply(state)
+                    self.applied[backend.name] = key
+                    changed = True
+                except Exception:
+                    self.errors += 1
+            with self.cond:
+                if changed:
+                    self.applies += 1
+                    self.last_latency = time.perf_counter() - since
+                    self.total_latency += self.last_latency
+                else:
+                    self.skipped += 1
+                self.busy = False
+                self.cond.notify_all()
+
+    def flush(self, timeout=5.0):
+        # Wait until every submitted state has been applied (or dropped)
+        end = time.monotonic() + timeout
+        with self.cond:
+            while self.pending is not None or self.busy:
+                left = end - time.monotonic()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+        return True
+
+    def stats(self):
+        with self.cond:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "skipped": self.skipped,
+                "applies": self.applies,
+                "errors": self.errors,
+                "last_ms": self.last_latency * 1000.0,
+                "mean_ms": self.total_latency / self.applies * 1000.0 if self.applies else 0.0,
+            }
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=1.0)
+
+
+def simulate_drag(root, command="true", ticks=100, tick_s=0.005):
+    # Slider drag against a fake sysfs directory and a stub gamma command
+    for name in ("mode", "intensity"):
+        with open(os.path.join(root, name), "w") as f:
+            f.write("0")
+    scheduler = ApplyScheduler([SysfsBackend(root), GammaBackend("Virtual-1", command)])
+    try:
+        for i in range(ticks + 1):
+            scheduler.submit((1, i * 100 // ticks, True))
+            time.sleep(tick_s)
+        scheduler.flush()
+        scheduler.submit((1, 100, True)) # no-op: same state again
+        scheduler.flush()
+        with open(os.path.join(root, "intensity")) as f:
+            final = f.read()
+        return scheduler.stats(), final
+    finally:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    with tempfile.TemporaryDirectory() as root:
+        stats, final = simulate_drag(root, *sys.argv[1:2])
+    print(f"{stats['submitted']} submissions -> {stats['applies']} applies, "
+          f"{stats['coalesced']} coalesced, {stats['skipped']} skipped, "
+          f"last {stats['last_ms']:.1f} ms, intensity file = {final}")
+    sys.exit(0 if final == "100" and not stats["errors"] else 1)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# DaltonFix - Correction d'images en lot (sans interface)
+# Parcourt des dossiers, corrige chaque image en pleine résolution avec la
+# matrice mode/intensité et écrit le résultat dans une arborescence miroir
+# (un sous-dossier par source quand il y en a plusieurs).
+# Un pool de processus fait le travail ; au plus 2 images par processus
+# sont en vol, la mémoire ne dépend donc pas de la taille du corpus.
+# Les sorties à jour (même source, même réglage) sont sautées grâce au
+# manifeste .dalton_batch du dossier de sortie.
+#
+#   python3 dalton_batch.py captures/ docs/img -o corrige/ --mode deutan --intensity 80 -j 4
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import dalton_engine
+
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+MANIFEST = ".dalton_batch"
+INFLIGHT_PER_WORKER = 2
+PROGRESS_S = 1.0
+
+
+def source_roots(sources):
+    # Output prefix of each source: none for a single source (plain mirror),
+    # else the directory's name, so a/x.png and b/x.png stay apart.
+    # Files given directly keep their bare name.
+    if len(sources) == 1:
+        return [""]
+    roots = ["" if os.path.isfile(src) else os.path.basename(os.path.normpath(os.path.abspath(src)))
+             for src in sources]
+    dirs = [r for r in roots if r]
+    if len(set(dirs)) != len(dirs):
+        raise ValueError("source directories must have distinct names: " + ", ".join(sources))
+    return roots
+
+
+def walk(sources, extensions=EXTENSIONS, exclude=None):
+    # Yields (source path, output path relative to out_dir), sorted per directory.
+    # exclude: directory not to descend into (the output, if inside a source)
+    exclude = os.path.realpath(exclude) if exclude else None
+    for src, root in zip(sources, source_roots(sources)):
+        if os.path.isfile(src):
+            yield src, os.path.basename(src)
+            continue
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if os.path.realpath(os.path.join(dirpath, d)) != exclude)
+            for name in sorted(filenames):
+                if name.lower().endswith(extensions):
+                    path = os.path.join(dirpath, name)
+                    yield path, os.path.join(root, os.path.relpath(path, src))
+
+
+def file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class Manifest:
+    # rel path -> (mtime_ns, size, sha1, mode, intensity, method) of the source last written.
+    # Stored as JSON lines appended as files complete (last line wins).
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST)
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                        self.entries[e["path"]] = (e["mtime_ns"], e["size"], e["sha1"], e["mode"], e["intensity"],
+                                                   e.get("method", dalton_engine.METHOD_SIMPLE))
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+        self.f = None
+
+    def status(self, rel, src, dst, setting, use_hash):
+        # "fresh" (skip), "touched" (same content, new mtime) or "stale"
+        entry = self.entries.get(rel)
+        if entry is None or entry[3:] != setting or not os.path.exists(dst):
+            return "stale"
+        st = os.stat(src)
+        if (st.st_mtime_ns, st.st_size) == entry[:2]:
+            return "fresh"
+        if use_hash and st.st_size == entry[1]:
+            with open(src, "rb") as f:
+                if file_hash(f.read()) == entry[2]:
+                    return "touched"
+        return "stale"
+
+    @staticmethod
+    def _line(rel, entry):
+        mtime_ns, size, sha1, mode, intensity, method = entry
+        return json.dumps({"path": rel, "mtime_ns": mtime_ns, "size": size, "sha1": sha1,
+                           "mode": mode, "intensity": intensity, "method": method}) + "\n"
+
+    def record(self, rel, mtime_ns, size, sha1, setting):
+        if self.f is None:
+            self.f = open(self.path, "a")
+        self.entries[rel] = (mtime_ns, size, sha1) + tuple(setting)
+        self.f.write(self._line(rel, self.entries[rel]))
+
+    def close(self):
+        # Rewrite compacted (one line per file)
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for rel, entry in self.entries.items():
+                f.write(self._line(rel, entry))
+        os.replace(tmp, self.path)
+
+
+def _correct_frame(img, mode, intensity, method):
+    # One decoded frame -> corrected RGB (RGBA if it has transparency)
+    alpha = None
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        alpha = img.convert("RGBA").getchannel("A")
+    out = dalton_engine.apply_image(img, mode, intensity, method)
+    if alpha is not None:
+        out.putalpha(alpha)
+    return out
+
+
+def correct_file(src, dst, mode, intensity, method=dalton_engine.METHOD_SIMPLE):
+    # Worker process: decode, correct at full resolution, save atomically.
+    # Every frame of an animation is corrected; the colour profile and EXIF
+    # are carried over. Returns (mtime_ns, size, sha1, pixels, seconds).
+    from PIL import Image, ImageSequence
+    t0 = time.perf_counter()
+    st = os.stat(src)
+    with open(src, "rb") as f:
+        data = f.read()
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format
+        params = {k: img.info[k] for k in ("icc_profile", "exif") if img.info.get(k)}
+        if getattr(img, "n_frames", 1) > 1:
+            frames, durations = [], []
+            for frame in ImageSequence.Iterator(img):
+                frames.append(_correct_frame(frame, mode, intensity, method))
+                durations.append(frame.info.get("duration", 0))
+            params.update(save_all=True, append_images=frames[1:], duration=durations,
+                          loop=img.info.get("loop", 0))
+            if fmt == "GIF":
+                params["disposal"] = 2 # frames are already composited
+        else:
+            img.load()
+            frames = [_correct_frame(img, mode, intensity, method)]
+    out = frames[0]
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    if fmt == "JPEG":
+        params["quality"] = 95
+        if out.mode == "RGBA":
+            out = out.convert("RGB")
+    tmp = dst + ".part"
+    try:
+        out.save(tmp, format=fmt, **params)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    pixels = sum(f.width * f.height for f in frames)
+    return st.st_mtime_ns, st.st_size, file_hash(data), pixels, time.perf_counter() - t0
+
+
+class Progress:
+    def __init__(self, out=sys.stderr, every=PROGRESS_S):
+        self.out = out
+        self.every = every
+        self.start = time.perf_counter()
+        self.last = 0.0
+        self.done = self.skipped = self.failed = 0
+        self.pixels = 0
+
+    def snapshot(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return {
+            "done": self.done,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "seconds": elapsed,
+            "images_s": self.done / elapsed,
+            "mpix_s": self.pixels / elapsed / 1e6,
+        }
+
+    def show(self, force=False):
+        now = time.perf_counter()
+        if not self.out or (not force and now - self.last < self.every):
+            return
+        self.last = now
+        s = self.snapshot()
+        print(f"{s['done']} corrigées, {s['skipped']} à jour, {s['failed']} erreurs - "
+              f"{s['images_s']:.1f} img/s, {s['mpix_s']:.1f} Mpix/s", file=self.out)
+
+
+def run(sources, out_dir, mode, intensity, workers=None, use_hash=True, force=False, progress=None,
+        method=dalton_engine.METHOD_SIMPLE):
+    intensity = dalton_engine.clamp_intensity(intensity)
+    setting = (mode, intensity, method)
+    progress = progress or Progress()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = Manifest(out_dir)
+    workers = max(1, workers or os.cpu_count() or 1)
+    inflight = {}
+    errors = []
+    seen = set() # output paths claimed in this run
+
+    def collect(futures):
+        for fut in futures:
+            rel = inflight.pop(fut)
+            try:
+                mtime_ns, size, sha1, pixels, _ = fut.result()
+            except Exception as e:
+                progress.failed += 1
+                errors.append((rel, str(e)))
+                continue
+            manifest.record(rel, mtime_ns, size, sha1, setting)
+            progress.done += 1
+            progress.pixels += pixels
+        progress.show()
+
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            for src, rel in walk(sources, exclude=out_dir):
+                if rel in seen:
+                    # Two sources map to one output: never let them overwrite each other
+                    progress.failed += 1
+                    errors.append((src, f"same output as another source: {rel}"))
+                    continue
+                seen.add(rel)
+                dst = os.path.join(out_dir, rel)
+                state = "stale" if force else manifest.status(rel, src, dst, setting, use_hash)
+                if state != "stale":
+                    if state == "touched":
+                        st = os.stat(src)
+                        entry = manifest.entries[rel]
+                        manifest.record(rel, st.st_mtime_ns, st.st_size, entry[2], setting)
+                    progress.skipped += 1
+                    progress.show()
+                    continue
+                # Bounded: wait for a slot before queueing more work
+                while len(inflight) >= workers * INFLIGHT_PER_WORKER:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                inflight[pool.submit(correct_file, src, dst, mode, intensity, method)] = rel
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        manifest.close()
+    progress.show(force=True)
+    return progress.snapshot(), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correct image directories at full resolution")
+    parser.add_argument("sources", nargs="+", help="image files or directories (walked recursively)")
+    parser.add_argument("-o", "--output", required=True, help="output directory (mirrors the source tree)")
+    parser.add_argument("--mode", type=dalton_engine.parse_mode, default=1, help="0-3 or off/protan/deutan/tritan")
+    parser.add_argument("--intensity", type=int, default=100)
+    parser.add_argument("--method", choices=dalton_engine.METHODS, default=dalton_engine.METHOD_SIMPLE,
+                        help="simple: 2I - S like the driver, lms: LMS daltonization")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--no-hash", action="store_true", help="only trust mtime/size for up-to-date checks")
+    parser.add_argument("--force", action="store_true", help="rewrite every output")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        source_roots(args.sources)
+    except ValueError as e:
+        parser.error(str(e))
+    progress = Progress(None if args.quiet else sys.stderr)
+    stats, errors = run(args.sources, args.output, args.mode, args.intensity, args.jobs,
+                        not args.no_hash, args.force, progress, args.method)
+    for rel, err in errors:
+        print(f"{rel}: {err}", file=sys.stderr)
+    print(json.dumps(stats))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
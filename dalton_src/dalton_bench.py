@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# DaltonFix - Benchmarks des chemins critiques
+# Mesure sans interface (images synthétiques) chaque chemin chaud, de
+# 320x240 à 3840x2160 (limites de dalton_init), pour chaque mode.
+#
+#   python3 dalton_bench.py run -o base.json
+#   python3 dalton_bench.py run --cases apply_dalton,viewer --res 1920x1080
+#   python3 dalton_bench.py compare base.json new.json --threshold 10
+#   python3 dalton_bench.py scaling --workers 8 --res 3840x2160
+#   python3 dalton_bench.py soak --frames 5000 --max-growth 8
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import dalton_engine
+
+RESOLUTIONS = [(320, 240), (640, 480), (800, 600), (1280, 720),
+               (1920, 1080), (2560, 1440), (3840, 2160)]
+MODES = [0, 1, 2, 3]
+INTENSITY = 70
+VIEW_SIZE = (800, 600) # Viewer / DaltonCam display size
+
+
+def synthetic_frame(w, h, channels=3, seed=0):
+    # Smooth gradients + noise: realistic enough for every path, reproducible
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    frame = np.empty((h, w, channels), dtype=np.uint8)
+    frame[..., 0] = (x * 255 // max(1, w - 1))
+    frame[..., 1] = (y * 255 // max(1, h - 1))
+    frame[..., 2] = rng.integers(0, 256, (h, w), dtype=np.uint8)
+    if channels == 4:
+        frame[..., 3] = 0
+    return frame
+
+
+# --- Cases: setup(w, h, mode) -> callable, or None if not applicable ---
+
+def case_apply_dalton(w, h, mode):
+    # DaltonCam.apply_dalton: PIL image in, corrected PIL image out
+    from PIL import Image
+    img = Image.fromarray(synthetic_frame(w, h))
+    return lambda: dalton_engine.apply_image(img, mode, INTENSITY)
+
+
+def case_apply_array(w, h, mode):
+    frame = synthetic_frame(w, h)
+    out = np.empty_like(frame)
+    return lambda: dalton_engine.apply_array(frame, mode, INTENSITY, out=out)
+
+
+def case_pil_convert(w, h, mode):
+    # Historical path: Image.convert(matrix=...)
+    from PIL import Image
+    img = Image.fromarray(synthetic_frame(w, h))
+    matrix = dalton_engine.pil_matrix(mode, INTENSITY)
+    return lambda: img.convert("RGB", matrix=matrix)
+
+
+def case_get_matrix(w, h, mode):
+    # Resolution independent: only run once per mode
+    if (w, h) != RESOLUTIONS[0]:
+        return None
+    state = {"i": 0}
+
+    def run():
+        # Walk the intensity range like a slider drag
+        state["i"] = (state["i"] + 1) % 101
+        return dalton_engine.pil_matrix(mode, state["i"])
+    return run
+
+
+def case_update_preview(w, h, mode):
+    # DaltonApp.update_preview minus the Tk paste: 4096-swatch chart, three
+    # panels, one slider step per call
+    if (w, h) != RESOLUTIONS[0]:
+        return None
+    import dalton_preview
+    preview = dalton_preview.Preview()
+    preview.set_chart("swatches")
+    state = {"i": 0}
+
+    def run():
+        state["i"] = state["i"] % 100 + 1
+        return preview.update(mode, state["i"])
+    return run
+
+
+def case_lut(w, h, mode):
+    import dalton_lut
+    frame = synthetic_frame(w, h)
+    out = np.empty_like(frame)
+    return lambda: dalton_lut.apply_setting(frame, mode, INTENSITY, out=out)
+
+
+def case_driver(w, h, mode):
+    import dalton_fixed
+    frame = synthetic_frame(w, h, 4)
+    out = np.empty_like(frame)
+    return lambda: dalton_fixed.apply_frame(frame, mode, INTENSITY, out=out)
+
+
+def _fake_fb(w, h):
+    # File-backed XRGB8888 framebuffer, removed at exit
+    import atexit
+    import shutil
+    import dalton_fb
+    root = tempfile.mkdtemp(prefix="dalton_bench_")
+    atexit.register(shutil.rmtree, root, True)
+    path = os.path.join(root, "fb")
+    synthetic_frame(w, h, 4).tofile(path)
+    return dalton_fb.FramebufferReader(path, geometry=(w, h, w * 4, 32))
+
+
+def case_viewer(w, h, mode):
+    # DaltonViewer.refresh decode/resize: mmap -> scaled RGB -> PIL image
+    if mode != 0:
+        return None
+    from PIL import Image
+    reader = _fake_fb(w, h)
+    return lambda: Image.fromarray(reader.scaled_rgb(VIEW_SIZE), "RGB")
+
+
+def case_photoimage(w, h, mode):
+    # ImageTk.PhotoImage creation, needs a display: skipped when headless
+    if mode != 0:
+        return None
+    if not _tk_root():
+        raise RuntimeError("no display")
+    from PIL import Image, ImageTk
+    img = Image.fromarray(synthetic_frame(w, h))
+    return lambda: ImageTk.PhotoImage(img)
+
+
+_root = []
+
+
+def _tk_root():
+    if not _root:
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+            root.withdraw()
+            _root.append(root)
+        except Exception:
+            _root.append(None)
+    return _root[0]
+
+
+CASES = {
+    "apply_dalton": case_apply_dalton,
+    "apply_array": case_apply_array,
+    "pil_convert": case_pil_convert,
+    "get_matrix": case_get_matrix,
+    "update_preview": case_update_preview,
+    "lut": case_lut,
+    "driver": case_driver,
+    "viewer": case_viewer,
+    "photoimage": case_photoimage,
+}
+
+
+# --- Runner ---
+
+# Metric -> direction of a regression: +1 when higher is worse (timings),
+# -1 when lower is worse (throughput)
+METRICS = {"mean_ms": 1, "p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "fps": -1, "mpix_s": -1}
+
+
+def measure(fn, min_time=0.2, min_runs=5, max_runs=200):
+    fn() # warm-up (caches, first allocation)
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_runs:
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+        if len(samples) >= min_runs and time.perf_counter() - start >= min_time:
+            break
+    return np.array(samples)
+
+
+def summarize(samples, pixels):
+    ms = samples * 1000.0
+    mean = float(ms.mean())
+    return {
+        "runs": int(len(ms)),
+        "mean_ms": mean,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "fps": 1000.0 / mean if mean else 0.0,
+        "mpix_s": pixels / mean / 1000.0 if mean else 0.0,
+    }
+
+
+def run(cases, resolutions, modes, min_time=0.2, log=sys.stderr):
+    results = []
+    for name in cases:
+        setup = CASES[name]
+        for w, h in resolutions:
+            for mode in modes:
+                entry = {"case": name, "width": w, "height": h, "mode": mode}
+                try:
+                    fn = setup(w, h, mode)
+                except Exception as e:
+                    entry["skipped"] = str(e)
+                    results.append(entry)
+                    continue
+                if fn is None:
+                    continue
+                entry.update(summarize(measure(fn, min_time), w * h))
+                results.append(entry)
+                if log:
+                    print(f"{name:>14} {w}x{h} mode {mode}: p50 {entry['p50_ms']:.2f} ms, "
+                          f"p95 {entry['p95_ms']:.2f} ms, {entry['fps']:.1f} fps", file=log)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "intensity": INTENSITY,
+        },
+        "results": results,
+    }
+
+
+def _key(entry):
+    return entry["case"], entry["width"], entry["height"], entry["mode"]
+
+
+def compare(old, new, threshold=10.0, metric="p50_ms"):
+    # Returns (rows, regressions). change is signed so that positive means
+    # worse (a slowdown, or a throughput drop); above threshold % it is a regression.
+    sign = METRICS[metric]
+    before = {_key(e): e for e in old["results"] if metric in e}
+    rows = []
+    regressions = []
+    for e in new["results"]:
+        if metric not in e or _key(e) not in before:
+            continue
+        a = before[_key(e)][metric]
+        b = e[metric]
+        change = sign * (b - a) / a * 100.0 if a else 0.0
+        row = (_key(e), a, b, change)
+        rows.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def scaling(max_workers, resolution=(3840, 2160), path="image", mode=1, min_time=0.5, log=sys.stderr):
+    # dalton_parallel with 1..max_workers workers on the same frame
+    import dalton_parallel
+    from PIL import Image
+    w, h = resolution
+    frame = synthetic_frame(w, h)
+    img = Image.fromarray(frame)
+    out = np.empty_like(frame)
+    rows = []
+    for workers in range(1, max_workers + 1):
+        pc = dalton_parallel.ParallelCorrector(workers)
+        try:
+            if path == "image":
+                fn = lambda: pc.apply_image(img, mode, INTENSITY)
+            elif path == "live":
+                # DaltonCam live path, every tile dirty (full redraw)
+                import dalton_tiles
+                live = dalton_tiles.IncrementalCorrector(parallel=pc)
+                fn = lambda: (live.tracker.reset(), live.process(frame, mode, INTENSITY))
+            else:
+                fn = lambda: pc.apply_array(frame, mode, INTENSITY, out=out)
+            entry = {"workers": workers, "path": path, "width": w, "height": h}
+            entry.update(summarize(measure(fn, min_time), w * h))
+        finally:
+            pc.close()
+        entry["speedup"] = rows[0]["p50_ms"] / entry["p50_ms"] if rows else 1.0
+        entry["efficiency"] = entry["speedup"] / workers
+        rows.append(entry)
+        if log:
+            print(f"{path} {w}x{h} {workers} worker(s): p50 {entry['p50_ms']:.2f} ms, "
+                  f"x{entry['speedup']:.2f} ({entry['efficiency'] * 100:.0f}%)", file=log)
+    return rows
+
+
+def rss_bytes():
+    # Current resident set size (Linux)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def soak(frames=5000, size=VIEW_SIZE, legacy=False, log=sys.stderr):
+    # DaltonCam/DaltonViewer display path for many frames: RSS after warm-up
+    # must not keep growing. Uses a real PhotoImage when a display exists.
+    import dalton_capture
+    import dalton_display
+    import dalton_tiles
+    from PIL import Image
+    root = _tk_root()
+    label = None
+    if root is not None:
+        import tkinter as tk
+        from PIL import ImageTk
+        label = tk.Label(root)
+    w, h = size
+    src = synthetic_frame(w // 2, h // 2)
+    corrector = dalton_tiles.IncrementalCorrector()
+    ring = dalton_display.FrameRing()
+    surface = dalton_display.PhotoSurface(label)
+    manual = synthetic_frame(w, h, seed=1)
+    manual_img = Image.fromarray(manual)
+    manual_out = np.empty_like(manual)
+    keep = None
+    warm = max(1, frames // 10)
+    samples = []
+    for i in range(frames):
+        # Live: a moving band changes every frame, zoomed like the magnifier
+        row = i % src.shape[0]
+        src[row] ^= 0xFF
+        out, rects = corrector.process(src, 1, INTENSITY)
+        if legacy:
+            img = Image.fromarray(dalton_capture.resize_nearest(out, size), "RGB")
+            keep = ImageTk.PhotoImage(img) if label is not None else img.copy()
+        else:
+            surface.show(dalton_capture.resize_nearest(out, size, ring.next((h, w, 3))))
+        # Manual: slider move on a loaded image every 10 frames
+        if i % 10 == 0:
+            if legacy:
+                keep = dalton_engine.apply_image(manual_img.copy(), 2, i % 101)
+            else:
+                dalton_engine.apply_array(manual, 2, i % 101, out=manual_out)
+        if root is not None:
+            root.update_idletasks()
+        if i == warm or i % 100 == 0 or i == frames - 1:
+            samples.append((i, rss_bytes()))
+    base = next(r for i, r in samples if i >= warm)
+    end = samples[-1][1]
+    peak = max(r for i, r in samples if i >= warm)
+    result = {
+        "frames": frames,
+        "legacy": legacy,
+        "photoimage": label is not None,
+        "photoimages_created": surface.created,
+        "rss_warm_mb": base / 1e6,
+        "rss_end_mb": end / 1e6,
+        "rss_peak_mb": peak / 1e6,
+        "growth_mb": (end - base) / 1e6,
+    }
+    if log:
+        print(f"{frames} frames: RSS {result['rss_warm_mb']:.1f} -> {result['rss_end_mb']:.1f} MB "
+              f"(peak {result['rss_peak_mb']:.1f}), PhotoImage {'yes' if label is not None else 'no display'}",
+              file=log)
+    return result
+
+
+def _parse_res(text):
+    out = []
+    for item in text.split(","):
+        w, h = item.lower().split("x")
+        out.append((int(w), int(h)))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DaltonFix benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="run the benchmarks and emit JSON")
+    p_run.add_argument("--cases", default=",".join(CASES), help="comma separated: " + ",".join(CASES))
+    p_run.add_argument("--res", default=None, help="e.g. 1920x1080,3840x2160 (default: 320x240 .. 3840x2160)")
+    p_run.add_argument("--modes", default="0,1,2,3")
+    p_run.add_argument("--min-time", type=float, default=0.2, help="seconds per measurement")
+    p_run.add_argument("-o", "--output", default="-")
+
+    p_cmp = sub.add_parser("compare", help="flag regressions between two runs")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown (or throughput drop) in %%")
+    p_cmp.add_argument("--metric", choices=sorted(METRICS), default="p50_ms",
+                       help="timings: higher is worse, fps/mpix_s: lower is worse")
+
+    p_scale = sub.add_parser("scaling", help="parallel band correction, 1..N workers")
+    p_scale.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p_scale.add_argument("--res", default="3840x2160")
+    p_scale.add_argument("--path", choices=("image", "array", "live"), default="image")
+    p_scale.add_argument("--min-time", type=float, default=0.5)
+
+    p_soak = sub.add_parser("soak", help="RSS must stay flat over many displayed frames")
+    p_soak.add_argument("--frames", type=int, default=5000)
+    p_soak.add_argument("--max-growth", type=float, default=8.0, help="allowed RSS growth after warm-up, MB")
+    p_soak.add_argument("--legacy", action="store_true", help="old path: new images and PhotoImage per frame")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "soak":
+        result = soak(args.frames, legacy=args.legacy)
+        print(json.dumps(result, indent=1))
+        return 1 if result["growth_mb"] > args.max_growth else 0
+    if args.cmd == "scaling":
+        rows = scaling(args.workers, _parse_res(args.res)[0], args.path, min_time=args.min_time)
+        print(json.dumps({"cpus": os.cpu_count(), "results": rows}, indent=1))
+        return 0
+    if args.cmd == "run":
+        cases = [c for c in args.cases.split(",") if c]
+        unknown = [c for c in cases if c not in CASES]
+        if unknown:
+            parser.error(f"unknown case(s): {', '.join(unknown)}")
+        resolutions = _parse_res(args.res) if args.res else RESOLUTIONS
+        modes = [int(m) for m in args.modes.split(",")]
+        report = run(cases, resolutions, modes, args.min_time)
+        text = json.dumps(report, indent=1)
+        if args.output == "-":
+            print(text)
+        else:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(old, new, args.threshold, args.metric)
+    unit = "ms" if args.metric.endswith("_ms") else args.metric
+    sign = METRICS[args.metric]
+    for (case, w, h, mode), a, b, change in rows:
+        flag = "  REGRESSION" if change > args.threshold else ""
+        print(f"{case:>14} {w}x{h} mode {mode}: {a:.2f} -> {b:.2f} {unit} ({sign * change:+.1f}%){flag}")
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,134 +1,67 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk, ImageGrab
+from PIL import Image
 import time
 import sys
+import numpy as np
+import dalton_capture
+import dalton_display
+import dalton_driver
+import dalton_engine
+import dalton_parallel
+import dalton_pipeline
+import dalton_pyramid
+import dalton_tiles
+import dalton_trace
 
 # Configuration
 # Modes: 0=Off, 1=Protan, 2=Deutan, 3=Tritan
 current_mode = 0
 current_intensity = 0
+current_method = dalton_engine.METHOD_SIMPLE # "simple" (same as the driver) or "lms"
+LIVE_DELAY_MS = 30 # Display poll period (Tk thread)
+CAPTURE_INTERVAL = 0.03 # Pause between two captures (capture thread)
+STATS_DELAY_MS = 1000 # Pipeline counters refresh
+DRIVER_POLL_MS = int(dalton_driver.POLL_S * 1000)
+TILED_MIN_PIXELS = 4096 * 4096 # bigger images are shown through a tile pyramid
 
 class DaltonCam(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("DaltonCam - Loupe de Correction")
-        self.geometry("600x450")
-        self.attributes('-topmost', True) # Toujours au dessus
-        
-        # UI Control Frame
-        ctrl_frame = tk.Frame(self, height=50)
-        ctrl_frame.pack(side="top", fill="x")
-        
-        tk.Label(ctrl_frame, text="Mode:").pack(side="left", padx=5)
-        self.combo_mode = ttk.Combobox(ctrl_frame, values=["Normal", "Protanopie", "Deutéranopie", "Tritanopie"], state="readonly")
-        self.combo_mode.current(0)
-        self.combo_mode.pack(side="left")
-        self.combo_mode.bind("<<ComboboxSelected>>", self.update_mode)
-        
-        tk.Label(ctrl_frame, text="Intensité:").pack(side="left", padx=5)
-        self.scale_int = tk.Scale(ctrl_frame, from_=0, to=100, orient="horizontal")
-        self.scale_int.set(100)
-        self.scale_int.pack(side="left", fill="x", expand=True)
-
-        # Image Area
-        self.lbl_img = tk.Label(self, text="Capture en cours...", bg="black", fg="white")
-        self.lbl_img.pack(fill="both", expand=True)
-        
-        # Loop
-        self.after(100, self.loop_capture)
+    def grab_screen(self, bbox=None):
+        # Capture screen (or only bbox) through the backend registry (probed once,
+        # kept until it fails). Returns (frame, layout) or (None, None) if every backend failed.
+        return self.capture.grab(bbox)
 
     def update_mode(self, event=None):
         global current_mode
         current_mode = self.combo_mode.current()
+        self.refresh_view()
 
-    def loop_capture(self):
-        # Capture screen (Full screen or region?)
-        # For speed, let's capture a region around mouse or just resize full screen?
-        # Full screen capture on VM might be slow but let's try.
-        # We assume X11 (ImageGrab works well).
-        try:
-            # First Try: Internal ImageGrab (Fast, X11)
-            img = ImageGrab.grab()
-        except Exception:
-            # Fallback chain
-            import subprocess, os
-            tmp_path = "/tmp/dalton_cap.png"
-            success = False
-            
-            # Method 2: GDBus (GNOME Shell Internal - The reliable way on Ubuntu 22.04+)
-            if not success:
-                try:
-                    # Note: We must be careful with gdbus syntax.
-                    subprocess.run([
-                        "gdbus", "call", "--session", 
-                        "--dest", "org.gnome.Shell.Screenshot", 
-                        "--object-path", "/org/gnome/Shell/Screenshot", 
-                        "--method", "org.gnome.Shell.Screenshot.Screenshot", 
-                        "false", "false", tmp_path
-                    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    if os.path.exists(tmp_path):
-                        img = Image.open(tmp_path)
-                        success = True
-                except: pass
-
-            # Method 3: gnome-screenshot (Force APT version)
-            if not success:
-                try:
-                    # Bypassing the faulty Snap wrapper by calling absolute path
-                    # This works if the user installed the deb package as requested.
-                    bin_path = "/usr/bin/gnome-screenshot"
-                    if not os.path.exists(bin_path):
-                        # Look elsewhere?
-                        bin_path = "gnome-screenshot"
-                    
-                    subprocess.run([bin_path, "-f", tmp_path], check=True)
-                    img = Image.open(tmp_path)
-                    success = True
-                except: pass
-
-            # Method 4: Grim (Wayland Native)
-            if not success:
-                try:
-                    subprocess.run(["grim", tmp_path], check=True)
-                    img = Image.open(tmp_path)
-                    success = True
-                except: pass
-                
-            if not success:
-                msg = "ERREUR CAPTURE.\n\nCliquez sur 'Charger une Image'\npour tester sur une image fixe."
-                self.lbl_img.config(text=msg, fg="red")
-                # Stop loop to avoid spam
-                return
-
-        try:
-            # Resize ... (rest of logic)
-            w, h = img.size
-            target_w = self.lbl_img.winfo_width()
-            target_h = self.lbl_img.winfo_height()
-            
-            if target_w < 50: target_w = 600
-            if target_h < 50: target_h = 400
-            
-            img.thumbnail((target_w, target_h), Image.Resampling.NEAREST)
-            
-            # Apply Correction
-            if current_mode > 0:
-                img = self.apply_dalton(img)
-            
-            # Display
-            self.tk_img = ImageTk.PhotoImage(img)
-            self.lbl_img.config(image=self.tk_img, text="")
-            
-        except Exception as e:
-            self.lbl_img.config(text=f"Erreur Traitement: {e}")
-        
-        # Loop only if not manual mode? 
-        # Actually let's keep loop but if manual image loaded, maybe stop loop?
-    def update_mode(self, event=None):
+    def on_driver_change(self, mode, intensity):
+        if not self.sync_var.get():
+            return
         global current_mode
-        current_mode = self.combo_mode.current()
+        current_mode = mode
+        self.combo_mode.current(mode)
+        self.scale_int.set(intensity)
+        self.refresh_view()
+
+    def sync_driver(self):
+        # Checkbox toggled on: take the current driver state right away
+        if self.sync_var.get():
+            self.driver.poll(force=True)
+            state = self.driver.get()
+            if state is not None:
+                self.on_driver_change(*state)
+
+    def poll_driver(self):
+        if self.sync_var.get():
+            self.driver.poll()
+        self.after(DRIVER_POLL_MS, self.poll_driver)
+
+    def update_method(self, event=None):
+        global current_method
+        current_method = dalton_engine.METHODS[self.combo_method.current()]
         self.refresh_view()
 
     def update_intensity(self, val):
@@ -137,46 +70,189 @@ class DaltonCam(tk.Tk):
     def refresh_view(self):
         # Called when params change or loop ticks
         if hasattr(self, 'manual_mode') and self.manual_mode:
-            if hasattr(self, 'original_image'):
-                img = self.original_image.copy()
-                # Apply Correction
+            t0 = time.perf_counter()
+            if self.pyramid_view is not None:
+                # Huge image: only the visible tiles are decoded and corrected
+                self.pyramid_view.resize(self.view_size())
+                with self.tracer.stage("manual.tiles"):
+                    frame = self.pyramid_view.render(current_mode, self.scale_int.get(), current_method)
+                self.surface.show(frame)
+            elif hasattr(self, 'original_array'):
+                # Corrected into a preallocated buffer, the source is never copied
+                frame = self.original_array
                 if current_mode > 0:
-                    img = self.apply_dalton(img)
-                
-                self.tk_img = ImageTk.PhotoImage(img)
-                self.lbl_img.config(image=self.tk_img, text="")
+                    with self.tracer.stage("manual.correct"):
+                        frame = self.parallel.apply_array(frame, current_mode, self.scale_int.get(),
+                                                          out=self.manual_out, method=current_method)
+                self.surface.show(frame)
+            else:
+                return
+            self.tracer.add("display", time.perf_counter() - t0)
         else:
             # Live Capture mode is handled by loop_capture (which calls this effectively?)
             # Actually let's keep loop_capture independent for now or merge?
             # To avoid complexity, let's just let loop_capture run if not manual.
             pass
 
+    def view_size(self):
+        target_w = self.lbl_img.winfo_width()
+        target_h = self.lbl_img.winfo_height()
+        if target_w < 50: target_w = 600
+        if target_h < 50: target_h = 400
+        return target_w, target_h
+
+    def on_wheel(self, event):
+        # Pyramid zoom around the pointer (Button-4/5 on X11, MouseWheel elsewhere)
+        if self.pyramid_view is None:
+            return
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.pyramid_view.zoom(2.0 if up else 0.5, (event.x, event.y))
+        self.refresh_view()
+
+    def on_drag_start(self, event):
+        self.drag_from = (event.x, event.y)
+
+    def on_drag(self, event):
+        if self.pyramid_view is None or self.drag_from is None:
+            return
+        self.pyramid_view.pan(event.x - self.drag_from[0], event.y - self.drag_from[1])
+        self.drag_from = (event.x, event.y)
+        self.refresh_view()
+
+    def close_pyramid(self):
+        if self.pyramid_view is not None:
+            self.pyramid_view.pyramid.close()
+            self.pyramid_view = None
+
+    def capture_frame(self):
+        # Capture thread: grab + downscale. No Tk calls here, the target
+        # size and region are published by loop_capture on the Tk thread.
+        # The capture time travels with the frame for the latency measure.
+        roi = self.roi
+        t0 = time.perf_counter()
+        with self.tracer.stage("capture.grab"):
+            frame, layout = self.grab_screen(roi)
+        if frame is None:
+            return None
+        with self.tracer.stage("capture.resize"):
+            if roi is None:
+                frame = dalton_capture.thumbnail(frame, self.target_size)
+            frame = np.ascontiguousarray(dalton_capture.to_rgb(frame, layout))
+        return frame, roi, t0
+
+    def correct_frame(self, item):
+        # Correction worker: only dirty tiles, None when the screen is static.
+        # In magnifier mode the region is corrected first, then zoomed.
+        small, roi, t0 = item
+        with self.tracer.stage("correction.tiles"):
+            out, rects = self.live_corrector.process(small, current_mode, self.live_intensity, current_method)
+        if not rects:
+            return None
+        # Hand a ring buffer to the Tk thread, the corrector keeps its own output
+        with self.tracer.stage("correction.handoff"):
+            if roi is not None:
+                size = self.target_size
+                frame = dalton_capture.resize_nearest(out, size, self.display_ring.next((size[1], size[0], 3)))
+            else:
+                frame = self.display_ring.next(out.shape)
+                np.copyto(frame, out)
+        return frame, t0
+
+    def update_roi(self):
+        # Magnifier: only a box around the pointer (or the pinned box) is captured
+        if not self.loupe_var.get():
+            self.roi = None
+            return
+        if self.pin_var.get() and self.pinned_roi is not None:
+            self.roi = self.pinned_roi
+            return
+        try:
+            zoom = max(1, self.zoom_var.get())
+        except tk.TclError:
+            zoom = 2
+        screen = (self.winfo_screenwidth(), self.winfo_screenheight())
+        self.roi = dalton_capture.roi_bbox(self.winfo_pointerxy(), self.target_size, zoom, screen)
+
+    def toggle_pin(self):
+        self.pinned_roi = self.roi if self.pin_var.get() else None
+
+    def show_frame(self, result):
+        # Same PhotoImage updated in place while the size doesn't change
+        frame, t0 = result
+        self.surface.show(frame)
+        self.tracer.add("latency", time.perf_counter() - t0)
+
     def loop_capture(self):
         if hasattr(self, 'manual_mode') and self.manual_mode:
              # In manual mode, we don't loop capture.
              # Updates happen via events.
-             # We just check KeepAlive? No need.
+             self.pipeline.pause()
              self.after(500, self.loop_capture)
              return
 
-        # LIVE MODE
+        # LIVE MODE: capture and correction run in the pipeline threads,
+        # the Tk thread only publishes settings and displays the latest frame.
+        target_w = self.lbl_img.winfo_width()
+        target_h = self.lbl_img.winfo_height()
+        if target_w < 50: target_w = 600
+        if target_h < 50: target_h = 400
+        self.target_size = (target_w, target_h)
+        self.live_intensity = self.scale_int.get()
+        self.update_roi()
+        self.pipeline.pause(False)
+        self.pipeline.start()
+
         try:
-            # ... (Existing capture logic)
-            # Capture
-            success = False
-            img = None
-            
-            # ... (Try methods 1, 2, 3...)
-            # We assume capture code is here. For brevity in this diff, assuming img is captured.
-            # To allow Replace to work, I need to match carefully or rewrite loop_capture mostly.
-            # Since I cannot easily match the scattered fallback blocks, 
-            # I will just re-implement the DISPLAY part of loop_capture to be consistent.
-            # But the user asked for fix on "not moving", meaning controls.
-            
-            # Let's just patch load_manual_image and binding.
-            pass
-        except: pass
-        
+            self.pipeline.poll(self.show_frame)
+        except Exception as e:
+            self.tracer.error("display", e)
+            self.lbl_img.config(text=f"Erreur Traitement: {e}")
+
+        if self.pipeline.error is not None and not self.pipeline.running.is_set():
+            msg = "ERREUR CAPTURE.\n\nCliquez sur 'Charger une Image'\npour tester sur une image fixe."
+            # Why each backend gave up, instead of failing silently
+            errors = [f"{name}: {s['last_error']}" for name, s in self.capture.stats().items() if s["last_error"]]
+            if errors:
+                msg += "\n\n" + "\n".join(errors)
+            self.lbl_img.config(text=msg, fg="red")
+            # Stop loop to avoid spam
+            return
+
+        self.after(LIVE_DELAY_MS, self.loop_capture)
+
+    def update_stats(self):
+        stats = self.pipeline.stats()
+        self.lbl_stats.config(text=" | ".join(
+            f"{name}: {s['fps']:.1f} img/s, {s['busy_ms']:.1f} ms, {s['dropped']} jetées"
+            for name, s in stats.items()))
+        for c in self.pipeline.counters.values():
+            c.reset()
+        if self.tracer.enabled:
+            snap = self.tracer.snapshot()
+            self.tracer.export(snap, pipeline=stats, capture=self.capture.stats(),
+                               capture_fallbacks=self.capture.fallbacks)
+            if self.overlay_var:
+                self.lbl_overlay.config(text=dalton_trace.overlay_text(snap))
+        self.after(STATS_DELAY_MS, self.update_stats)
+
+    def toggle_overlay(self, event=None):
+        # F3: per-stage timings over the image; tracing is switched on with it
+        self.overlay_var = not self.overlay_var
+        if self.overlay_var:
+            self.tracer.enabled = True
+            self.lbl_overlay.config(text="...")
+            self.lbl_overlay.place(x=4, y=4)
+        else:
+            self.lbl_overlay.place_forget()
+
+    def on_close(self):
+        self.pipeline.stop()
+        self.tracer.close()
+        self.capture.close()
+        self.parallel.close()
+        self.close_pyramid()
+        self.destroy()
+
     # Redefining load_manual_image to store original
     def load_manual_image(self):
         from tkinter import filedialog
@@ -185,8 +261,17 @@ class DaltonCam(tk.Tk):
             self.manual_mode = True
             try:
                 # Load and Resize ONCE to fit window (performance)
-                raw_img = Image.open(path)
-                
+                # Large scans are expected here: explicit size limit, not PIL's
+                raw_img = dalton_pyramid.open_image(path)
+                self.close_pyramid()
+                if raw_img.width * raw_img.height > TILED_MIN_PIXELS:
+                    # Never decoded as a whole: pan (drag) and zoom (wheel) over tiles
+                    raw_img.close()
+                    pyramid = dalton_pyramid.Pyramid(path)
+                    self.pyramid_view = dalton_pyramid.PyramidView(pyramid, self.view_size())
+                    self.refresh_view()
+                    return
+
                 target_w = self.lbl_img.winfo_width()
                 target_h = self.lbl_img.winfo_height()
                 if target_w < 50: target_w = 600
@@ -194,13 +279,15 @@ class DaltonCam(tk.Tk):
                 
                 raw_img.thumbnail((target_w, target_h), Image.Resampling.NEAREST)
                 self.original_image = raw_img
+                self.original_array = np.array(raw_img.convert("RGB"))
+                self.manual_out = np.empty_like(self.original_array)
                 
                 self.refresh_view()
 
             except Exception as e:
                 self.lbl_img.config(text=f"Erreur Image: {e}")
 
-    def __init__(self):
+    def __init__(self, capture=None):
         super().__init__()
         self.title("DaltonCam - Loupe de Correction")
         self.geometry("600x450")
@@ -215,6 +302,10 @@ class DaltonCam(tk.Tk):
         self.combo_mode.current(0)
         self.combo_mode.pack(side="left")
         self.combo_mode.bind("<<ComboboxSelected>>", self.update_mode)
+        self.combo_method = ttk.Combobox(ctrl_frame, values=["Simple (driver)", "LMS"], state="readonly", width=14)
+        self.combo_method.current(0)
+        self.combo_method.pack(side="left", padx=5)
+        self.combo_method.bind("<<ComboboxSelected>>", self.update_method)
         
         tk.Button(ctrl_frame, text="Charger Image", command=self.load_manual_image).pack(side="right", padx=10)
         
@@ -223,64 +314,92 @@ class DaltonCam(tk.Tk):
         self.scale_int.set(100)
         self.scale_int.pack(side="left", fill="x", expand=True)
 
+        # Magnifier Controls (region around the pointer instead of full screen)
+        roi_frame = tk.Frame(self)
+        roi_frame.pack(side="top", fill="x")
+        self.loupe_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(roi_frame, text="Loupe (autour de la souris)", variable=self.loupe_var).pack(side="left", padx=5)
+        tk.Label(roi_frame, text="Zoom:").pack(side="left")
+        self.zoom_var = tk.IntVar(value=2)
+        tk.Spinbox(roi_frame, from_=1, to=8, width=3, textvariable=self.zoom_var).pack(side="left")
+        self.pin_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(roi_frame, text="Épingler la zone", variable=self.pin_var, command=self.toggle_pin).pack(side="left", padx=5)
+        self.roi = None
+        self.pinned_roi = None
+
+        # Follow the kernel driver settings (only offered when dalton_drv is loaded)
+        self.driver = dalton_driver.DriverClient()
+        self.sync_var = tk.BooleanVar(value=False)
+        if self.driver.get() is not None:
+            tk.Checkbutton(roi_frame, text="Suivre le driver", variable=self.sync_var, command=self.sync_driver).pack(side="right", padx=5)
+            self.driver.subscribe(self.on_driver_change)
+
         # Image Area
         self.lbl_img = tk.Label(self, text="Capture en cours...", bg="black", fg="white")
         self.lbl_img.pack(fill="both", expand=True)
+        # Stage timings: DALTON_TRACE=1 (or =file.jsonl to export), F3 for the overlay
+        self.tracer = dalton_trace.Tracer.from_env()
+        self.overlay_var = False
+        self.lbl_overlay = tk.Label(self.lbl_img, font=("Courier", 8), bg="black", fg="#7f7", justify="left", anchor="nw")
+        self.bind("<F3>", self.toggle_overlay)
+        self.surface = dalton_display.PhotoSurface(self.lbl_img, self.tracer)
+        self.display_ring = dalton_display.FrameRing()
+        self.pyramid_view = None
+        self.drag_from = None
+        self.lbl_img.bind("<Button-4>", self.on_wheel)
+        self.lbl_img.bind("<Button-5>", self.on_wheel)
+        self.lbl_img.bind("<MouseWheel>", self.on_wheel)
+        self.lbl_img.bind("<ButtonPress-1>", self.on_drag_start)
+        self.lbl_img.bind("<B1-Motion>", self.on_drag)
+
+        # Capture backends (ImageGrab, gdbus, gnome-screenshot, grim, framebuffer)
+        self.capture = capture or dalton_capture.CaptureRegistry()
+
+        # Manual images and large live redraws are corrected in row bands on every core
+        self.parallel = dalton_parallel.ParallelCorrector()
+
+        # Live mode keeps a corrected frame and only recorrects changed tiles
+        self.live_corrector = dalton_tiles.IncrementalCorrector(parallel=self.parallel)
+
+        # Capture thread -> correction thread -> Tk thread, stale frames dropped
+        self.target_size = (600, 400)
+        self.live_intensity = self.scale_int.get()
+        self.pipeline = dalton_pipeline.Pipeline(self.capture_frame, self.correct_frame, CAPTURE_INTERVAL, self.tracer)
+        self.lbl_stats = tk.Label(self, text="", font=("Arial", 7), anchor="w")
+        self.lbl_stats.pack(side="bottom", fill="x")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Loop
         self.after(100, self.loop_capture)
+        self.after(STATS_DELAY_MS, self.update_stats)
+        if self.driver.get() is not None:
+            self.after(DRIVER_POLL_MS, self.poll_driver)
 
         
     def get_matrix(self):
-        global current_intensity
-        intensity = self.scale_int.get() / 100.0
-        
-        sim_protan = [[0.567, 0.433, 0], [0.558, 0.442, 0], [0, 0.242, 0.758]]
-        sim_deutan = [[0.625, 0.375, 0], [0.700, 0.300, 0], [0, 0.300, 0.700]]
-        sim_tritan = [[0.950, 0.050, 0], [0, 0.433, 0.567], [0, 0.475, 0.525]]
-        
-        target_sim = [[1,0,0],[0,1,0],[0,0,1]]
-        if current_mode == 1: target_sim = sim_protan
-        elif current_mode == 2: target_sim = sim_deutan
-        elif current_mode == 3: target_sim = sim_tritan
-        
-        # C = I*(1-p) + (2I-S)*p = I - I*p + 2Ip - Sp = I + Ip - Sp = I + (I-S)*p
-        # Simplify: C = Lerp(I, 2I-S, p)
-        
-        # Matrix 4x3 usually for PIL convert matrix (r,g,b, offset)
-        # Flattened: (rr, rg, rb, ra,  gr, gg, gb, ga,  br, bg, bb, ba)
-        
-        m = []
-        for i in range(3):
-            row = []
-            for j in range(3):
-                ident = 1.0 if i == j else 0.0
-                val_corr = (2.0 * ident) - target_sim[i][j]
-                val_final = ident * (1.0 - intensity) + val_corr * intensity
-                row.append(val_final)
-            row.append(0) # Offset
-            m.extend(row)
-            
-        return m
+        # Matrix 4x3 for PIL convert matrix (r,g,b, offset), shared with dalton_ui
+        return list(dalton_engine.pil_matrix(current_mode, self.scale_int.get(), current_method))
 
     def apply_dalton(self, image):
-        # Ensure image is RGB (drop alpha if any, convert Palette) before matrix
-        # PIL requires RGB or L for matrix conversion
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-            
-        # Convert using matrix
-        matrix = self.get_matrix()
-        return image.convert("RGB", matrix=matrix)
+        # Same output as image.convert("RGB", matrix=...), bands on all cores
+        return self.parallel.apply_image(image, current_mode, self.scale_int.get(), current_method)
 
-if __name__ == "__main__":
-    # Check import
-    try:
-        import PIL
-    except ImportError:
-        print("Installez python3-pil et python3-tk")
-        print("sudo apt install python3-pil.imagetk python3-tk scrot")
-        exit(1)
-        
-    app = DaltonCam()
+def main(argv=None):
+    # Optional raw source probed first (no PNG encode/decode):
+    # dalton_cam.py /dev/fbN  or  dalton_cam.py path:WIDTHxHEIGHT[:LAYOUT]
+    argv = sys.argv[1:] if argv is None else argv
+    capture = None
+    if argv:
+        try:
+            backends = dalton_capture.default_backends(argv[0])
+        except ValueError as e:
+            print(f"Source {argv[0]} ignorée: {e}")
+            backends = dalton_capture.default_backends()
+        capture = dalton_capture.CaptureRegistry(backends)
+
+    app = DaltonCam(capture)
     app.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
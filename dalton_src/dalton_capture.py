@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# DaltonFix - Backends de capture d'écran
+# Chaque méthode de capture est un backend. Le registre sonde les backends
+# une seule fois, garde celui qui marche, et ne resonde qu'après un échec
+# (au lieu de relancer gdbus / gnome-screenshot / grim à chaque image).
+# Les captures sont des tableaux NumPy (H, W, C) uint8 + un layout de
+# dalton_engine.LAYOUTS ("RGB", "BGRX", ...).
+import abc
+import functools
+import mmap
+import os
+import shutil
+import stat
+import subprocess
+import time
+import numpy as np
+import dalton_engine
+import dalton_fb
+
+TMP_PATH = "/tmp/dalton_cap.png"
+SYSFS_GRAPHICS = dalton_fb.SYSFS_GRAPHICS
+
+
+class CaptureError(Exception):
+    pass
+
+
+class CaptureBackend(abc.ABC):
+    # Subclasses implement capture(); grab() adds timing and error accounting
+    name = "base"
+    layout = "RGB"
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+        self.last_error = None
+
+    def available(self):
+        # Cheap check (binary present, device exists...), no capture
+        return True
+
+    @abc.abstractmethod
+    def capture(self, bbox=None):
+        # Returns (H, W, C) uint8 array. bbox = (left, top, right, bottom)
+        ...
+
+    def grab(self, bbox=None):
+        t0 = time.perf_counter()
+        try:
+            frame = self.capture(bbox)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.last_time = time.perf_counter() - t0
+        self.total_time += self.last_time
+        self.count += 1
+        return frame
+
+    def latency(self):
+        # (last, mean) capture latency in seconds
+        mean = self.total_time / self.count if self.count else 0.0
+        return self.last_time, mean
+
+    def close(self):
+        pass
+
+
+def crop(frame, bbox):
+    if bbox is None:
+        return frame
+    left, top, right, bottom = bbox
+    return frame[max(0, top):bottom, max(0, left):right]
+
+
+class ImageGrabBackend(CaptureBackend):
+    # PIL ImageGrab (X11), no subprocess
+    name = "imagegrab"
+
+    def available(self):
+        try:
+            from PIL import ImageGrab
+        except ImportError:
+            return False
+        return True
+
+    def capture(self, bbox=None):
+        from PIL import ImageGrab
+        img = ImageGrab.grab(bbox=bbox)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return np.asarray(img)
+
+
+class CommandBackend(CaptureBackend):
+    # External screenshot tool writing a PNG to TMP_PATH
+    def __init__(self, name, argv, tmp_path=TMP_PATH):
+        super().__init__()
+        self.name = name
+        self.argv = argv
+        self.tmp_path = tmp_path
+
+    def available(self):
+        return shutil.which(self.argv[0]) is not None
+
+    def capture(self, bbox=None):
+        from PIL import Image
+        try:
+            os.unlink(self.tmp_path)
+        except FileNotFoundError:
+            pass
+        argv = [a.replace("{path}", self.tmp_path) for a in self.argv]
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not os.path.exists(self.tmp_path):
+            raise CaptureError(f"{self.name}: no output file")
+        with Image.open(self.tmp_path) as img:
+            frame = np.asarray(img.convert("RGB"))
+        return crop(frame, bbox)
+
+
+def thumbnail(frame, size):
+    # Nearest-neighbour downscale keeping the aspect ratio (like
+    # Image.thumbnail(..., NEAREST)), done with index arrays: no copy of
+    # the full-size frame.
+    h, w = frame.shape[:2]
+    scale = min(size[0] / w, size[1] / h, 1.0)
+    return resize_nearest(frame, (max(1, round(w * scale)), max(1, round(h * scale))))
+
+
+@functools.lru_cache(maxsize=8)
+def _nearest_index(h, w, nh, nw):
+    # Row/column sources and flat source index of every destination pixel,
+    # built once per size pair
+    xs = ((np.arange(nw) + 0.5) * (w / nw)).astype(np.intp)
+    ys = ((np.arange(nh) + 0.5) * (h / nh)).astype(np.intp)
+    flat = (ys[:, None] * w + xs).reshape(-1)
+    for a in (xs, ys, flat):
+        a.setflags(write=False)
+    return ys, xs, flat
+
+
+def resize_nearest(frame, size, out=None):
+    # Nearest-neighbour resize to exactly size = (w, h), used to zoom a region.
+    # With out (nh, nw, C) a contiguous frame is gathered straight into it.
+    h, w = frame.shape[:2]
+    nw, nh = size
+    if (nw, nh) == (w, h) and out is None:
+        return frame
+    ys, xs, flat = _nearest_index(h, w, nh, nw)
+    if out is None or not frame.flags.c_contiguous:
+        # Strided source (e.g. framebuffer view): only the sampled pixels are read
+        res = frame[ys[:, None], xs]
+        if out is None:
+            return res
+        np.copyto(out, res)
+        return out
+    nch = frame.shape[2] if frame.ndim == 3 else 1
+    np.take(frame.reshape(h * w, nch), flat, axis=0, out=out.reshape(nh * nw, nch))
+    return out
+
+
+def roi_bbox(center, view_size, zoom, screen_size):
+    # Region of (view / zoom) pixels around center, kept inside the screen.
+    # Returns (left, top, right, bottom)
+    sw, sh = screen_size
+    w = max(1, min(sw, int(round(view_size[0] / zoom))))
+    h = max(1, min(sh, int(round(view_size[1] / zoom))))
+    left = min(max(0, center[0] - w // 2), sw - w)
+    top = min(max(0, center[1] - h // 2), sh - h)
+    return left, top, left + w, top + h
+
+
+def to_rgb(frame, layout):
+    if layout == "RGB":
+        return frame
+    nch, idx = dalton_engine.LAYOUTS[layout]
+    return frame[..., list(idx)]
+
+
+def gnome_screenshot_bin():
+    # Bypassing the faulty Snap wrapper by calling absolute path
+    bin_path = "/usr/bin/gnome-screenshot"
+    return bin_path if os.path.exists(bin_path) else "gnome-screenshot"
+
+
+class RawBackend(CaptureBackend):
+    # Raw pixels from a framebuffer device, a file or a pipe: no PNG encode/decode.
+    # Seekable sources are mmap'd; pipes are read frame by frame into one buffer.
+    name = "raw"
+
+    def __init__(self, path, width, height, stride=None, layout="BGRX"):
+        super().__init__()
+        self.path = path
+        self.width = width
+        self.height = height
+        self.layout = layout
+        self.bpp = dalton_engine.LAYOUTS[layout][0]
+        self.stride = stride or width * self.bpp
+        self.f = None
+        self.mm = None
+        self.view = None
+
+    def available(self):
+        return os.path.exists(self.path) and os.access(self.path, os.R_OK)
+
+    def _open(self):
+        self.f = open(self.path, "rb", buffering=0)
+        size = self.stride * self.height
+        mode = os.fstat(self.f.fileno()).st_mode
+        if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode):
+            self.buf = bytearray(size)
+            self.view = np.frombuffer(self.buf, dtype=np.uint8)
+        else:
+            self.mm = mmap.mmap(self.f.fileno(), size, mmap.MAP_SHARED, mmap.PROT_READ)
+            self.view = np.frombuffer(self.mm, dtype=np.uint8, count=size)
+        self.view = np.lib.stride_tricks.as_strided(
+            self.view, (self.height, self.width, self.bpp), (self.stride, self.bpp, 1))
+
+    def capture(self, bbox=None):
+        if self.view is None:
+            self._open()
+        if self.mm is None:
+            mv = memoryview(self.buf)
+            got = 0
+            while got < len(self.buf):
+                n = self.f.readinto(mv[got:])
+                if not n:
+                    raise CaptureError(f"{self.path}: end of stream")
+                got += n
+        # Copy so the frame stays stable while the source keeps changing
+        return np.array(crop(self.view, bbox))
+
+    def close(self):
+        self.view = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class FramebufferBackend(CaptureBackend):
+    # /dev/fbN through dalton_fb: stride/bpp from sysfs, XRGB8888/ARGB8888/RGB565
+    name = "framebuffer"
+
+    def __init__(self, fb_path, sysfs_root=SYSFS_GRAPHICS):
+        super().__init__()
+        self.fb_path = fb_path
+        self.sysfs_root = sysfs_root
+        self.reader = None
+
+    def available(self):
+        return os.path.exists(self.fb_path) and os.access(self.fb_path, os.R_OK)
+
+    def capture(self, bbox=None):
+        if self.reader is None:
+            self.reader = dalton_fb.FramebufferReader(self.fb_path, self.sysfs_root)
+        else:
+            self.reader.check_geometry()
+        return self.reader.rgb(bbox)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def source_backend(spec):
+    # Explicit source given on the command line, probed before the others:
+    # "/dev/fbN" (geometry from sysfs) or "path:WIDTHxHEIGHT[:LAYOUT]" for a
+    # raw file/pipe (e.g. a DRM dumb buffer export, a recorder's FIFO)
+    path, sep, geometry = spec.partition(":")
+    if not sep:
+        return FramebufferBackend(path)
+    size, _, layout = geometry.partition(":")
+    try:
+        width, height = (int(v) for v in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"{spec}: expected path:WIDTHxHEIGHT[:LAYOUT]") from None
+    layout = layout or "BGRX"
+    if layout not in dalton_engine.LAYOUTS:
+        raise ValueError(f"{spec}: unknown layout {layout}")
+    return RawBackend(path, width, height, layout=layout)
+
+
+def default_backends(source=None):
+    # Same order as the historical fallback chain, after the explicit source if any
+    backends = [source_backend(source)] if source else []
+    return backends + [
+        ImageGrabBackend(),
+        # GDBus (GNOME Shell Internal - The reliable way on Ubuntu 22.04+)
+        CommandBackend("gdbus", [
+            "gdbus", "call", "--session",
+            "--dest", "org.gnome.Shell.Screenshot",
+            "--object-path", "/org/gnome/Shell/Screenshot",
+            "--method", "org.gnome.Shell.Screenshot.Screenshot",
+            "false", "false", "{path}"]),
+        CommandBackend("gnome-screenshot", [gnome_screenshot_bin(), "-f", "{path}"]),
+        # Grim (Wayland Native)
+        CommandBackend("grim", ["grim", "{path}"]),
+    ]
+
+
+class CaptureRegistry:
+    # Probes backends in order once and sticks with the first that works.
+    # The active backend is only replaced after it fails.
+    def __init__(self, backends=None):
+        self.backends = list(backends) if backends is not None else default_backends()
+        self.active = None
+        self.probes = 0
+        self.fallbacks = 0 # active backend failed and another one was probed
+
+    def probe(self, bbox=None, skip=None):
+        # Returns the first frame of the working backend, or None
+        self.probes += 1
+        self.active = None
+        for backend in self.backends:
+            if backend is skip or not backend.available():
+                continue
+            try:
+                frame = backend.grab(bbox)
+            except Exception:
+                continue # counted by grab()
+            self.active = backend
+            return frame
+        return None
+
+    def grab(self, bbox=None):
+        # Returns (frame, layout) or (None, None) if no backend works
+        failed = self.active
+        if failed is not None:
+            try:
+                return failed.grab(bbox), failed.layout
+            except Exception:
+                # Counted and kept in failed.last_error by grab()
+                self.fallbacks += 1
+        frame = self.probe(bbox, skip=failed)
+        if frame is None:
+            return None, None
+        return frame, self.active.layout
+
+    def stats(self):
+        out = {}
+        for b in self.backends:
+            last, mean = b.latency()
+            out[b.name] = {"count": b.count, "failures": b.failures,
+                           "last_ms": last * 1000.0, "mean_ms": mean * 1000.0,
+                           "active": b is self.active, "last_error": b.last_error}
+        return out
+
+    def close(self):
+        for b in self.backends:
+            b.close()
+
+
+class _FakeBackend(CaptureBackend):
+    # check(): constant frame, fails while self.broken is set
+    def __init__(self, name, value, broken=False, present=True):
+        super().__init__()
+        self.name = name
+        self.value = value
+        self.broken = broken
+        self.present = present
+
+    def available(self):
+        return self.present
+
+    def capture(self, bbox=None):
+        if self.broken:
+            raise CaptureError(f"{self.name}: broken")
+        return crop(np.full((4, 6, 3), self.value, dtype=np.uint8), bbox)
+
+
+def check():
+    # Registry probing, fallback and re-probe over fake backends and a
+    # file-backed raw framebuffer
+    import tempfile
+    ok = True
+
+    def expect(what, cond):
+        nonlocal ok
+        if not cond:
+            print(f"capture: {what}")
+            ok = False
+
+    h, w = 4, 6
+    pixels = np.arange(h * w * 4, dtype=np.uint8).reshape(h, w, 4)
+    with tempfile.NamedTemporaryFile(suffix=".raw") as f:
+        f.write(pixels.tobytes())
+        f.flush()
+        raw = source_backend(f"{f.name}:{w}x{h}:BGRX")
+        absent = _FakeBackend("absent", 1, present=False)
+        first = _FakeBackend("first", 2)
+        registry = CaptureRegistry([absent, raw, first])
+
+        frame, layout = registry.grab((1, 1, 4, 3))
+        expect("le probe doit retenir raw", registry.active is raw and layout == "BGRX")
+        expect("raw: pixels du fichier", np.array_equal(frame, pixels[1:3, 1:4]))
+        expect("backend absent sondé", absent.count + absent.failures == 0)
+        registry.grab()
+        expect("pas de resonde tant que raw marche", registry.probes == 1 and raw.count == 2)
+
+        # Active backend fails: fallback to the next, without retrying it
+        raw.close()
+        raw.path = f.name + ".missing"
+        frame, layout = registry.grab()
+        expect("repli sur first", registry.active is first and frame[0, 0, 0] == 2 and layout == "RGB")
+        expect("raw en échec compté une fois", raw.failures == 1 and raw.last_error is not None)
+        expect("compteurs", registry.probes == 2 and registry.fallbacks == 1)
+
+        # Next failure: raw is probed again (it was only skipped once)
+        first.broken = True
+        raw.path = f.name
+        frame, layout = registry.grab()
+        expect("resonde: retour sur raw", registry.active is raw and first.failures == 1)
+        registry.close()
+        raw.path = f.name + ".missing"
+        expect("aucun backend: (None, None)", registry.grab() == (None, None))
+        stats = registry.stats()
+        expect("stats", set(stats) == {"absent", "raw", "first"} and not any(s["active"] for s in stats.values()))
+
+    try:
+        source_backend("/tmp/x:640by480")
+        expect("géométrie invalide acceptée", False)
+    except ValueError:
+        pass
+    expect("/dev/fbN -> FramebufferBackend", isinstance(source_backend("/dev/fb1"), FramebufferBackend))
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    ok = check()
+    print("capture: OK" if ok else "capture: ERREUR")
+    sys.exit(0 if ok else 1)
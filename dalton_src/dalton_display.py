@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# DaltonFix - Affichage Tk sans réallocation
+# Une seule PhotoImage par taille d'affichage, mise à jour sur place
+# (paste) à partir d'une image PIL persistante remplie par frombytes.
+# Les images corrigées sont écrites dans des tampons préalloués qui
+# tournent (FrameRing) : mémoire plate et moins de pauses GC.
+import numpy as np
+from PIL import Image
+import dalton_trace
+
+RING_SIZE = 3
+
+
+class FrameRing:
+    # count preallocated frames handed out in turn, reallocated only when
+    # the shape changes. The consumer (Tk thread) copies a frame out in
+    # about a millisecond; the producer needs count - 1 full captures
+    # before it comes back to the same buffer.
+    def __init__(self, count=RING_SIZE):
+        self.count = count
+        self.buffers = []
+        self.pos = 0
+
+    def next(self, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        if not self.buffers or self.buffers[0].shape != shape:
+            self.buffers = [np.empty(shape, dtype=dtype) for _ in range(self.count)]
+        self.pos = (self.pos + 1) % self.count
+        return self.buffers[self.pos]
+
+
+class PhotoSurface:
+    # Displays (H, W, 3) uint8 frames (or RGB PIL images) on a Tk widget.
+    # A new PhotoImage is only created when the size changes. widget=None
+    # keeps only the PIL side (headless soak test). The tracer times the
+    # buffer conversion ("display.convert") and the Tk update ("display.photo").
+    def __init__(self, widget, tracer=dalton_trace.DISABLED):
+        self.widget = widget
+        self.tracer = tracer
+        self.image = None
+        self.photo = None
+        self.created = 0
+        self.updates = 0
+
+    @property
+    def size(self):
+        return self.image.size if self.image is not None else None
+
+    def show(self, frame):
+        if isinstance(frame, Image.Image):
+            size = frame.size
+        else:
+            size = (frame.shape[1], frame.shape[0])
+        if self.image is None or self.image.size != size:
+            self.image = Image.new("RGB", size)
+            self.photo = None
+        with self.tracer.stage("display.convert"):
+            if isinstance(frame, Image.Image):
+                src = frame if frame.mode == "RGB" else frame.convert("RGB")
+            else:
+                self.image.frombytes(np.ascontiguousarray(frame))
+                src = self.image
+        if self.widget is not None:
+            with self.tracer.stage("display.photo"):
+                if self.photo is None:
+                    from PIL import ImageTk
+                    self.photo = ImageTk.PhotoImage(src)
+                    self.widget.config(image=self.photo, text="")
+                    self.created += 1
+                else:
+                    self.photo.paste(src)
+        self.updates += 1
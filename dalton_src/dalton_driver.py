@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# DaltonFix - Client des paramètres du driver (sysfs)
+# Lit une fois mode/intensity, garde l'état en cache, n'écrit que ce qui
+# change et dans un ordre qui évite un recalc_matrix visible pour rien.
+# Les changements faits par un autre outil sont détectés par poll() (sysfs
+# ne notifie pas les paramètres de module, inotify n'y voit rien).
+import os
+import threading
+import time
+import dalton_engine
+
+SYSFS_PARAMS = "/sys/module/dalton_drv/parameters"
+PARAMS = ("mode", "intensity")
+POLL_S = 1.0 # external changes are looked for at most once per second
+
+
+class DriverClient:
+    # Cached view of /sys/module/dalton_drv/parameters (root configurable for tests).
+    # Listeners are called as fn(mode, intensity) on external changes, from
+    # the thread that called poll().
+    def __init__(self, root=SYSFS_PARAMS, poll_s=POLL_S):
+        self.root = root
+        self.poll_s = poll_s
+        self.lock = threading.Lock()
+        self.state = None
+        self.listeners = []
+        self.last_poll = 0.0
+        self.reads = 0
+        self.writes = 0
+        self.refresh()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def loaded(self):
+        return os.path.exists(self.path("mode"))
+
+    def writable(self):
+        return os.access(self.path("mode"), os.W_OK)
+
+    def _read(self):
+        values = []
+        for name in PARAMS:
+            with open(self.path(name)) as f:
+                values.append(int(f.read().strip()))
+        self.reads += 1
+        # sysfs takes any integer; recalc_matrix uses identity for anything
+        # but 1-3, so other values behave (and are reported) as off
+        if not 0 <= values[0] < len(dalton_engine.MODE_NAMES):
+            values[0] = dalton_engine.MODE_OFF
+        return tuple(values)
+
+    def _refresh_locked(self):
+        # Caller holds self.lock, so set() can't be half-way through its writes
+        try:
+            self.state = self._read()
+        except (OSError, ValueError):
+            self.state = None
+        return self.state
+
+    def refresh(self):
+        # Re-read sysfs. Returns the state, or None if the module isn't loaded.
+        with self.lock:
+            return self._refresh_locked()
+
+    def get(self):
+        # Cached (mode, intensity), no sysfs access
+        with self.lock:
+            return self.state
+
+    def _order(self, current, mode, intensity):
+        # Each write triggers recalc_matrix. The driver does nothing while
+        # mode is 0, so intensity is written while the effect is off:
+        # turning off -> mode first; turning on -> intensity first.
+        cur_mode, cur_int = current if current else (None, None)
+        writes = []
+        if mode != cur_mode:
+            writes.append(("mode", mode))
+        if intensity != cur_int:
+            writes.append(("intensity", intensity))
+        if cur_mode == dalton_engine.MODE_OFF and mode != dalton_engine.MODE_OFF:
+            writes.reverse()
+        return writes
+
+    def set(self, mode, intensity):
+        # Write only the parameters that differ from the cached state.
+        # Returns the number of sysfs writes.
+        intensity = dalton_engine.clamp_intensity(intensity)
+        with self.lock:
+            writes = self._order(self.state, mode, intensity)
+            for name, value in writes:
+                with open(self.path(name), "w") as f:
+                    f.write(str(value))
+                self.writes += 1
+            if writes:
+                self.state = (mode, intensity)
+            return len(writes)
+
+    def subscribe(self, fn):
+        self.listeners.append(fn)
+
+    def poll(self, force=False):
+        # Look for changes made by another tool (throttled to poll_s).
+        # Returns True and notifies listeners if the driver state changed.
+        now = time.monotonic()
+        if not force and now - self.last_poll < self.poll_s:
+            return False
+        self.last_poll = now
+        # Compared and stored in one locked step: the cache always matches
+        # what this client wrote, so only other tools' writes show up here
+        with self.lock:
+            before = self.state
+            state = self._refresh_locked()
+        if state == before or state is None:
+            return False
+        for fn in self.listeners:
+            fn(*state)
+        return True
+
+
+if __name__ == "__main__":
+    # Usage: dalton_driver.py [mode intensity] (prints the live state, or sets it)
+    import sys
+    client = DriverClient()
+    if client.get() is None:
+        print(f"dalton_drv not loaded ({client.root})")
+        sys.exit(1)
+    if len(sys.argv) == 3:
+        n = client.set(int(sys.argv[1]), int(sys.argv[2]))
+        print(f"{n} write(s)")
+    mode, intensity = client.get()
+    print(f"mode={mode} ({dalton_engine.MODE_NAMES[mode]}) intensity={intensity}")
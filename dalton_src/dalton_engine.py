@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# DaltonFix - Moteur de correction partagé
+# Une seule implémentation de la matrice de correction (C = I + (I - S) * p)
+# utilisée par DaltonCam, le Dashboard et le Viewer. La méthode "lms"
+# (daltonisation LMS) est pliée à l'avance dans la même forme de matrice.
+import collections
+import functools
+import threading
+import numpy as np
+
+# Modes: 0=Off, 1=Protan, 2=Deutan, 3=Tritan
+MODE_OFF = 0
+MODE_PROTAN = 1
+MODE_DEUTAN = 2
+MODE_TRITAN = 3
+MODE_NAMES = ["Normal", "Protanopie", "Deutéranopie", "Tritanopie"]
+MODES = {"off": MODE_OFF, "protan": MODE_PROTAN, "deutan": MODE_DEUTAN, "tritan": MODE_TRITAN}
+
+# Simulation matrices (same values as MAT_*_SIM in dalton_drv.c)
+SIM_MATRICES = {
+    MODE_PROTAN: ((0.567, 0.433, 0.0), (0.558, 0.442, 0.0), (0.0, 0.242, 0.758)),
+    MODE_DEUTAN: ((0.625, 0.375, 0.0), (0.700, 0.300, 0.0), (0.0, 0.300, 0.700)),
+    MODE_TRITAN: ((0.950, 0.050, 0.0), (0.0, 0.433, 0.567), (0.0, 0.475, 0.525)),
+}
+IDENTITY = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+
+# Correction methods:
+#   "simple": 2I - S on the RGB simulation matrices (what dalton_drv.c does)
+#   "lms": RGB -> LMS, simulate, error = RGB - simulated, error shifted
+#          toward the visible channels, back to RGB. Folded into one 3x3.
+METHOD_SIMPLE = "simple"
+METHOD_LMS = "lms"
+METHODS = (METHOD_SIMPLE, METHOD_LMS)
+
+RGB_TO_LMS = ((17.8824, 43.5161, 4.11935),
+              (3.45565, 27.1554, 3.86714),
+              (0.0299566, 0.184309, 1.46709))
+# Dichromat projections in LMS space (missing cone rebuilt from the other two)
+LMS_SIM_MATRICES = {
+    MODE_PROTAN: ((0.0, 2.02344, -2.52581), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    MODE_DEUTAN: ((1.0, 0.0, 0.0), (0.494207, 0.0, 1.24827), (0.0, 0.0, 1.0)),
+    MODE_TRITAN: ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (-0.395913, 0.801109, 0.0)),
+}
+# Lost information (RGB error) redistributed onto the channels still seen
+ERROR_SHIFT = ((0.0, 0.0, 0.0), (0.7, 1.0, 0.0), (0.7, 0.0, 1.0))
+
+# Limits of the virtual display (mode_config in dalton_init)
+MAX_WIDTH = 3840
+MAX_HEIGHT = 2160
+
+# Pixel layouts: bytes per pixel, index of R, G, B inside a pixel.
+# BGRX is what the driver stores in memory for XRGB8888/ARGB8888 (little endian).
+LAYOUTS = {
+    "RGB": (3, (0, 1, 2)),
+    "RGBX": (4, (0, 1, 2)),
+    "RGBA": (4, (0, 1, 2)),
+    "BGRX": (4, (2, 1, 0)),
+    "BGRA": (4, (2, 1, 0)),
+}
+
+# Pixels processed per step: keeps the float32 temporaries in L2 cache
+BAND_PIXELS = 1 << 16
+
+
+def clamp_intensity(intensity):
+    return max(0, min(100, int(intensity)))
+
+
+@functools.lru_cache(maxsize=None)
+def lms_simulation(mode):
+    # RGB -> RGB dichromat simulation, LMS_TO_RGB . S . RGB_TO_LMS
+    sim = np.array(LMS_SIM_MATRICES.get(mode, IDENTITY))
+    lms = np.array(RGB_TO_LMS)
+    return tuple(map(tuple, np.linalg.inv(lms) @ sim @ lms))
+
+
+@functools.lru_cache(maxsize=None)
+def full_correction(mode, method=METHOD_SIMPLE):
+    # Correction at 100% intensity: 2I - S, or I + E (I - T) for "lms"
+    if method == METHOD_LMS:
+        if mode not in LMS_SIM_MATRICES:
+            return IDENTITY
+        eye = np.eye(3)
+        full = eye + np.array(ERROR_SHIFT) @ (eye - np.array(lms_simulation(mode)))
+        return tuple(tuple(float(v) + 0.0 for v in row) for row in full) # no -0.0
+    if method != METHOD_SIMPLE:
+        raise ValueError(f"Unknown method: {method}")
+    sim = SIM_MATRICES.get(mode, IDENTITY)
+    return tuple(tuple((2.0 if i == j else 0.0) - sim[i][j] for j in range(3)) for i in range(3))
+
+
+@functools.lru_cache(maxsize=None)
+def _correction_matrix(mode, intensity, method=METHOD_SIMPLE):
+    full = full_correction(mode, method)
+    p = intensity / 100.0
+    m = []
+    for i in range(3):
+        row = []
+        for j in range(3):
+            ident = 1.0 if i == j else 0.0
+            row.append(ident * (1.0 - p) + full[i][j] * p)
+        m.append(tuple(row))
+    return tuple(m)
+
+
+def correction_matrix(mode, intensity, method=METHOD_SIMPLE):
+    # 3x3 correction matrix for (mode, intensity 0-100), built once per pair
+    return _correction_matrix(int(mode), clamp_intensity(intensity), method)
+
+
+@functools.lru_cache(maxsize=None)
+def _pil_matrix(mode, intensity, method=METHOD_SIMPLE):
+    m = []
+    for row in _correction_matrix(mode, intensity, method):
+        m.extend(row)
+        m.append(0)  # Offset
+    return tuple(m)
+
+
+def pil_matrix(mode, intensity, method=METHOD_SIMPLE):
+    # Flattened 12-tuple for Image.convert("RGB", matrix=...)
+    return _pil_matrix(int(mode), clamp_intensity(intensity), method)
+
+
+@functools.lru_cache(maxsize=None)
+def _matrix_f32(mode, intensity, method=METHOD_SIMPLE):
+    m = np.array(_correction_matrix(mode, intensity, method), dtype=np.float32)
+    m.setflags(write=False)
+    return m
+
+
+class LruCache:
+    # Bounded, thread-safe LRU: get(key, build) returns the cached value or
+    # stores build(). build() runs outside the lock (it may be slow).
+    # Used for baked LUTs (dalton_lut) and corrected tiles (dalton_pyramid).
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = build()
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+
+def is_identity(mode, intensity, method=METHOD_SIMPLE):
+    return _correction_matrix(int(mode), clamp_intensity(intensity), method) == IDENTITY
+
+
+def check_frame(frame, layout):
+    # Validates a uint8 frame for layout; returns (channels, (r, g, b) indices)
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout}")
+    nch, idx = LAYOUTS[layout]
+    if frame.dtype != np.uint8:
+        raise ValueError(f"Expected uint8 pixels, got {frame.dtype}")
+    if frame.ndim not in (2, 3) or frame.shape[-1] != nch:
+        raise ValueError(f"Expected (..., {nch}) array for {layout}, got {frame.shape}")
+    if frame.ndim == 3 and (frame.shape[0] > MAX_HEIGHT or frame.shape[1] > MAX_WIDTH):
+        raise ValueError(f"Frame {frame.shape[1]}x{frame.shape[0]} exceeds {MAX_WIDTH}x{MAX_HEIGHT}")
+    return nch, idx
+
+
+def _apply_rows(src, dst, m, idx, scratch):
+    # Same arithmetic as PIL's Matrix.c: float32 products/sums, +0.5, clip, truncate
+    ri, gi, bi = idx
+    n = src.shape[0]
+    r = scratch[0][:n]
+    g = scratch[1][:n]
+    b = scratch[2][:n]
+    acc = scratch[3][:n]
+    tmp = scratch[4][:n]
+    np.copyto(r, src[:, ri], casting="unsafe")
+    np.copyto(g, src[:, gi], casting="unsafe")
+    np.copyto(b, src[:, bi], casting="unsafe")
+    for row, ci in zip(m, idx):
+        np.multiply(r, row[0], out=acc)
+        acc += np.multiply(g, row[1], out=tmp)
+        acc += np.multiply(b, row[2], out=tmp)
+        acc += np.float32(0.5)
+        np.clip(acc, 0, 255, out=acc)
+        np.copyto(dst[:, ci], acc, casting="unsafe")
+
+
+def parse_mode(text):
+    # Command line mode: 0-3 or off/protan/deutan/tritan (argparse type=)
+    text = str(text).lower()
+    if text in MODES:
+        return MODES[text]
+    try:
+        mode = int(text)
+    except ValueError:
+        mode = None
+    if mode not in MODES.values():
+        import argparse
+        raise argparse.ArgumentTypeError(f"mode must be 0-3 or one of {', '.join(MODES)}")
+    return mode
+
+
+def scratch_buffer(pixels):
+    # float32 work area for apply_array on frames of up to `pixels` pixels,
+    # for callers that correct many frames and want no allocation per frame
+    return np.empty((5, min(BAND_PIXELS, pixels)), dtype=np.float32)
+
+
+def apply_array(frame, mode, intensity, layout="RGB", out=None, method=METHOD_SIMPLE, scratch=None):
+    # Correct a uint8 frame (H, W, C) or pixel list (N, C) in one vectorized pass.
+    # Extra channel (X/A) is passed through untouched. out may alias frame.
+    # scratch: optional scratch_buffer() reused across calls.
+    frame = np.asarray(frame)
+    nch, idx = check_frame(frame, layout)
+    if out is None:
+        out = np.empty_like(frame)
+    elif out.shape != frame.shape or out.dtype != np.uint8:
+        raise ValueError("out must have the same shape as frame")
+    if not out.flags.c_contiguous:
+        raise ValueError("out must be C-contiguous")
+
+    if is_identity(mode, intensity, method):
+        if out is not frame:
+            np.copyto(out, frame)
+        return out
+    if nch == 4 and out is not frame:
+        out[..., 3] = frame[..., 3]
+
+    m = _matrix_f32(int(mode), clamp_intensity(intensity), method)
+    src = np.ascontiguousarray(frame).reshape(-1, nch)
+    dst = out.reshape(-1, nch)
+    step = BAND_PIXELS
+    if scratch is None or scratch.shape[1] < min(step, src.shape[0]):
+        scratch = scratch_buffer(src.shape[0])
+    for start in range(0, src.shape[0], step):
+        _apply_rows(src[start:start + step], dst[start:start + step], m, idx, scratch)
+    return out
+
+
+def apply_image(image, mode, intensity, method=METHOD_SIMPLE):
+    # PIL helper. For PIL images PIL's own C matrix path is the fastest way
+    # to get the same bits as apply_array (see dalton_bench.py pil_convert).
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if is_identity(mode, intensity, method):
+        return image.copy()
+    return image.convert("RGB", matrix=pil_matrix(mode, intensity, method))
+
+
+def apply_colors(colors, mode, intensity, method=METHOD_SIMPLE):
+    # List of (r, g, b) tuples -> corrected list of (r, g, b) tuples
+    arr = np.array(colors, dtype=np.uint8).reshape(-1, 3)
+    return [tuple(int(v) for v in px) for px in apply_array(arr, mode, intensity, method=method)]
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# DaltonFix - Lecture du framebuffer sans copie
+# Le framebuffer est mmap'é une fois et exposé comme une vue NumPy qui
+# respecte le stride (padding de ligne) de sysfs. Seuls les pixels
+# nécessaires à l'affichage mis à l'échelle sont lus à chaque image.
+import mmap
+import os
+import time
+import numpy as np
+
+SYSFS_GRAPHICS = "/sys/class/graphics"
+GEOMETRY_CHECK_S = 1.0 # sysfs is re-read at most once per second
+
+# bits_per_pixel -> format. XRGB8888/ARGB8888 are the driver's formats
+# (stored B, G, R, X/A in memory on little endian), RGB565 for legacy fbdev.
+FORMATS = {
+    32: "XRGB8888",
+    16: "RGB565",
+}
+
+BGR_TO_RGB = np.array([2, 1, 0])
+
+# Used when sysfs has no entry for the device (same fallback as the old viewer)
+DEFAULT_GEOMETRY = (800, 600, 800 * 4, 32)
+
+
+def fb_geometry(fb_path, sysfs_root=SYSFS_GRAPHICS):
+    # (width, height, stride, bits_per_pixel) from /sys/class/graphics/fbN
+    name = os.path.basename(fb_path)
+
+    def read(attr):
+        with open(os.path.join(sysfs_root, name, attr)) as f:
+            return f.read().strip()
+
+    w, h = (int(v) for v in read("virtual_size").split(","))
+    bpp = int(read("bits_per_pixel"))
+    try:
+        stride = int(read("stride"))
+    except (OSError, ValueError):
+        stride = w * bpp // 8
+    return w, h, stride, bpp
+
+
+def _sample_index(src, dst):
+    return ((np.arange(dst) + 0.5) * (src / dst)).astype(np.intp)
+
+
+def rgb565_to_rgb(pixels):
+    # (H, W) uint16 -> (H, W, 3) uint8, channels expanded to the full 0..255 range
+    out = np.empty(pixels.shape + (3,), dtype=np.uint8)
+    p = pixels.astype(np.uint32)
+    out[..., 0] = (((p >> 11) & 0x1F) * 527 + 23) >> 6
+    out[..., 1] = (((p >> 5) & 0x3F) * 259 + 33) >> 6
+    out[..., 2] = ((p & 0x1F) * 527 + 23) >> 6
+    return out
+
+
+class FramebufferReader:
+    # mmap'd framebuffer with a strided NumPy view, geometry cached from sysfs.
+    # Works on /dev/fbN or on a regular file + fake sysfs directory.
+    def __init__(self, fb_path, sysfs_root=SYSFS_GRAPHICS, geometry=None):
+        self.fb_path = fb_path
+        self.sysfs_root = sysfs_root
+        self.fixed_geometry = geometry
+        self.f = open(fb_path, "rb", buffering=0)
+        self.mm = None
+        self.geometry = None
+        self.view = None
+        self.words = None
+        self.raw = None
+        self.last_check = 0.0
+        self._indices = {}
+        self.check_geometry(force=True)
+
+    def read_geometry(self):
+        if self.fixed_geometry is not None:
+            return self.fixed_geometry
+        try:
+            return fb_geometry(self.fb_path, self.sysfs_root)
+        except (OSError, ValueError):
+            return DEFAULT_GEOMETRY
+
+    def check_geometry(self, force=False):
+        # Re-read sysfs at most every GEOMETRY_CHECK_S; remap only on change.
+        # Returns True if the geometry changed.
+        now = time.monotonic()
+        if not force and now - self.last_check < GEOMETRY_CHECK_S:
+            return False
+        self.last_check = now
+        geometry = self.read_geometry()
+        if geometry == self.geometry:
+            return False
+        self._map(geometry)
+        return True
+
+    def _map(self, geometry):
+        w, h, stride, bpp = geometry
+        if bpp not in FORMATS:
+            raise ValueError(f"{self.fb_path}: unsupported {bpp} bpp")
+        size = stride * h
+        self.close_map()
+        self.mm = mmap.mmap(self.f.fileno(), size, mmap.MAP_SHARED, mmap.PROT_READ)
+        raw = np.frombuffer(self.mm, dtype=np.uint8, count=size)
+        self.raw = raw
+        if bpp == 32:
+            self.view = np.lib.stride_tricks.as_strided(raw, (h, w, 4), (stride, 4, 1))
+        else:
+            raw16 = raw.view(np.uint16)
+            self.view = np.lib.stride_tricks.as_strided(raw16, (h, w), (stride, 2))
+        self.view.flags.writeable = False
+        # Same rows seen as machine words (padding excluded), for change detection
+        row_bytes = w * bpp // 8
+        for word, dtype in ((8, np.uint64), (4, np.uint32), (2, np.uint16)):
+            if row_bytes % word == 0 and stride % word == 0:
+                break
+        self.words = np.lib.stride_tricks.as_strided(
+            raw.view(dtype), (h, row_bytes // word), (stride, word))
+        self.words.flags.writeable = False
+        self.geometry = geometry
+        self._indices = {}
+
+    @property
+    def format(self):
+        return FORMATS[self.geometry[3]]
+
+    @property
+    def size(self):
+        return self.geometry[0], self.geometry[1]
+
+    def frame(self):
+        # Zero-copy view: (H, W, 4) BGRX bytes, or (H, W) uint16 for RGB565
+        return self.view
+
+    def _sample(self, size):
+        idx = self._indices.get(size)
+        if idx is None:
+            w, h, stride, bpp = self.geometry
+            ys = _sample_index(h, size[1])[:, None]
+            xs = _sample_index(w, size[0])
+            # Byte offset in the mapping of every R, G, B output byte
+            offsets = (ys * stride + xs * 4)[..., None] + BGR_TO_RGB if bpp == 32 else None
+            idx = (ys, xs, offsets)
+            self._indices = {size: idx}
+        return idx
+
+    def scaled_rgb(self, size, out=None):
+        # (size[1], size[0], 3) RGB: only the sampled pixels are read.
+        # out: preallocated (h, w, 3) uint8 buffer to gather into
+        ys, xs, offsets = self._sample(tuple(size))
+        if self.geometry[3] == 32:
+            # One gather straight into contiguous RGB (B, G, R, X -> R, G, B)
+            return np.take(self.raw, offsets, out=out)
+        rgb = rgb565_to_rgb(self.view[ys, xs])
+        if out is None:
+            return rgb
+        np.copyto(out, rgb)
+        return out
+
+    def rgb(self, bbox=None):
+        # Full resolution RGB copy of the whole buffer or bbox = (l, t, r, b)
+        view = self.view
+        if bbox is not None:
+            left, top, right, bottom = bbox
+            view = view[max(0, top):bottom, max(0, left):right]
+        if self.geometry[3] == 32:
+            return np.ascontiguousarray(view[..., 2::-1])
+        return rgb565_to_rgb(view)
+
+    def close_map(self):
+        self.view = None
+        self.words = None
+        self.raw = None
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # A caller still holds a view on the old mapping, let GC close it
+                pass
+            self.mm = None
+
+    def close(self):
+        self.close_map()
+        self.f.close()
+
+
+class ChangeDetector:
+    # Cheap "did the framebuffer change?" test. Each poll checksums one row
+    # out of row_step (rotating the phase, so every row is covered after
+    # row_step polls) and compares with the checksum stored for that row.
+    # full=True checksums every row: used once polls are slow (see
+    # AdaptivePoll.full_scan), where row_step polls would take seconds.
+    def __init__(self, row_step=8):
+        self.row_step = max(1, row_step)
+        self.phase = 0
+        self.sums = None
+        self.weights = None
+        self.geometry = None
+
+    def reset(self):
+        self.sums = None
+
+    def _checksum(self, rows):
+        # Weighted word sum (wrapping): catches moved content, unlike a plain sum
+        return (rows * self.weights).sum(axis=1, dtype=np.uint64)
+
+    def changed(self, reader, full=False):
+        words = reader.words
+        if self.sums is None or reader.geometry != self.geometry:
+            self.geometry = reader.geometry
+            rng = np.random.default_rng(0x0DA1)
+            self.weights = rng.integers(1, 2**63, words.shape[1], dtype=np.uint64) | np.uint64(1)
+            self.sums = self._checksum(words)
+            self.phase = 0
+            return True
+        if full:
+            rows = slice(None)
+        else:
+            rows = slice(self.phase, None, self.row_step)
+            self.phase = (self.phase + 1) % self.row_step
+        sums = self._checksum(words[rows])
+        if np.array_equal(sums, self.sums[rows]):
+            return False
+        self.sums[rows] = sums
+        return True
+
+
+class AdaptivePoll:
+    # Poll delay: min_ms while content changes, backing off to max_ms when idle
+    def __init__(self, min_ms=50, max_ms=1000, backoff=1.5):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.backoff = backoff
+        self.delay = min_ms
+
+    def next_delay(self, changed):
+        if changed:
+            self.delay = self.min_ms
+        else:
+            self.delay = min(self.max_ms, self.delay * self.backoff)
+        return int(self.delay)
+
+    def full_scan(self, row_step):
+        # True when sampling one row in row_step per poll would need more
+        # than max_ms to see every row: check them all at once instead
+        return self.delay * row_step >= self.max_ms
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# DaltonFix - Emulateur du chemin pixel du driver (virgule fixe 16.16)
+# Reproduit bit à bit recalc_matrix / lerp_matrix / apply_correction_line
+# de dalton_drv.c avec NumPy, pour valider la sortie du driver et mesurer
+# son écart avec le chemin flottant (DaltonCam.apply_dalton) sans charger
+# le module.
+import sys
+import time
+import numpy as np
+import dalton_engine
+
+# --- Fixed Point Math (dalton_drv.c) ---
+FX_SHIFT = 16
+FX_ONE = 1 << FX_SHIFT
+
+
+def FX_FROM_INT(x):
+    return x << FX_SHIFT
+
+
+def FX_TO_INT(x):
+    return x >> FX_SHIFT # arithmetic shift, like s32 >> on gcc
+
+
+def _s32(x):
+    x &= 0xFFFFFFFF
+    return x - (1 << 32) if x & 0x80000000 else x
+
+
+def _cdiv(a, b):
+    # C integer division truncates toward zero
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+
+def fx_mul(a, b):
+    return _s32((a * b) >> FX_SHIFT)
+
+
+def clamp_u8(val):
+    if val < 0: return 0
+    if val > 255: return 255
+    return val
+
+
+MAT_IDENTITY = ((FX_ONE, 0, 0), (0, FX_ONE, 0), (0, 0, FX_ONE))
+
+MAT_PROTAN_SIM = ((37160, 28384, 0), (36569, 28966, 0), (0, 15859, 49676))
+MAT_DEUTAN_SIM = ((41156, 24379, 0), (45875, 19660, 0), (0, 19660, 45875))
+MAT_TRITAN_SIM = ((62259, 3276, 0), (0, 28384, 37160), (0, 31129, 34406))
+
+SIM_MATRICES = {
+    dalton_engine.MODE_PROTAN: MAT_PROTAN_SIM,
+    dalton_engine.MODE_DEUTAN: MAT_DEUTAN_SIM,
+    dalton_engine.MODE_TRITAN: MAT_TRITAN_SIM,
+}
+
+
+def lerp_matrix(a, b, percent):
+    t = _cdiv(FX_FROM_INT(percent), 100)
+    we = FX_ONE - t
+    wn = t
+    return tuple(tuple(_s32(fx_mul(a[i][j], we) + fx_mul(b[i][j], wn)) for j in range(3))
+                 for i in range(3))
+
+
+def recalc_matrix(mode, intensity, sims=None):
+    # current_correction_matrix for the given sysfs mode/intensity
+    sim = (sims or SIM_MATRICES).get(mode)
+    if sim is None:
+        return MAT_IDENTITY
+    correction = tuple(tuple((FX_ONE if i == j else 0) * 2 - sim[i][j] for j in range(3))
+                       for i in range(3))
+    return lerp_matrix(MAT_IDENTITY, correction, intensity)
+
+
+def reference_pixel(p, mat):
+    # Literal scalar port of one iteration of apply_correction_line (u32 XRGB)
+    r = (p >> 16) & 0xFF
+    g = (p >> 8) & 0xFF
+    b = p & 0xFF
+    a = (p >> 24) & 0xFF
+    fr = FX_FROM_INT(r); fg = FX_FROM_INT(g); fb = FX_FROM_INT(b)
+    nr = _s32(fx_mul(mat[0][0], fr) + fx_mul(mat[0][1], fg) + fx_mul(mat[0][2], fb))
+    ng = _s32(fx_mul(mat[1][0], fr) + fx_mul(mat[1][1], fg) + fx_mul(mat[1][2], fb))
+    nb = _s32(fx_mul(mat[2][0], fr) + fx_mul(mat[2][1], fg) + fx_mul(mat[2][2], fb))
+    return (a << 24) | (clamp_u8(FX_TO_INT(nr)) << 16) | (clamp_u8(FX_TO_INT(ng)) << 8) | clamp_u8(FX_TO_INT(nb))
+
+
+# --- Vectorized pixel path ---
+
+BAND_PIXELS = 1 << 15
+
+
+def _apply_rows(src, dst, mat, idx, scratch):
+    # fx_mul(m, FX_FROM_INT(v)) == m * v exactly (the << 16 is undone by the
+    # >> 16 and m * v fits in s32), so each output channel is
+    # clamp_u8((m0*r + m1*g + m2*b) >> 16) in plain int32 arithmetic.
+    n = src.shape[0]
+    r, g, b, acc, tmp = (s[:n] for s in scratch)
+    np.copyto(r, src[:, idx[0]], casting="unsafe")
+    np.copyto(g, src[:, idx[1]], casting="unsafe")
+    np.copyto(b, src[:, idx[2]], casting="unsafe")
+    for row, ci in zip(mat, idx):
+        np.multiply(r, row[0], out=acc)
+        acc += np.multiply(g, row[1], out=tmp)
+        acc += np.multiply(b, row[2], out=tmp)
+        acc >>= FX_SHIFT
+        np.clip(acc, 0, 255, out=acc)
+        np.copyto(dst[:, ci], acc, casting="unsafe")
+
+
+def apply_frame(frame, mode, intensity, layout="BGRX", out=None, matrix=None):
+    # Driver output for a uint8 frame (default: XRGB8888 bytes, B G R X in memory).
+    # Alpha/X is passed through. Mode 0 is a no-op, as in dalton_pipe_update.
+    frame = np.asarray(frame)
+    nch, idx = dalton_engine.check_frame(frame, layout)
+    if out is None:
+        out = np.empty_like(frame)
+    if out is not frame:
+        np.copyto(out, frame)
+    if matrix is None:
+        if mode == dalton_engine.MODE_OFF:
+            return out
+        matrix = recalc_matrix(mode, intensity)
+    src = np.ascontiguousarray(frame).reshape(-1, nch)
+    dst = out.reshape(-1, nch)
+    scratch = np.empty((5, min(BAND_PIXELS, src.shape[0])), dtype=np.int32)
+    for start in range(0, src.shape[0], BAND_PIXELS):
+        _apply_rows(src[start:start + BAND_PIXELS], dst[start:start + BAND_PIXELS],
+                    matrix, idx, scratch)
+    return out
+
+
+# --- Conformance suite ---
+
+def sample_colors(step=17, random_count=1 << 16, seed=0):
+    # Regular RGB grid (includes 0 and 255 on every axis) + random colours
+    axis = np.arange(0, 256, step, dtype=np.uint8)
+    if axis[-1] != 255:
+        axis = np.append(axis, np.uint8(255))
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), -1).reshape(-1, 3)
+    rnd = np.random.default_rng(seed).integers(0, 256, (random_count, 3), dtype=np.uint8)
+    return np.concatenate([grid, rnd])
+
+
+def check_reference(count=2000, seed=0):
+    # Vectorized path against the literal scalar port: must be bit-exact
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 1 << 32, count, dtype=np.uint64).astype(np.uint32)
+    frame = pixels.view(np.uint8).reshape(-1, 4)
+    mismatches = 0
+    for mode in SIM_MATRICES:
+        for intensity in (0, 1, 33, 50, 99, 100):
+            mat = recalc_matrix(mode, intensity)
+            got = apply_frame(frame, mode, intensity).view(np.uint32).reshape(-1)
+            ref = np.array([reference_pixel(int(p), mat) for p in pixels], dtype=np.uint32)
+            mismatches += int((got != ref).sum())
+    return mismatches
+
+
+def conformance(colors=None):
+    # Fixed-point driver path vs float path (DaltonCam.apply_dalton) for
+    # every mode and all 101 intensity steps. Returns one row per setting.
+    if colors is None:
+        colors = sample_colors()
+    bgrx = np.zeros((colors.shape[0], 4), dtype=np.uint8)
+    bgrx[:, :3] = colors[:, ::-1]
+    bgrx[:, 3] = 0xA5 # alpha must come back untouched
+    rows = []
+    for mode in range(4):
+        for intensity in range(101):
+            drv = apply_frame(bgrx, mode, intensity)
+            if not (drv[:, 3] == 0xA5).all():
+                raise AssertionError(f"alpha modified (mode={mode}, intensity={intensity})")
+            ref = colors if mode == 0 else dalton_engine.apply_array(colors, mode, intensity)
+            err = np.abs(drv[:, 2::-1].astype(np.int16) - ref)
+            rows.append({
+                "mode": mode,
+                "intensity": intensity,
+                "max_err": int(err.max()),
+                "mean_err": float(err.mean()),
+                "mismatch": float((err.max(axis=1) > 0).mean()),
+            })
+    return rows
+
+
+def main(argv):
+    budget = int(argv[1]) if len(argv) > 1 else None
+    bad = check_reference()
+    print(f"vectorized vs scalar port: {bad} mismatches")
+
+    rows = conformance()
+    for mode in range(4):
+        mine = [r for r in rows if r["mode"] == mode]
+        worst = max(mine, key=lambda r: r["max_err"])
+        print(f"{dalton_engine.MODE_NAMES[mode]:>13}: max err {worst['max_err']} "
+              f"(intensity {worst['intensity']}), mean err "
+              f"{sum(r['mean_err'] for r in mine) / len(mine):.3f}, "
+              f"pixels differing {max(r['mismatch'] for r in mine) * 100:.1f}% max")
+
+    frame = np.random.default_rng(0).integers(0, 256, (2160, 3840, 4), dtype=np.uint8)
+    out = np.empty_like(frame)
+    apply_frame(frame, 1, 70, out=out)
+    t0 = time.perf_counter()
+    for _ in range(5):
+        apply_frame(frame, 1, 70, out=out)
+    print(f"3840x2160 frame: {(time.perf_counter() - t0) / 5 * 1000:.1f} ms")
+
+    worst = max(r["max_err"] for r in rows)
+    if bad or (budget is not None and worst > budget):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Usage: dalton_fixed.py [max_error_budget]
+    sys.exit(main(sys.argv))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# DaltonFix - Daltonisation LMS : LUT et export pour le driver
+# La chaîne RGB -> LMS -> simulation -> erreur -> RGB est pliée dans
+# dalton_engine (méthode "lms", une matrice 3x3 par mode/intensité).
+# Ce module ajoute la variante en RGB linéaire (gamma sRGB, non linéaire,
+# donc cuite en LUT par dalton_lut) et exporte les coefficients en
+# virgule fixe 16.16 pour dalton_drv.c.
+#
+#   python3 dalton_lms.py export > dalton_lms.h
+#   python3 dalton_lms.py check
+import sys
+import numpy as np
+import dalton_engine
+import dalton_fixed
+
+
+def srgb_to_linear(v):
+    # v in 0..1
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(v):
+    v = np.clip(v, 0.0, 1.0)
+    return np.where(v <= 0.0031308, v * 12.92, 1.055 * v ** (1 / 2.4) - 0.055)
+
+
+def lms_transform(rgb, mode, intensity):
+    # Folded LMS matrix on encoded values (same as dalton_engine method "lms")
+    m = np.array(dalton_engine.correction_matrix(mode, intensity, dalton_engine.METHOD_LMS))
+    return rgb @ m.T
+
+
+def lms_linear_transform(rgb, mode, intensity):
+    # Same matrix applied in linear light: decode sRGB, correct, clamp, encode.
+    # Non-linear, so only usable through a LUT.
+    m = np.array(dalton_engine.correction_matrix(mode, intensity, dalton_engine.METHOD_LMS))
+    lin = srgb_to_linear(rgb / 255.0)
+    return linear_to_srgb(lin @ m.T) * 255.0
+
+
+def fixed_matrix(mode):
+    # Full-intensity LMS correction in 16.16, to use as correction_target in
+    # recalc_matrix: lerp_matrix(MAT_IDENTITY, it, intensity) then gives the
+    # folded matrix for every intensity, like the 2I - S target today.
+    full = dalton_engine.full_correction(mode, dalton_engine.METHOD_LMS)
+    return tuple(tuple(int(round(v * dalton_fixed.FX_ONE)) for v in row) for row in full)
+
+
+def export_header():
+    names = {dalton_engine.MODE_PROTAN: "PROTAN", dalton_engine.MODE_DEUTAN: "DEUTAN",
+             dalton_engine.MODE_TRITAN: "TRITAN"}
+    lines = [
+        "/* Generated by dalton_lms.py export: LMS daltonization correction",
+        " * targets (100% intensity), 16.16 fixed point. In recalc_matrix, use",
+        " * them instead of 2I - sim: lerp_matrix(&MAT_IDENTITY, &MAT_x_LMS, intensity). */",
+        "#ifndef DALTON_LMS_H",
+        "#define DALTON_LMS_H",
+        "",
+    ]
+    for mode, name in names.items():
+        full = dalton_engine.full_correction(mode, dalton_engine.METHOD_LMS)
+        lines.append(f"static const fx_matrix_t MAT_{name}_LMS = {{{{")
+        for i, (row, frow) in enumerate(zip(fixed_matrix(mode), full)):
+            text = f"{{{row[0]}, {row[1]}, {row[2]}}}" + ("," if i < 2 else "")
+            lines.append(f"    {text:<28} // {frow[0]:.4f}, {frow[1]:.4f}, {frow[2]:.4f}")
+        lines.append("}};")
+        lines.append("")
+    lines.append("#endif")
+    return "\n".join(lines) + "\n"
+
+
+def check(colors=None):
+    # Driver arithmetic with the exported matrices vs the float LMS path,
+    # every mode and intensity. Returns the worst channel error.
+    if colors is None:
+        colors = dalton_fixed.sample_colors(random_count=1 << 14)
+    bgrx = np.zeros((colors.shape[0], 4), dtype=np.uint8)
+    bgrx[:, :3] = colors[:, ::-1]
+    worst = 0
+    for mode in (1, 2, 3):
+        target = fixed_matrix(mode)
+        for intensity in range(101):
+            mat = dalton_fixed.lerp_matrix(dalton_fixed.MAT_IDENTITY, target, intensity)
+            drv = dalton_fixed.apply_frame(bgrx, mode, intensity, matrix=mat)
+            ref = dalton_engine.apply_array(colors, mode, intensity, method=dalton_engine.METHOD_LMS)
+            worst = max(worst, int(np.abs(drv[:, 2::-1].astype(np.int16) - ref).max()))
+    return worst
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "export"
+    if cmd == "export":
+        sys.stdout.write(export_header())
+    elif cmd == "check":
+        worst = check()
+        print(f"fixed-point LMS vs float LMS: max error {worst}")
+        sys.exit(0 if worst <= 2 else 1)
+    else:
+        print("Usage: dalton_lms.py [export|check]")
+        sys.exit(2)
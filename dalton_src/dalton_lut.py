@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# DaltonFix - Tables de correspondance 3D (LUT)
+# Chaque réglage (mode, intensité) est "cuit" une fois dans une LUT 3D
+# (clamp inclus), puis appliqué par interpolation trilinéaire ou tétraédrique.
+# Les tables sont gardées dans un cache LRU borné: bouger le curseur
+# d'intensité dans les deux sens réutilise les tables déjà calculées.
+import functools
+import time
+import numpy as np
+import dalton_engine
+import dalton_lms
+
+LUT_SIZE = 33        # Nodes per axis (33^3 = 35937 entries)
+CACHE_SIZE = 32      # Tables kept in memory (~430 KB each at 33^3 float32)
+BAND_PIXELS = 1 << 16
+
+
+def matrix_transform(rgb, mode, intensity):
+    # Linear 3x3 correction, rgb is (N, 3) float64 in 0..255
+    m = np.array(dalton_engine.correction_matrix(mode, intensity))
+    return rgb @ m.T
+
+# Transforms that can be baked: name -> fn(rgb, mode, intensity).
+# Non-linear pipelines (LMS, gamma) only need to be registered here.
+TRANSFORMS = {
+    "matrix": matrix_transform,
+    "lms": dalton_lms.lms_transform,
+    "lms_linear": dalton_lms.lms_linear_transform,
+}
+# Engine method whose matrix each transform is built on: when that matrix
+# is the identity (mode 0, intensity 0) the transform is too
+TRANSFORM_METHODS = {
+    "matrix": dalton_engine.METHOD_SIMPLE,
+    "lms": dalton_engine.METHOD_LMS,
+    "lms_linear": dalton_engine.METHOD_LMS,
+}
+
+
+def bake(transform, mode, intensity, size=LUT_SIZE):
+    # Evaluate transform on a size^3 grid, clamp, return (size, size, size, 3) float32
+    fn = TRANSFORMS[transform]
+    axis = np.linspace(0.0, 255.0, size)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing="ij")
+    grid = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+    out = np.clip(fn(grid, mode, intensity), 0.0, 255.0)
+    lut = out.reshape(size, size, size, 3).astype(np.float32)
+    lut.setflags(write=False)
+    return lut
+
+
+class LutCache(dalton_engine.LruCache):
+    # Baked tables keyed by (transform, mode, intensity, size)
+    def __init__(self, maxsize=CACHE_SIZE):
+        super().__init__(maxsize)
+
+    def get(self, mode, intensity, size=LUT_SIZE, transform="matrix"):
+        key = (transform, int(mode), dalton_engine.clamp_intensity(intensity), size)
+        return super().get(key, lambda: bake(transform, key[1], key[2], size))
+
+
+_cache = LutCache()
+
+
+def get_lut(mode, intensity, size=LUT_SIZE, transform="matrix"):
+    return _cache.get(mode, intensity, size, transform)
+
+
+@functools.lru_cache(maxsize=None)
+def _axis_tables(size):
+    # uint8 value -> (lower node index, fraction): 256-entry tables, so the
+    # per-pixel work is a cheap gather instead of multiply/floor/cast
+    x = np.arange(256, dtype=np.float64) * (size - 1) / 255.0
+    base = np.minimum(np.floor(x), size - 2).astype(np.intp)
+    frac = (x - base).astype(np.float32)
+    return base, frac
+
+
+def _planar(lut):
+    # (size, size, size, 3) -> three contiguous flat channel planes
+    return [np.ascontiguousarray(lut[..., k]).reshape(-1) for k in range(3)]
+
+
+def _prepare(src, idx, size, scratch):
+    # Flat index of the lower cube corner and fractional position per pixel
+    base_tbl, frac_tbl = _axis_tables(size)
+    n = src.shape[0]
+    flat = scratch["flat"][:n]
+    tmp = scratch["tmp"][:n]
+    frac = scratch["frac"][:, :n]
+    flat[:] = 0
+    for axis, ci in enumerate(idx):
+        chan = src[:, ci]
+        np.take(frac_tbl, chan, out=frac[axis])
+        np.take(base_tbl, chan, out=tmp)
+        flat *= size
+        flat += tmp
+    return flat, frac
+
+
+def _gather(planes, index, weight, acc, tmp, first):
+    for k in range(3):
+        np.take(planes[k], index, out=tmp)
+        tmp *= weight
+        if first:
+            acc[k][:] = tmp
+        else:
+            acc[k] += tmp
+
+
+def _trilinear(planes, flat, frac, size, acc, scratch):
+    fr, fg, fb = frac
+    n = flat.shape[0]
+    index = scratch["index"][:n]
+    weight = scratch["weight"][:n]
+    tmp = scratch["ftmp"][:n]
+    first = True
+    for dr in (0, 1):
+        wr = fr if dr else 1 - fr
+        for dg in (0, 1):
+            wg = fg if dg else 1 - fg
+            for db in (0, 1):
+                wb = fb if db else 1 - fb
+                np.multiply(wr, wg, out=weight)
+                weight *= wb
+                np.add(flat, dr * size * size + dg * size + db, out=index)
+                _gather(planes, index, weight, acc, tmp, first)
+                first = False
+    return acc
+
+
+def _tetrahedral(planes, flat, frac, size, acc, scratch):
+    fr, fg, fb = frac
+    sr, sg, sb = size * size, size, 1
+    n = flat.shape[0]
+    index = scratch["index"][:n]
+    weight = scratch["weight"][:n]
+    tmp = scratch["ftmp"][:n]
+    fmax = np.maximum(np.maximum(fr, fg), fb)
+    fmin = np.minimum(np.minimum(fr, fg), fb)
+    fmid = fr + fg + fb - fmax - fmin
+    # Walk the cube diagonal: largest fraction axis first, then the middle one
+    r_first = (fr >= fg) & (fr >= fb)
+    g_first = ~r_first & (fg >= fb)
+    s1 = np.where(r_first, sr, np.where(g_first, sg, sb))
+    s2 = np.where(r_first, np.where(fg >= fb, sg, sb),
+                  np.where(g_first, np.where(fr >= fb, sr, sb),
+                           np.where(fr >= fg, sr, sg)))
+
+    np.subtract(1, fmax, out=weight)
+    _gather(planes, flat, weight, acc, tmp, True)
+    np.add(flat, s1, out=index)
+    np.subtract(fmax, fmid, out=weight)
+    _gather(planes, index, weight, acc, tmp, False)
+    index += s2
+    np.subtract(fmid, fmin, out=weight)
+    _gather(planes, index, weight, acc, tmp, False)
+    np.add(flat, sr + sg + sb, out=index)
+    _gather(planes, index, fmin, acc, tmp, False)
+    return acc
+
+
+INTERPOLATIONS = {
+    "trilinear": _trilinear,
+    "tetrahedral": _tetrahedral,
+}
+
+
+def apply_lut(frame, lut, layout="RGB", out=None, interpolation="tetrahedral"):
+    # Same contract as dalton_engine.apply_array, but through a baked LUT
+    frame = np.asarray(frame)
+    nch, idx = dalton_engine.check_frame(frame, layout)
+    interp = INTERPOLATIONS[interpolation]
+    if out is None:
+        out = np.empty_like(frame)
+    elif out.shape != frame.shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+        raise ValueError("out must be a C-contiguous uint8 array shaped like frame")
+    if nch == 4 and out is not frame:
+        out[..., 3] = frame[..., 3]
+
+    size = lut.shape[0]
+    planes = _planar(lut)
+    src = np.ascontiguousarray(frame).reshape(-1, nch)
+    dst = out.reshape(-1, nch)
+    n = min(BAND_PIXELS, src.shape[0])
+    scratch = {
+        "flat": np.empty(n, dtype=np.intp),
+        "tmp": np.empty(n, dtype=np.intp),
+        "index": np.empty(n, dtype=np.intp),
+        "frac": np.empty((3, n), dtype=np.float32),
+        "weight": np.empty(n, dtype=np.float32),
+        "ftmp": np.empty(n, dtype=np.float32),
+    }
+    acc = np.empty((3, n), dtype=np.float32)
+    for start in range(0, src.shape[0], BAND_PIXELS):
+        band = src[start:start + BAND_PIXELS]
+        m = band.shape[0]
+        flat, frac = _prepare(band, idx, size, scratch)
+        res = interp(planes, flat, frac, size, acc[:, :m], scratch)
+        res += np.float32(0.5)
+        np.clip(res, 0, 255, out=res)
+        d = dst[start:start + BAND_PIXELS]
+        for k, ci in enumerate(idx):
+            np.copyto(d[:, ci], res[k], casting="unsafe")
+    return out
+
+
+def apply_setting(frame, mode, intensity, layout="RGB", out=None,
+                  interpolation="tetrahedral", transform="matrix"):
+    method = TRANSFORM_METHODS.get(transform)
+    if method is not None and dalton_engine.is_identity(mode, intensity, method):
+        # Nothing to correct: plain copy (or nothing in place), no table lookup
+        return dalton_engine.apply_array(frame, mode, intensity, layout, out, method)
+    lut = get_lut(mode, intensity, transform=transform)
+    return apply_lut(frame, lut, layout, out, interpolation)
+
+
+# --- Benchmark: LUT vs matrix path ---
+
+def _time(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return min(samples) * 1000.0
+
+
+def bench(resolutions=((1920, 1080), (3840, 2160)), mode=dalton_engine.MODE_PROTAN,
+          intensity=70, repeat=5):
+    rng = np.random.default_rng(0)
+    rows = []
+    t0 = time.perf_counter()
+    lut = bake("matrix", mode, intensity)
+    bake_ms = (time.perf_counter() - t0) * 1000.0
+    cache = LutCache()
+    cache.get(mode, intensity)
+    hit_ms = _time(lambda: cache.get(mode, intensity), 100)
+    print(f"bake {LUT_SIZE}^3: {bake_ms:.2f} ms, cache hit: {hit_ms * 1000:.1f} us")
+
+    for w, h in resolutions:
+        frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        out = np.empty_like(frame)
+        ref = dalton_engine.apply_array(frame, mode, intensity)
+        results = {
+            "matrix": _time(lambda: dalton_engine.apply_array(frame, mode, intensity, out=out), repeat),
+        }
+        for name in INTERPOLATIONS:
+            results[name] = _time(lambda: apply_lut(frame, lut, out=out, interpolation=name), repeat)
+            err = np.abs(out.astype(np.int16) - ref).max()
+            results[name + "_maxerr"] = int(err)
+        rows.append(((w, h), results))
+        line = ", ".join(f"{k}={v:.1f} ms" if isinstance(v, float) else f"{k}={v}"
+                         for k, v in results.items())
+        print(f"{w}x{h}: {line}")
+    return rows
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# DaltonFix - Mesure de confusion des couleurs et réglage automatique
+# Note une correction sur une palette (grille RGB, mire du Dashboard ou
+# couleurs extraites d'images) : les paires bien distinctes en vision
+# normale mais confondues par le dichromate sont relevées une fois, puis
+# chaque intensité est notée en simulant la vision dichromate APRÈS
+# correction et en mesurant le ΔE (CIELAB, ΔE76 ou CIEDE2000) qui reste
+# entre les deux couleurs. Une pénalité tient compte de la distorsion
+# vue par un trichromate. Tout est vectorisé NumPy, par blocs de paires.
+#
+#   python3 dalton_metric.py score --mode deutan --intensity 80 captures/
+#   python3 dalton_metric.py tune captures/dashboards --method lms
+#   python3 dalton_metric.py check          (CIEDE2000 contre Sharma et al.)
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import dalton_engine
+import dalton_lms
+
+DISTINCT_DE = 10.0 # normal vision: the two colours are clearly different
+CONFUSED_DE = 5.0 # dichromat: below this the pair is confused
+PAIR_CHUNK = 1 << 20 # pairs evaluated per NumPy step
+MAX_PAIRS = 1 << 22 # confusable pairs kept (random subset above this)
+DISTORTION_WEIGHT = 0.01 # score lost per ΔE of mean distortion for normal vision
+PALETTE_COLORS = 2048 # colours kept from images (most frequent)
+PALETTE_BITS = 5 # per channel quantization of image colours
+THUMB_PIXELS = 1 << 20 # images are downscaled to this before counting colours
+
+# The dashboard's original 25-colour test pattern
+TEST_PATTERN = (
+    "#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#00FFFF",
+    "#FF00FF", "#FFFFFF", "#FFCCAA", "#228822", "#55AAFF",
+    "#AA0000", "#00AA00", "#0000AA", "#AAAA00", "#00AAAA",
+    "#AA00AA", "#888888", "#AA8866", "#114411", "#225588",
+    "#550000", "#005500", "#000055", "#555500", "#005555",
+)
+
+# sRGB (D65) -> XYZ, and the D65 white point
+RGB_TO_XYZ = np.array(((0.4124564, 0.3575761, 0.1804375),
+                       (0.2126729, 0.7151522, 0.0721750),
+                       (0.0193339, 0.1191920, 0.9503041)))
+WHITE_D65 = np.array((0.95047, 1.0, 1.08883))
+
+
+def srgb_to_lab(rgb):
+    # (..., 3) values in 0..255 -> CIELAB
+    xyz = dalton_lms.srgb_to_linear(np.asarray(rgb, dtype=np.float64) / 255.0) @ RGB_TO_XYZ.T
+    t = xyz / WHITE_D65
+    d = 6.0 / 29.0
+    f = np.where(t > d ** 3, np.cbrt(t), t / (3 * d * d) + 4.0 / 29.0)
+    return np.stack([116.0 * f[..., 1] - 16.0,
+                     500.0 * (f[..., 0] - f[..., 1]),
+                     200.0 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def delta_e76(lab1, lab2):
+    return np.sqrt(((lab1 - lab2) ** 2).sum(axis=-1))
+
+
+def delta_e2000(lab1, lab2):
+    # CIEDE2000 (Sharma, Wu, Dalal 2005), broadcasting over leading axes
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    cm7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(cm7 / (cm7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    chroma0 = c1p * c2p == 0
+    dh = h2p - h1p
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(chroma0, 0.0, dh)
+    d_l = L2 - L1
+    d_c = c2p - c1p
+    d_h = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dh / 2))
+    lm = (L1 + L2) / 2
+    cm = (c1p + c2p) / 2
+    hs = h1p + h2p
+    hm = np.where(np.abs(h1p - h2p) > 180, np.where(hs < 360, hs + 360, hs - 360), hs) / 2
+    hm = np.where(chroma0, hs, hm)
+    t = (1 - 0.17 * np.cos(np.radians(hm - 30)) + 0.24 * np.cos(np.radians(2 * hm))
+         + 0.32 * np.cos(np.radians(3 * hm + 6)) - 0.20 * np.cos(np.radians(4 * hm - 63)))
+    cm7 = cm ** 7
+    rc = 2 * np.sqrt(cm7 / (cm7 + 25.0 ** 7))
+    rt = -np.sin(np.radians(60 * np.exp(-((hm - 275) / 25) ** 2))) * rc
+    lm50 = (lm - 50) ** 2
+    sl = 1 + 0.015 * lm50 / np.sqrt(20 + lm50)
+    sc = 1 + 0.045 * cm
+    sh = 1 + 0.015 * cm * t
+    dl, dc, dhh = d_l / sl, d_c / sc, d_h / sh
+    return np.sqrt(np.maximum(dl * dl + dc * dc + dhh * dhh + rt * dc * dhh, 0.0))
+
+
+DELTA_E = {"76": delta_e76, "2000": delta_e2000}
+
+# CIEDE2000 test data from Sharma, Wu & Dalal (2005), "The CIEDE2000
+# color-difference formula: implementation notes, supplementary test data
+# and mathematical observations": (L1, a1, b1, L2, a2, b2, ΔE00)
+SHARMA_PAIRS = (
+    (50.0000, 2.6772, -79.7751, 50.0000, 0.0000, -82.7485, 2.0425),
+    (50.0000, 3.1571, -77.2803, 50.0000, 0.0000, -82.7485, 2.8615),
+    (50.0000, 2.8361, -74.0200, 50.0000, 0.0000, -82.7485, 3.4412),
+    (50.0000, -1.3802, -84.2814, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -1.1848, -84.8006, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, -0.9009, -85.5211, 50.0000, 0.0000, -82.7485, 1.0000),
+    (50.0000, 0.0000, 0.0000, 50.0000, -1.0000, 2.0000, 2.3669),
+    (50.0000, -1.0000, 2.0000, 50.0000, 0.0000, 0.0000, 2.3669),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0009, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0010, 7.1792),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0011, 7.2195),
+    (50.0000, 2.4900, -0.0010, 50.0000, -2.4900, 0.0012, 7.2195),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0009, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0010, -2.4900, 4.8045),
+    (50.0000, -0.0010, 2.4900, 50.0000, 0.0011, -2.4900, 4.7461),
+    (50.0000, 2.5000, 0.0000, 50.0000, 0.0000, -2.5000, 4.3065),
+    (50.0000, 2.5000, 0.0000, 73.0000, 25.0000, -18.0000, 27.1492),
+    (50.0000, 2.5000, 0.0000, 61.0000, -5.0000, 29.0000, 22.8977),
+    (50.0000, 2.5000, 0.0000, 56.0000, -27.0000, -3.0000, 31.9030),
+    (50.0000, 2.5000, 0.0000, 58.0000, 24.0000, 15.0000, 19.4535),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.1736, 0.5854, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2972, 0.0000, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 1.8634, 0.5757, 1.0000),
+    (50.0000, 2.5000, 0.0000, 50.0000, 3.2592, 0.3350, 1.0000),
+    (60.2574, -34.0099, 36.2677, 60.4626, -34.1751, 39.4387, 1.2644),
+    (63.0109, -31.0961, -5.8663, 62.8187, -29.7946, -4.0864, 1.2630),
+    (61.2901, 3.7196, -5.3901, 61.4292, 2.2480, -4.9620, 1.8731),
+    (35.0831, -44.1164, 3.7933, 35.0232, -40.0716, 1.5901, 1.8645),
+    (22.7233, 20.0904, -46.6940, 23.0331, 14.9730, -42.5619, 2.0373),
+    (36.4612, 47.8580, 18.3852, 36.2715, 50.5065, 21.2231, 1.4146),
+    (90.8027, -2.0831, 1.4410, 91.1528, -1.6435, 0.0447, 1.4441),
+    (90.9257, -0.5406, -0.9208, 88.6381, -0.8985, -0.7239, 1.5381),
+    (6.7747, -0.2908, -2.4247, 5.8714, -0.0985, -2.2286, 0.6377),
+    (2.0776, 0.0795, -1.1350, 0.9033, -0.0636, -0.5514, 0.9082),
+)
+
+
+def check(pairs=SHARMA_PAIRS, tolerance=1e-4):
+    # delta_e2000 against the published pairs, both orders. The table is
+    # rounded to 4 decimals, so errors up to 5e-5 are expected.
+    # Returns (worst absolute error, within tolerance).
+    data = np.array(pairs)
+    lab1, lab2, want = data[:, 0:3], data[:, 3:6], data[:, 6]
+    worst = max(np.abs(delta_e2000(lab1, lab2) - want).max(),
+                np.abs(delta_e2000(lab2, lab1) - want).max())
+    return float(worst), bool(worst <= tolerance)
+
+
+def simulation_matrix(mode, model="lms"):
+    # How the dichromat sees: "lms" (LMS projection) or "rgb" (driver's SIM matrices)
+    if model == "lms":
+        return np.array(dalton_engine.lms_simulation(mode))
+    if model == "rgb":
+        return np.array(dalton_engine.SIM_MATRICES.get(mode, dalton_engine.IDENTITY))
+    raise ValueError(f"Unknown simulation model: {model}")
+
+
+def simulate(colors, mode, model="lms"):
+    # (N, 3) 0..255 -> simulated (N, 3) float, clamped like a display would
+    return np.clip(np.asarray(colors, dtype=np.float64) @ simulation_matrix(mode, model).T, 0.0, 255.0)
+
+
+# --- Palettes: (colors (N, 3) uint8, weights (N,) summing to 1) ---
+
+def palette_grid(levels=16):
+    # Regular RGB grid: levels^3 colours, uniform weights
+    axis = np.linspace(0, 255, levels).round().astype(np.uint8)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing="ij")
+    colors = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+    return colors, np.full(len(colors), 1.0 / len(colors))
+
+
+def palette_pattern(pattern=TEST_PATTERN):
+    colors = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in pattern], dtype=np.uint8)
+    return colors, np.full(len(colors), 1.0 / len(colors))
+
+
+def palette_images(paths, max_colors=PALETTE_COLORS, bits=PALETTE_BITS):
+    # Most frequent colours of a set of images (quantized to bits per channel,
+    # each bin represented by its mean colour), weighted by pixel count
+    from PIL import Image
+    bins = 1 << (3 * bits)
+    counts = np.zeros(bins)
+    sums = np.zeros((bins, 3))
+    shift = 8 - bits
+    for path in paths:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            if img.width * img.height > THUMB_PIXELS:
+                scale = (THUMB_PIXELS / (img.width * img.height)) ** 0.5
+                img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                                 Image.Resampling.NEAREST)
+            px = np.asarray(img).reshape(-1, 3)
+        q = px >> shift
+        code = (q[:, 0].astype(np.int64) << (2 * bits)) | (q[:, 1].astype(np.int64) << bits) | q[:, 2]
+        counts += np.bincount(code, minlength=bins)
+        for c in range(3):
+            sums[:, c] += np.bincount(code, weights=px[:, c], minlength=bins)
+    used = np.flatnonzero(counts)
+    if not len(used):
+        raise ValueError("no pixels in the given images")
+    keep = used[np.argsort(counts[used])[::-1][:max_colors]]
+    colors = np.round(sums[keep] / counts[keep, None]).astype(np.uint8)
+    weights = counts[keep] / counts[keep].sum()
+    return colors, weights
+
+
+def _pair_values(fn, a, b, ii, jj, chunk=PAIR_CHUNK):
+    # fn(a[ii], b[jj]) in chunks so the gathered pairs stay small
+    out = np.empty(len(ii))
+    for s in range(0, len(ii), chunk):
+        out[s:s + chunk] = fn(a[ii[s:s + chunk]], b[jj[s:s + chunk]])
+    return out
+
+
+class Evaluator:
+    # Scores (mode, intensity) corrections of one palette. The confusable
+    # pairs only depend on the mode, so they are found once in __init__
+    # and every score() only evaluates those pairs.
+    def __init__(self, palette, mode, method=dalton_engine.METHOD_SIMPLE, model="lms", metric="76",
+                 distinct=DISTINCT_DE, confused=CONFUSED_DE, max_pairs=MAX_PAIRS, seed=0):
+        self.colors, self.weights = palette
+        self.mode = mode
+        self.method = method
+        self.model = model
+        self.de = DELTA_E[metric]
+        self.lab = srgb_to_lab(self.colors)
+        sim_lab = srgb_to_lab(simulate(self.colors, mode, model))
+        self.pairs_total = len(self.colors) * (len(self.colors) - 1) // 2
+        ii, jj, de_orig = self._confusable(sim_lab, distinct, confused)
+        if len(ii) > max_pairs:
+            pick = np.sort(np.random.default_rng(seed).choice(len(ii), max_pairs, replace=False))
+            ii, jj, de_orig = ii[pick], jj[pick], de_orig[pick]
+        self.ii, self.jj, self.de_orig = ii, jj, de_orig
+        self.pair_weights = self.weights[ii] * self.weights[jj]
+        total = self.pair_weights.sum()
+        if total > 0:
+            self.pair_weights /= total
+
+    def _confusable(self, sim_lab, distinct, confused):
+        # Every pair i < j, one block of rows against all columns at a time
+        n = len(self.lab)
+        rows = max(1, PAIR_CHUNK // max(n, 1))
+        cols = np.arange(n)
+        found_i, found_j, found_de = [], [], []
+        for a in range(0, n, rows):
+            b = min(n, a + rows)
+            # Confused by the dichromat first (few pairs), then distinct in normal vision
+            mask = self.de(sim_lab[a:b, None], sim_lab[None]) < confused
+            mask &= cols[None] > np.arange(a, b)[:, None]
+            i, j = np.nonzero(mask)
+            i += a
+            de = _pair_values(self.de, self.lab, self.lab, i, j)
+            keep = de >= distinct
+            found_i.append(i[keep].astype(np.int32))
+            found_j.append(j[keep].astype(np.int32))
+            found_de.append(de[keep])
+        return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_de)
+
+    @property
+    def pairs(self):
+        return len(self.ii)
+
+    def score(self, intensity):
+        # preserved: weighted mean of min(1, ΔE seen after correction / ΔE normal vision)
+        # recovered: weighted share of pairs no longer confused (ΔE >= CONFUSED_DE)
+        # distortion: mean ΔE between original and corrected colours (normal vision)
+        corrected = dalton_engine.apply_array(self.colors, self.mode, intensity, method=self.method)
+        seen = srgb_to_lab(simulate(corrected, self.mode, self.model))
+        distortion = float(self.weights @ self.de(self.lab, srgb_to_lab(corrected)))
+        if self.pairs:
+            de_seen = _pair_values(self.de, seen, seen, self.ii, self.jj)
+            preserved = float(self.pair_weights @ np.minimum(de_seen / self.de_orig, 1.0))
+            recovered = float(self.pair_weights @ (de_seen >= CONFUSED_DE))
+        else:
+            preserved = recovered = 1.0
+        return {
+            "intensity": dalton_engine.clamp_intensity(intensity),
+            "preserved": preserved,
+            "recovered": recovered,
+            "distortion": distortion,
+            "objective": preserved - DISTORTION_WEIGHT * distortion,
+        }
+
+
+def tune(evaluator, coarse=10):
+    # Best objective over 0..100: every `coarse` step, then 1 by 1 around the best
+    scores = {}
+
+    def at(i):
+        if i not in scores:
+            scores[i] = evaluator.score(i)
+        return scores[i]
+    best = max(range(0, 101, coarse), key=lambda i: at(i)["objective"])
+    best = max(range(max(0, best - coarse + 1), min(100, best + coarse - 1) + 1),
+               key=lambda i: (at(i)["objective"], -i))
+    return at(best), len(scores)
+
+
+def image_paths(sources):
+    # Image files given directly or found under the directories, sorted per
+    # directory. Unlike dalton_batch.walk no output names are built, so two
+    # directories may share a basename.
+    from dalton_batch import EXTENSIONS
+    paths = []
+    for src in sources:
+        if os.path.isfile(src):
+            paths.append(src)
+            continue
+        for dirpath, dirnames, filenames in os.walk(src):
+            dirnames.sort()
+            paths += [os.path.join(dirpath, name) for name in sorted(filenames)
+                      if name.lower().endswith(EXTENSIONS)]
+    return paths
+
+
+def load_palette(sources, grid=None, pattern=False):
+    if pattern:
+        return palette_pattern()
+    if sources:
+        paths = image_paths(sources)
+        if not paths:
+            raise SystemExit("no images found")
+        return palette_images(paths)
+    return palette_grid(grid or 16)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score colour confusion after correction, tune intensity")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("score", "tune"):
+        p = sub.add_parser(name)
+        p.add_argument("sources", nargs="*", help="images or directories (default: RGB grid)")
+        p.add_argument("--grid", type=int, default=None, help="RGB grid levels per channel (default 16)")
+        p.add_argument("--pattern", action="store_true", help="the Dashboard's 25 swatches")
+        p.add_argument("--method", choices=dalton_engine.METHODS, default=dalton_engine.METHOD_SIMPLE)
+        p.add_argument("--model", choices=("lms", "rgb"), default="lms", help="dichromat simulation")
+        p.add_argument("--metric", choices=sorted(DELTA_E), default="76", help="ΔE76 or CIEDE2000")
+    p_score = sub.choices["score"]
+    p_score.add_argument("--mode", type=dalton_engine.parse_mode, default=2)
+    p_score.add_argument("--intensity", type=int, default=100)
+    sub.choices["tune"].add_argument("--modes", type=dalton_engine.parse_mode, nargs="+", default=[1, 2, 3])
+    sub.add_parser("check", help="CIEDE2000 against the Sharma et al. reference pairs")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "check":
+        worst, ok = check()
+        print(f"CIEDE2000: {len(SHARMA_PAIRS)} paires de référence, écart max {worst:.2e}")
+        return 0 if ok else 1
+
+    palette = load_palette(args.sources, args.grid, args.pattern)
+    modes = [args.mode] if args.cmd == "score" else args.modes
+    names = {v: k for k, v in dalton_engine.MODES.items()}
+    results = {}
+    for mode in modes:
+        t0 = time.perf_counter()
+        ev = Evaluator(palette, mode, args.method, args.model, args.metric)
+        setup = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        if args.cmd == "score":
+            res, evals = ev.score(args.intensity), 1
+        else:
+            res, evals = tune(ev)
+        spent = time.perf_counter() - t0
+        res.update(pairs=ev.pairs, pairs_total=ev.pairs_total)
+        results[names[mode]] = res
+        print(f"mode {mode}: {len(palette[0])} couleurs, {ev.pairs_total} paires "
+              f"({setup:.2f} s, {ev.pairs_total / max(setup, 1e-9) / 1e6:.1f} M paires/s), "
+              f"{ev.pairs} confondues, {evals} intensités en {spent:.2f} s", file=sys.stderr)
+    print(json.dumps(results, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
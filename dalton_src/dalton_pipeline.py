@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# DaltonFix - Pipeline capture -> correction -> affichage
+# Trois étages reliés par des boîtes à une seule place: si l'étage suivant
+# est en retard, l'image en attente est remplacée par la plus récente
+# (image périmée jetée) au lieu d'être mise en file. La latence reste
+# bornée et le thread Tk ne fait plus que l'affichage.
+import threading
+import time
+import dalton_trace
+
+
+class LatestSlot:
+    # Single-slot mailbox: put() never blocks and overwrites a pending item
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.item = None
+        self.full = False
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        # Returns True when a pending item was overwritten (dropped)
+        with self.cond:
+            dropped = self.full
+            if dropped:
+                self.dropped += 1
+            self.item = item
+            self.full = True
+            self.cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        # Blocks until an item is available; returns None on timeout/close
+        with self.cond:
+            if not self.full and not self.closed:
+                self.cond.wait(timeout)
+            return self._take()
+
+    def take(self):
+        # Non-blocking, for the Tk thread
+        with self.cond:
+            return self._take()
+
+    def _take(self):
+        if not self.full:
+            return None
+        item, self.item, self.full = self.item, None, False
+        return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class StageCounter:
+    # Throughput of one stage: frames done, time spent working, frames dropped
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.dropped = 0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.frames += 1
+            self.busy += seconds
+
+    def drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.perf_counter() - self.start, 1e-9)
+            return {
+                "frames": self.frames,
+                "fps": self.frames / elapsed,
+                "busy_ms": self.busy / self.frames * 1000.0 if self.frames else 0.0,
+                "dropped": self.dropped,
+            }
+
+    def reset(self):
+        with self.lock:
+            self.frames = 0
+            self.busy = 0.0
+            self.dropped = 0
+            self.start = time.perf_counter()
+
+
+class Pipeline:
+    # capture_fn() -> item or None (None = capture failed, pipeline stops)
+    # correct_fn(item) -> result or None (None = nothing new to display)
+    # The Tk thread calls poll() from an after() callback.
+    # tracer (dalton_trace) also gets every stage duration and the errors.
+    def __init__(self, capture_fn, correct_fn, interval=0.0, tracer=dalton_trace.DISABLED):
+        self.capture_fn = capture_fn
+        self.correct_fn = correct_fn
+        self.interval = interval
+        self.tracer = tracer
+        self.captured = LatestSlot()
+        self.corrected = LatestSlot()
+        self.counters = {name: StageCounter(name) for name in ("capture", "correction", "display")}
+        self.running = threading.Event()
+        self.paused = threading.Event()
+        self.error = None
+        self.threads = []
+
+    def start(self):
+        if self.running.is_set():
+            return
+        self.running.set()
+        self.error = None
+        self.captured = LatestSlot()
+        self.corrected = LatestSlot()
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="dalton-capture", daemon=True),
+            threading.Thread(target=self._correct_loop, name="dalton-correct", daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.running.clear()
+        self.captured.close()
+        self.corrected.close()
+        for t in self.threads:
+            t.join(timeout=1.0)
+        self.threads = []
+
+    def pause(self, paused=True):
+        if paused:
+            self.paused.set()
+        else:
+            self.paused.clear()
+
+    def _capture_loop(self):
+        counter = self.counters["capture"]
+        while self.running.is_set():
+            if self.paused.is_set():
+                time.sleep(0.1)
+                continue
+            t0 = time.perf_counter()
+            try:
+                item = self.capture_fn()
+            except Exception as e:
+                item = None
+                self.error = e
+                self.tracer.error("capture", e)
+            if item is None:
+                if self.error is None:
+                    self.error = "capture"
+                self.running.clear()
+                self.captured.close()
+                return
+            dt = time.perf_counter() - t0
+            counter.add(dt)
+            self.tracer.add("capture", dt)
+            if self.captured.put(item):
+                counter.drop()
+            if self.interval:
+                time.sleep(self.interval)
+
+    def _correct_loop(self):
+        counter = self.counters["correction"]
+        while self.running.is_set():
+            item = self.captured.get(timeout=0.5)
+            if item is None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                result = self.correct_fn(item)
+            except Exception as e:
+                self.error = e
+                self.tracer.error("correction", e)
+                continue
+            dt = time.perf_counter() - t0
+            counter.add(dt)
+            self.tracer.add("correction", dt)
+            if result is not None:
+                if self.corrected.put(result):
+                    counter.drop()
+
+    def poll(self, display_fn):
+        # Tk thread: display the latest corrected result, if any
+        result = self.corrected.take()
+        if result is None:
+            return False
+        t0 = time.perf_counter()
+        display_fn(result)
+        dt = time.perf_counter() - t0
+        self.counters["display"].add(dt)
+        self.tracer.add("display", dt)
+        return True
+
+    def stats(self):
+        # Since the last counter reset: a frame is dropped by a stage when its
+        # result is overwritten before the next stage took it
+        return {name: c.snapshot() for name, c in self.counters.items()}
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# DaltonFix - Aperçu dense du Dashboard
+# Une mire (nuancier de milliers de pastilles, dégradés teinte/luminosité
+# ou image de référence) rendue en un seul tableau, trois panneaux côte à
+# côte : original, simulé (vision du daltonien) et corrigé. La source est
+# calculée une fois et partagée ; un changement de curseur = une passe
+# vectorisée (apply_array) écrite sur place dans l'image composite, puis
+# un seul paste() de la PhotoImage. La simulation ne dépend que du mode
+# et n'est recalculée que quand il change.
+#
+#   python3 dalton_preview.py          (coût d'une mise à jour par mire)
+#   python3 dalton_preview.py 512      (panneaux de 512 px)
+import sys
+import time
+import numpy as np
+import dalton_engine
+import dalton_metric
+
+PANEL = 256 # panel side in pixels
+GAP = 4 # columns between panels
+SWATCH_LEVELS = 16 # 16^3 = 4096 swatches
+PANELS = ("Original", "Simulé", "Corrigé")
+UPDATE_BUDGET_MS = 20 # per slider step at PANEL size
+
+
+def swatch_chart(size=(PANEL, PANEL), levels=SWATCH_LEVELS):
+    # levels^3 swatches: one (red down, green across) tile per blue level,
+    # tiles arranged in a square. Each pixel picks its swatch by index.
+    w, h = size
+    side = int(np.ceil(np.sqrt(levels)))
+    rows = cols = side * levels
+    axis = np.linspace(0, 255, levels).round().astype(np.uint8)
+    r, g = np.meshgrid(axis, axis, indexing="ij")
+    grid = np.zeros((rows, cols, 3), dtype=np.uint8)
+    for b in range(levels):
+        ty, tx = divmod(b, side)
+        tile = grid[ty * levels:(ty + 1) * levels, tx * levels:(tx + 1) * levels]
+        tile[..., 0] = r
+        tile[..., 1] = g
+        tile[..., 2] = axis[b]
+    ys = np.arange(h) * rows // h
+    xs = np.arange(w) * cols // w
+    return grid[ys[:, None], xs[None, :]]
+
+
+def gradient_chart(size=(PANEL, PANEL), grey_rows=None):
+    # Hue across, lightness down (white to black through the pure hue),
+    # with a grey ramp along the bottom
+    w, h = size
+    grey_rows = max(1, h // 8) if grey_rows is None else grey_rows
+    hue = np.linspace(0.0, 6.0, w, endpoint=False)
+    # Pure hue (full saturation) per column
+    pure = np.clip(np.stack([np.abs(hue - 3.0) - 1.0,
+                             2.0 - np.abs(hue - 2.0),
+                             2.0 - np.abs(hue - 4.0)], axis=-1), 0.0, 1.0)
+    light = np.linspace(1.0, 0.0, h - grey_rows)[:, None, None]
+    top = np.where(light > 0.5, pure + (1.0 - pure) * (light - 0.5) * 2.0, pure * light * 2.0)
+    grey = np.broadcast_to(np.linspace(0.0, 1.0, w)[None, :, None], (grey_rows, w, 3))
+    return (np.concatenate([top, grey]) * 255.0).round().astype(np.uint8)
+
+
+def image_chart(path, size=(PANEL, PANEL)):
+    # Reference image fitted into the panel (letterboxed on black)
+    from PIL import Image, ImageOps
+    with Image.open(path) as img:
+        return np.asarray(ImageOps.pad(img.convert("RGB"), size, color=(0, 0, 0)))
+
+
+CHARTS = {"swatches": swatch_chart, "gradients": gradient_chart}
+
+
+class Preview:
+    # Composite (h, 3 * w + 2 * GAP, 3) uint8 image holding the three panels.
+    # The source (uint8 and float32 copies) is cached per chart; the
+    # simulated panel is cached per mode, the corrected panel is rewritten
+    # on every update from a contiguous scratch buffer.
+    def __init__(self, size=(PANEL, PANEL), method=dalton_engine.METHOD_SIMPLE, model="lms"):
+        self.size = size
+        self.method = method
+        self.model = model
+        w, h = size
+        self.image = np.zeros((h, 3 * w + 2 * GAP, 3), dtype=np.uint8)
+        self.panels = [self.image[:, i * (w + GAP):i * (w + GAP) + w] for i in range(3)]
+        self.corrected = np.empty((h, w, 3), dtype=np.uint8)
+        self.simulated = np.empty((h * w, 3), dtype=np.float32)
+        self.source = None
+        self.source_f = None
+        self.sim_mode = None
+        self.state = None
+        self.last_ms = 0.0
+
+    def set_source(self, source):
+        # New chart: (h, w, 3) uint8 matching size
+        source = np.ascontiguousarray(source, dtype=np.uint8)
+        if source.shape != self.corrected.shape:
+            raise ValueError(f"chart must be {self.size[0]}x{self.size[1]} RGB")
+        self.source = source
+        self.source_f = source.reshape(-1, 3).astype(np.float32)
+        self.panels[0][...] = source
+        self.sim_mode = None
+        self.state = None
+
+    def set_chart(self, name, path=None):
+        self.set_source(image_chart(path, self.size) if name == "image" else CHARTS[name](self.size))
+
+    def update(self, mode, intensity):
+        # Returns True when the composite changed
+        if self.source is None or self.state == (mode, intensity):
+            return False
+        t0 = time.perf_counter()
+        if mode != self.sim_mode:
+            m = dalton_metric.simulation_matrix(mode, self.model).astype(np.float32)
+            np.matmul(self.source_f, m.T, out=self.simulated)
+            np.clip(self.simulated, 0.0, 255.0, out=self.simulated)
+            self.simulated += np.float32(0.5)
+            np.copyto(self.panels[1], self.simulated.reshape(self.corrected.shape), casting="unsafe")
+            self.sim_mode = mode
+        dalton_engine.apply_array(self.source, mode, intensity, out=self.corrected, method=self.method)
+        self.panels[2][...] = self.corrected
+        self.state = (mode, intensity)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        return True
+
+
+def bench(size=PANEL, steps=50):
+    # ms per slider step (intensity changes, mode fixed) and per mode change
+    results = {}
+    for name in CHARTS:
+        preview = Preview((size, size))
+        preview.set_chart(name)
+        preview.update(2, 0)
+        t0 = time.perf_counter()
+        for i in range(steps):
+            preview.update(2, 1 + i * 99 // steps)
+        slider = (time.perf_counter() - t0) / steps * 1000.0
+        t0 = time.perf_counter()
+        for i in range(steps):
+            preview.update(1 + i % 3, 50)
+        results[name] = (slider, (time.perf_counter() - t0) / steps * 1000.0)
+    return results
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else PANEL
+    results = bench(size)
+    for name, (slider, mode) in results.items():
+        print(f"{name:>10} {size}x{size} x3: {slider:5.2f} ms par pas du curseur, {mode:5.2f} ms par changement de mode")
+    sys.exit(0 if size != PANEL or max(r[0] for r in results.values()) < UPDATE_BUDGET_MS else 1)
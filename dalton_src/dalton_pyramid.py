@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# DaltonFix - Pyramide de tuiles pour les très grandes images
+# Le niveau 0 est mappé (np.memmap) au lieu d'être chargé : directement
+# dans le fichier pour les formats non compressés (PPM, BMP, TIFF brut),
+# sinon décodé par PIL directement dans un fichier temporaire (mémoire
+# bornée, converti en RGB par bandes si besoin).
+# Les niveaux réduits (1/2, 1/4, ...) sont calculés tuile par tuile à la
+# demande, et seules les tuiles visibles sont corrigées, avec un cache
+# LRU (niveau, tuile, mode, intensité) : mémoire bornée, et le curseur ne
+# recorrige que ce qui est à l'écran.
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+import dalton_engine
+
+TILE_SIZE = 256
+CACHE_TILES = 256 # 256 corrected 256x256 RGB tiles = 48 MB
+MAX_ZOOM = 8 # display pixels per image pixel at most
+MAX_PIXELS = 1 << 32 # explicit size limit instead of PIL's global bomb check
+_open_lock = threading.Lock()
+# PIL modes decoded straight into a file mapping: bytes per pixel in PIL's memory
+SPILL_MODES = {"L": 1, "P": 1, "I;16": 2, "LA": 4, "PA": 4, "RGB": 4, "RGBA": 4,
+               "RGBX": 4, "CMYK": 4, "YCbCr": 4, "I": 4, "F": 4}
+SPILL_STRIP_BYTES = 16 << 20 # source rows converted to RGB per step
+
+# PIL raw modes that can be viewed straight from the file: (bytes per pixel, R, G, B)
+RAW_MODES = {
+    "RGB": (3, (0, 1, 2)),
+    "BGR": (3, (2, 1, 0)),
+    "RGBX": (4, (0, 1, 2)),
+    "RGBA": (4, (0, 1, 2)),
+    "BGRX": (4, (2, 1, 0)),
+    "BGRA": (4, (2, 1, 0)),
+}
+
+
+def _file_array(path, shape):
+    # uint8 array over a new shared file mapping, and the mapping (madvise)
+    size = int(np.prod(shape))
+    with open(path, "w+b") as f:
+        f.truncate(size)
+        mm = mmap.mmap(f.fileno(), size)
+    return np.frombuffer(mm, dtype=np.uint8).reshape(shape), mm
+
+
+def open_image(path, max_pixels=MAX_PIXELS):
+    # Image.open() for scans bigger than PIL's MAX_IMAGE_PIXELS. The global
+    # limit is lifted for this one call only (the header is all that open()
+    # reads), then the size is checked against max_pixels.
+    with _open_lock:
+        saved = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            img = Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = saved
+    if img.width * img.height > max_pixels:
+        img.close()
+        raise ValueError(f"{img.width}x{img.height} exceeds {max_pixels} pixels")
+    return img
+
+
+def _raw_view(path, img):
+    # (H, W, 3) RGB view of the file if PIL describes it as uncompressed
+    # full-width strips laid out back to back; None otherwise.
+    w, h = img.size
+    tiles = img.tile
+    if not tiles or any(t[0] != "raw" for t in tiles):
+        return None
+    args = [t[3] if isinstance(t[3], tuple) else (t[3], 0, 1) for t in tiles]
+    rawmode, stride, orientation = (tuple(args[0]) + (0, 1))[:3]
+    if rawmode not in RAW_MODES or any(a[0] != rawmode for a in args):
+        return None
+    bpp, idx = RAW_MODES[rawmode]
+    stride = stride or w * bpp
+    offset = tiles[0][2]
+    for t in tiles:
+        x0, y0, x1, y1 = t[1]
+        if (x0, x1) != (0, w) or t[2] != offset + y0 * stride:
+            return None
+    if tiles[-1][1][3] != h:
+        return None
+    raw = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(h, stride))
+    view = np.lib.stride_tricks.as_strided(raw, (h, w, bpp), (stride, bpp, 1))
+    if orientation < 0:
+        view = view[::-1] # bottom-up (BMP)
+    # Channel order through a (possibly negative) stride, never a copy
+    return view[..., 2::-1] if idx == (2, 1, 0) else view[..., :3]
+
+
+def _box_half(src):
+    # 2x2 box filter, odd last row/column repeated
+    h, w = src.shape[:2]
+    if h % 2 or w % 2:
+        src = np.pad(src, ((0, h % 2), (0, w % 2), (0, 0)), mode="edge")
+    s = src.reshape(src.shape[0] // 2, 2, src.shape[1] // 2, 2, 3).astype(np.uint16)
+    return ((s.sum(axis=(1, 3)) + 2) >> 2).astype(np.uint8)
+
+
+class Pyramid:
+    # Level k is the image reduced 2^k times; levels stop when the image fits one tile.
+    def __init__(self, path, tile=TILE_SIZE, cache_tiles=CACHE_TILES, work_dir=None):
+        self.path = path
+        self.tile = tile
+        self.dir = tempfile.mkdtemp(prefix="dalton_pyramid_", dir=work_dir)
+        with open_image(path) as img:
+            self.size = img.size
+            base = _raw_view(path, img) if img.mode in ("RGB", "RGBA") else None
+            self.mapped = base is not None
+            if base is None:
+                base = self._spill(img)
+        self.levels = [base]
+        self.filled = [None]
+        w, h = self.size
+        while max(w, h) > tile:
+            w, h = (w + 1) // 2, (h + 1) // 2
+            self.levels.append(None)
+            self.filled.append(None)
+        self.shapes = [((self.size[1] + (1 << k) - 1) >> k, (self.size[0] + (1 << k) - 1) >> k)
+                       for k in range(len(self.levels))]
+        self.cache = dalton_engine.LruCache(cache_tiles) # corrected tiles
+
+    def _spill(self, img):
+        # Compressed formats (PNG, JPEG, tiled TIFF...): PIL decodes straight
+        # into a file mapping instead of its own heap buffer, and the pages
+        # already written are dropped from the process as decoding goes, so
+        # memory stays bounded whatever the image size. RGB/RGBA are then
+        # viewed in place; other modes are converted to RGB strip by strip.
+        w, h = self.size
+        bpp = SPILL_MODES.get(img.mode)
+        if bpp is None:
+            # Rare modes (1, I;16B, BGR;15...): whole decode, then strips
+            out, _ = _file_array(os.path.join(self.dir, "level0"), (h, w, 3))
+            rgb = img.convert("RGB")
+            rows = max(1, SPILL_STRIP_BYTES // (w * 3))
+            for y in range(0, h, rows):
+                out[y:y + rows] = np.asarray(rgb.crop((0, y, w, min(h, y + rows))))
+            return out
+        canvas, canvas_map = _file_array(os.path.join(self.dir, "decoded"), (h, w * bpp))
+        img.im = Image.core.map_buffer(canvas_map, (w, h), "raw", 0, (img.mode, w * bpp, 1))
+        plugin_read = getattr(type(img), "load_read", None)
+
+        def load_read(size):
+            # Called by ImageFile.load() between decoder steps; plugins may
+            # swap img.fp while loading (WebP), so resolve it on each call
+            canvas_map.madvise(mmap.MADV_DONTNEED)
+            return plugin_read(img, size) if plugin_read else img.fp.read(size)
+        img.load_read = load_read
+        img.load()
+        canvas_map.madvise(mmap.MADV_DONTNEED)
+        if img.mode in ("RGB", "RGBA") and bpp == 4:
+            return canvas.reshape(h, w, 4)[..., :3]
+
+        out, out_map = _file_array(os.path.join(self.dir, "level0"), (h, w, 3))
+        rows = max(1, SPILL_STRIP_BYTES // (w * 4))
+        for y in range(0, h, rows):
+            out[y:y + rows] = np.asarray(img.crop((0, y, w, min(h, y + rows))).convert("RGB"))
+            canvas_map.madvise(mmap.MADV_DONTNEED)
+            out_map.madvise(mmap.MADV_DONTNEED)
+        img.im = Image.core.new(img.mode, (0, 0)) # drop the canvas mapping
+        os.remove(os.path.join(self.dir, "decoded"))
+        return out
+
+    @property
+    def depth(self):
+        return len(self.levels)
+
+    def tile_grid(self, level):
+        h, w = self.shapes[level]
+        t = self.tile
+        return (h + t - 1) // t, (w + t - 1) // t
+
+    def _level(self, level):
+        if self.levels[level] is None:
+            h, w = self.shapes[level]
+            self.levels[level] = np.memmap(os.path.join(self.dir, f"level{level}"),
+                                           dtype=np.uint8, mode="w+", shape=(h, w, 3))
+            self.filled[level] = np.zeros(self.tile_grid(level), dtype=bool)
+        return self.levels[level]
+
+    def source_tile(self, level, ty, tx):
+        # Uncorrected tile (view into the level), built from level - 1 on first use
+        t = self.tile
+        arr = self._level(level)
+        y0, x0 = ty * t, tx * t
+        y1, x1 = min(y0 + t, arr.shape[0]), min(x0 + t, arr.shape[1])
+        if level and not self.filled[level][ty, tx]:
+            below = self.shapes[level - 1]
+            py0, px0 = 2 * y0, 2 * x0
+            py1, px1 = min(2 * y1, below[0]), min(2 * x1, below[1])
+            # The four level - 1 tiles under this one
+            for cy in range(py0 // t, (py1 - 1) // t + 1):
+                for cx in range(px0 // t, (px1 - 1) // t + 1):
+                    self.source_tile(level - 1, cy, cx)
+            arr[y0:y1, x0:x1] = _box_half(np.asarray(self.levels[level - 1][py0:py1, px0:px1]))[:y1 - y0, :x1 - x0]
+            self.filled[level][ty, tx] = True
+        return arr[y0:y1, x0:x1]
+
+    def corrected_tile(self, level, ty, tx, mode, intensity, method=dalton_engine.METHOD_SIMPLE):
+        intensity = dalton_engine.clamp_intensity(intensity)
+        key = (level, ty, tx, int(mode), intensity, method)
+
+        def build():
+            src = np.ascontiguousarray(self.source_tile(level, ty, tx))
+            return dalton_engine.apply_array(src, mode, intensity, method=method)
+        return self.cache.get(key, build)
+
+    def render(self, level, x, y, out, mode, intensity, method=dalton_engine.METHOD_SIMPLE):
+        # Fill out (h, w, 3) with the level's pixels starting at (x, y);
+        # only the intersecting tiles are read and corrected.
+        h, w = out.shape[:2]
+        lh, lw = self.shapes[level]
+        out[:] = 0
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(lw, x + w), min(lh, y + h)
+        t = self.tile
+        for ty in range(y0 // t, (y1 - 1) // t + 1 if y1 > y0 else 0):
+            for tx in range(x0 // t, (x1 - 1) // t + 1 if x1 > x0 else 0):
+                tile = self.corrected_tile(level, ty, tx, mode, intensity, method)
+                ty0, tx0 = ty * t, tx * t
+                a0, a1 = max(y0, ty0), min(y1, ty0 + tile.shape[0])
+                b0, b1 = max(x0, tx0), min(x1, tx0 + tile.shape[1])
+                out[a0 - y:a1 - y, b0 - x:b1 - x] = tile[a0 - ty0:a1 - ty0, b0 - tx0:b1 - tx0]
+        return out
+
+    def close(self):
+        self.levels = []
+        self.cache.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class PyramidView:
+    # Pan/zoom state over a Pyramid for a view of view_size pixels.
+    # scale = display pixels per image pixel, a power of two.
+    def __init__(self, pyramid, view_size):
+        self.pyramid = pyramid
+        self.view_size = view_size
+        self.out = None
+        self.fit()
+
+    def fit(self):
+        # Whole image in the view
+        w, h = self.pyramid.size
+        vw, vh = self.view_size
+        self.scale = 1.0
+        while self.scale > 1.0 / (1 << (self.pyramid.depth - 1)) and (w * self.scale > vw or h * self.scale > vh):
+            self.scale /= 2
+        self.cx, self.cy = w / 2, h / 2
+
+    def resize(self, view_size):
+        self.view_size = view_size
+
+    def zoom(self, factor, anchor=None):
+        # factor 2 or 0.5; anchor = view pixel kept under the pointer
+        new = min(MAX_ZOOM, max(1.0 / (1 << (self.pyramid.depth - 1)), self.scale * factor))
+        if anchor is not None:
+            ax = self.cx + (anchor[0] - self.view_size[0] / 2) / self.scale
+            ay = self.cy + (anchor[1] - self.view_size[1] / 2) / self.scale
+            self.cx = ax - (ax - self.cx) * self.scale / new
+            self.cy = ay - (ay - self.cy) * self.scale / new
+        self.scale = new
+
+    def pan(self, dx, dy):
+        # Drag by (dx, dy) display pixels
+        w, h = self.pyramid.size
+        self.cx = min(max(0, self.cx - dx / self.scale), w)
+        self.cy = min(max(0, self.cy - dy / self.scale), h)
+
+    def render(self, mode, intensity, method=dalton_engine.METHOD_SIMPLE):
+        # (view_h, view_w, 3) frame; reuses its buffers while the size is unchanged
+        import dalton_capture
+        vw, vh = self.view_size
+        level = 0
+        while level + 1 < self.pyramid.depth and self.scale <= 1.0 / (1 << (level + 1)):
+            level += 1
+        mag = self.scale * (1 << level) # >= 1 when zoomed past native resolution
+        rw, rh = max(1, int(np.ceil(vw / mag))), max(1, int(np.ceil(vh / mag)))
+        x = int(round(self.cx / (1 << level) - rw / 2))
+        y = int(round(self.cy / (1 << level) - rh / 2))
+        if self.out is None or self.out[0].shape[:2] != (rh, rw) or self.out[1].shape[:2] != (vh, vw):
+            self.out = (np.empty((rh, rw, 3), dtype=np.uint8), np.empty((vh, vw, 3), dtype=np.uint8))
+        region, view = self.out
+        self.pyramid.render(level, x, y, region, mode, intensity, method)
+        if (rw, rh) == (vw, vh):
+            return region
+        return dalton_capture.resize_nearest(region, (vw, vh), view)
+
+
+# Child processes for check(): write a big PNG / report peak RSS (MB) after
+# opening it and rendering one native-resolution view
+_MAKE_PNG = """
+import sys, numpy as np
+from PIL import Image
+side = int(sys.argv[2])
+y = np.arange(side, dtype=np.uint32)[:, None]
+x = np.arange(side, dtype=np.uint32)[None, :]
+a = np.empty((side, side, 3), dtype=np.uint8)
+a[..., 0], a[..., 1], a[..., 2] = x * 7 + y, x ^ y, (x * y) >> 5
+Image.fromarray(a).convert(sys.argv[3]).save(sys.argv[1], compress_level=1)
+"""
+_PEAK_RSS = """
+import resource, sys, numpy as np
+import dalton_pyramid
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pyramid = dalton_pyramid.Pyramid(sys.argv[1])
+pyramid.render(0, 1000, 1000, np.empty((768, 1024, 3), dtype=np.uint8), 2, 80)
+pyramid.close()
+print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) // 1024)
+"""
+
+
+def check(side=8000, limit_mb=None):
+    # Spilled level 0 must match a plain PIL decode, whatever the mode;
+    # opening a side x side PNG must not cost a whole decoded copy in RAM
+    here = os.path.dirname(os.path.abspath(__file__))
+    work = tempfile.mkdtemp(prefix="dalton_pyramid_check_")
+    ok = True
+    try:
+        rng = np.random.default_rng(0)
+        small = Image.fromarray(rng.integers(0, 256, (301, 517, 3), dtype=np.uint8))
+        for mode, ext in (("RGB", "png"), ("RGBA", "png"), ("L", "png"), ("P", "png"),
+                          ("LA", "png"), ("1", "png"), ("RGB", "jpg"), ("CMYK", "jpg")):
+            path = os.path.join(work, f"small_{mode}.{ext}")
+            small.convert(mode).save(path)
+            with Image.open(path) as img:
+                want = np.asarray(img.convert("RGB"))
+            pyramid = Pyramid(path, work_dir=work)
+            if not np.array_equal(np.asarray(pyramid.levels[0]), want):
+                print(f"{mode} {ext}: niveau 0 différent du décodage PIL")
+                ok = False
+            pyramid.close()
+        for mode in ("RGB", "L"):
+            path = os.path.join(work, f"big_{mode}.png")
+            subprocess.run([sys.executable, "-c", _MAKE_PNG, path, str(side), mode], check=True)
+            out = subprocess.run([sys.executable, "-c", _PEAK_RSS, path], cwd=here, check=True,
+                                 capture_output=True, text=True)
+            peak = int(out.stdout)
+            # A whole decode is side^2 x 4 bytes (RGB) or x 1 + the RGB copy (L)
+            limit = limit_mb or side * side * 4 // (2 << 20)
+            print(f"{side}x{side} {mode} PNG: +{peak} MB de pic (limite {limit} MB)")
+            ok = ok and peak <= limit
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return ok
+
+
+if __name__ == "__main__":
+    ok = check(int(sys.argv[1])) if len(sys.argv) > 1 else check()
+    print("pyramide: OK" if ok else "pyramide: ERREUR")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# DaltonFix - Enregistreur du framebuffer (anneau mappé sur disque)
+# Les images de /dev/fbN (ou d'un fichier qui le remplace) sont écrites
+# dans un fichier de taille fixe, mappé en mémoire, utilisé en anneau :
+# les plus anciennes sont écrasées. Chaque image a un en-tête (horodatage,
+# résolution, stride, bpp, mode/intensité du driver). Une image identique
+# à la précédente n'est qu'une référence (en-tête seul), une image modifiée
+# ne stocke que les plages de lignes changées ; une image complète (clé)
+# est écrite périodiquement et quand la géométrie change.
+# Le lecteur retrouve n'importe quelle image à partir de la clé qui la
+# précède et rejoue l'enregistrement à la vitesse voulue.
+#
+#   python3 dalton_record.py rec /dev/fb1 /tmp/fb.drec --size-mb 512 --fps 30
+#   python3 dalton_record.py info /tmp/fb.drec
+#   python3 dalton_record.py play /tmp/fb.drec --speed 4
+#   python3 dalton_record.py export /tmp/fb.drec --at 12.5 -o frame.png
+#   python3 dalton_record.py check
+import argparse
+import collections
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import numpy as np
+import dalton_fb
+
+MAGIC = b"DALTREC1"
+FRAME_MAGIC = b"FRM1"
+VERSION = 1
+# magic, version, header bytes, index slots, data offset, data size, first seq, next seq, write pos
+FILE_HEADER = struct.Struct("<8sIIIxxxxQQQQQ")
+# seq, record offset in the data area, record length, kind
+INDEX_ENTRY = struct.Struct("<QQIB3x")
+# magic, kind, mode, intensity, seq, timestamp, width, height, stride, bpp,
+# payload bytes, row ranges, seq of the key frame this one is built on
+FRAME_HEADER = struct.Struct("<4sBBBxQdIIIIIIQ8x")
+PAGE = 4096
+ALIGN = 64
+
+KIND_KEY = 0 # every row
+KIND_REF = 1 # same pixels as the previous frame, no payload
+KIND_DELTA = 2 # changed row ranges only
+KIND_NAMES = {KIND_KEY: "key", KIND_REF: "ref", KIND_DELTA: "delta"}
+
+SIZE_MB = 256
+INDEX_SLOTS = 1 << 16
+KEY_INTERVAL = 300 # frames between key frames (10 s at 30 fps)
+KEY_RATIO = 0.5 # a delta covering more rows than this is written as a key frame
+MERGE_GAP = 4 # unchanged rows between two changed runs merged into one range
+FPS = 30
+
+
+def _align(n, a=ALIGN):
+    return (n + a - 1) // a * a
+
+
+class Recorder:
+    # Appends frames of a dalton_fb.FramebufferReader to a ring file of fixed size
+    def __init__(self, path, size_mb=SIZE_MB, index_slots=INDEX_SLOTS, key_interval=KEY_INTERVAL):
+        self.path = path
+        self.index_slots = index_slots
+        self.key_interval = key_interval
+        index_off = PAGE
+        self.data_off = _align(index_off + index_slots * INDEX_ENTRY.size, PAGE)
+        self.data_size = int(size_mb * (1 << 20))
+        self.f = open(path, "w+b")
+        self.f.truncate(self.data_off + self.data_size)
+        self.mm = mmap.mmap(self.f.fileno(), self.data_off + self.data_size)
+        self.index = np.frombuffer(self.mm, dtype=np.uint8, count=index_slots * INDEX_ENTRY.size, offset=index_off)
+        self.data = np.frombuffer(self.mm, dtype=np.uint8, count=self.data_size, offset=self.data_off)
+        self.live = collections.deque() # (seq, offset, length), oldest first
+        self.next_seq = 0
+        self.pos = 0
+        self.key_seq = None
+        self.geometry = None
+        self.prev = None # previous frame as machine words, to find changed rows
+        self.counts = {k: 0 for k in KIND_NAMES}
+        self.bytes = 0
+        self._write_header()
+
+    def _write_header(self):
+        first = self.live[0][0] if self.live else self.next_seq
+        FILE_HEADER.pack_into(self.mm, 0, MAGIC, VERSION, FILE_HEADER.size, self.index_slots,
+                              self.data_off, self.data_size, first, self.next_seq, self.pos)
+
+    def _reserve(self, length):
+        # Room for one record at the write position; the oldest records it
+        # overlaps (and, on wrap, those in the unused tail) are dropped
+        if length > self.data_size // 2:
+            raise ValueError(f"frame of {length} bytes does not fit a {self.data_size >> 20} MB ring twice")
+        p = self.pos
+        if p + length > self.data_size:
+            while self.live and self.live[0][1] >= p:
+                self.live.popleft()
+            p = 0
+        while self.live and p <= self.live[0][1] < p + length:
+            self.live.popleft()
+        while self.live and self.next_seq - self.live[0][0] >= self.index_slots:
+            self.live.popleft()
+        return p
+
+    def _rows(self, reader):
+        w, h, stride, bpp = reader.geometry
+        return np.lib.stride_tricks.as_strided(reader.raw, (h, w * bpp // 8), (stride, 1))
+
+    def record(self, reader, mode=0, intensity=0, timestamp=None):
+        # Writes the current framebuffer content; returns the record kind
+        timestamp = time.time() if timestamp is None else timestamp
+        words = reader.words
+        kind = KIND_DELTA
+        if (reader.geometry != self.geometry or self.key_seq is None
+                or self.next_seq - self.key_seq >= self.key_interval):
+            kind = KIND_KEY
+            ranges = None
+        else:
+            changed = np.flatnonzero((words != self.prev).any(axis=1))
+            if not len(changed):
+                kind = KIND_REF
+                ranges = np.empty((0, 2), dtype=np.uint32)
+            else:
+                breaks = np.flatnonzero(np.diff(changed) > MERGE_GAP + 1)
+                starts = np.concatenate([changed[:1], changed[breaks + 1]])
+                ends = np.concatenate([changed[breaks], changed[-1:]]) + 1
+                if (ends - starts).sum() > KEY_RATIO * len(words):
+                    kind = KIND_KEY
+                else:
+                    ranges = np.stack([starts, ends], axis=1).astype(np.uint32)
+        rows = self._rows(reader)
+        row_bytes = rows.shape[1]
+        if kind == KIND_KEY:
+            ranges = np.array([[0, rows.shape[0]]], dtype=np.uint32)
+            self.key_seq = self.next_seq
+            self.geometry = reader.geometry
+            self.prev = np.array(words)
+        table = ranges.nbytes if kind == KIND_DELTA else 0
+        payload = table + int((ranges[:, 1] - ranges[:, 0]).sum()) * row_bytes
+        length = _align(FRAME_HEADER.size + payload)
+        p = self._reserve(length)
+        w, h, stride, bpp = reader.geometry
+        seq = self.next_seq
+        FRAME_HEADER.pack_into(self.mm, self.data_off + p, FRAME_MAGIC, kind, mode, intensity, seq,
+                               timestamp, w, h, stride, bpp, payload, len(ranges), self.key_seq)
+        at = p + FRAME_HEADER.size
+        if table:
+            self.data[at:at + table] = ranges.view(np.uint8).reshape(-1)
+            at += table
+        for y0, y1 in ranges:
+            n = (int(y1) - int(y0)) * row_bytes
+            np.copyto(self.data[at:at + n].reshape(int(y1) - int(y0), row_bytes), rows[y0:y1])
+            if kind == KIND_DELTA:
+                self.prev[y0:y1] = words[y0:y1]
+            at += n
+        # Record first, then its index entry, then the header: a reader never
+        # sees an entry pointing at a half-written record
+        INDEX_ENTRY.pack_into(self.index, (seq % self.index_slots) * INDEX_ENTRY.size, seq, p, length, kind)
+        self.live.append((seq, p, length))
+        self.next_seq += 1
+        self.pos = p + length
+        self._write_header()
+        self.counts[kind] += 1
+        self.bytes += length
+        return kind
+
+    def stats(self):
+        return {
+            "frames": sum(self.counts.values()),
+            "kinds": {KIND_NAMES[k]: n for k, n in self.counts.items()},
+            "bytes": self.bytes,
+            "live": len(self.live),
+        }
+
+    def close(self):
+        self._write_header()
+        self.index = self.data = None
+        self.mm.flush()
+        self.mm.close()
+        self.f.close()
+
+
+class FrameInfo(collections.namedtuple("FrameInfo", "seq timestamp kind mode intensity width height stride bpp key_seq offset")):
+    __slots__ = ()
+
+
+class Recording:
+    # Read side: frame list, seek, replay. Frames are rebuilt in one buffer
+    # from the key frame they depend on; moving forward only applies the
+    # records in between.
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.index_slots, self.data_off, self.data_size,
+         first, self.next_seq, _) = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a DaltonFix recording")
+        self.frames = []
+        for seq in range(max(first, self.next_seq - self.index_slots), self.next_seq):
+            info = self._info(seq)
+            if info is not None:
+                self.frames.append(info)
+        # Frames whose key frame was overwritten cannot be rebuilt
+        keys = {f.seq for f in self.frames if f.kind == KIND_KEY}
+        self.frames = [f for f in self.frames if f.key_seq in keys]
+        self.by_seq = {f.seq: i for i, f in enumerate(self.frames)}
+        self.buf = None
+        self.cur = None # seq currently in buf
+
+    def _info(self, seq):
+        e_seq, off, length, kind = INDEX_ENTRY.unpack_from(self.mm, PAGE + (seq % self.index_slots) * INDEX_ENTRY.size)
+        if e_seq != seq or off + length > self.data_size:
+            return None
+        (magic, kind, mode, intensity, h_seq, ts, w, h, stride, bpp,
+         _, _, key_seq) = FRAME_HEADER.unpack_from(self.mm, self.data_off + off)
+        if magic != FRAME_MAGIC or h_seq != seq:
+            return None
+        return FrameInfo(seq, ts, kind, mode, intensity, w, h, stride, bpp, key_seq, off)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return self.frames[-1].timestamp - self.frames[0].timestamp if self.frames else 0.0
+
+    def index_at(self, seconds):
+        # Frame shown `seconds` after the start of the recording
+        if not self.frames:
+            raise IndexError("empty recording")
+        t = self.frames[0].timestamp + seconds
+        times = [f.timestamp for f in self.frames]
+        return max(0, int(np.searchsorted(times, t, side="right")) - 1)
+
+    def _apply(self, info):
+        (_, kind, _, _, _, _, w, h, stride, bpp, payload, nranges, _) = FRAME_HEADER.unpack_from(
+            self.mm, self.data_off + info.offset)
+        row_bytes = w * bpp // 8
+        at = self.data_off + info.offset + FRAME_HEADER.size
+        if kind == KIND_KEY:
+            if self.buf is None or self.buf.shape != (h, row_bytes):
+                self.buf = np.empty((h, row_bytes), dtype=np.uint8)
+            self.buf[:] = np.frombuffer(self.mm, np.uint8, h * row_bytes, at).reshape(h, row_bytes)
+        elif kind == KIND_DELTA:
+            ranges = np.frombuffer(self.mm, np.uint32, nranges * 2, at).reshape(nranges, 2)
+            at += ranges.nbytes
+            for y0, y1 in ranges.tolist():
+                n = (y1 - y0) * row_bytes
+                self.buf[y0:y1] = np.frombuffer(self.mm, np.uint8, n, at).reshape(y1 - y0, row_bytes)
+                at += n
+        self.cur = info.seq
+
+    def raw(self, i):
+        # Frame i as stored by the driver: (H, W, 4) BGRX or (H, W) uint16 RGB565.
+        # The array is the player's buffer, valid until the next call.
+        info = self.frames[i]
+        if self.cur is None or self.cur > info.seq or self.frames[self.by_seq[self.cur]].key_seq != info.key_seq:
+            start = self.by_seq[info.key_seq]
+        else:
+            start = self.by_seq[self.cur] + 1
+        for j in range(start, i + 1):
+            self._apply(self.frames[j])
+        if info.bpp == 32:
+            return self.buf.reshape(info.height, info.width, 4)
+        return self.buf.view(np.uint16).reshape(info.height, info.width)
+
+    def rgb(self, i):
+        frame = self.raw(i)
+        if frame.ndim == 3:
+            return np.ascontiguousarray(frame[..., 2::-1])
+        return dalton_fb.rgb565_to_rgb(frame)
+
+    def replay(self, speed=1.0, start=0, sleep=time.sleep):
+        # Yields (index, FrameInfo) on the recorded timeline scaled by speed
+        if not self.frames:
+            return
+        t0 = time.perf_counter()
+        base = self.frames[start].timestamp
+        for i in range(start, len(self.frames)):
+            due = (self.frames[i].timestamp - base) / speed
+            wait = due - (time.perf_counter() - t0)
+            if wait > 0:
+                sleep(wait)
+            yield i, self.frames[i]
+
+    def summary(self):
+        kinds = collections.Counter(KIND_NAMES[f.kind] for f in self.frames)
+        return {
+            "frames": len(self.frames),
+            "first_seq": self.frames[0].seq if self.frames else None,
+            "last_seq": self.frames[-1].seq if self.frames else None,
+            "seconds": self.duration,
+            "kinds": dict(kinds),
+            "ring_mb": self.data_size / (1 << 20),
+        }
+
+    def close(self):
+        self.buf = None
+        self.mm.close()
+        self.f.close()
+
+
+def record(reader, out_path, fps=FPS, duration=None, size_mb=SIZE_MB, driver=None, log=sys.stderr):
+    # Capture loop at a fixed rate until duration (seconds) or Ctrl-C
+    rec = Recorder(out_path, size_mb)
+    period = 1.0 / fps
+    start = next_tick = time.perf_counter()
+    try:
+        while duration is None or time.perf_counter() - start < duration:
+            reader.check_geometry()
+            state = None
+            if driver is not None:
+                driver.poll()
+                state = driver.get()
+            mode, intensity = state if state is not None else (0, 0)
+            rec.record(reader, mode, intensity)
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter() # late: don't try to catch up
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rec.close()
+    s = rec.stats()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    s["fps"] = s["frames"] / elapsed
+    s["mb_s"] = s["bytes"] / elapsed / 1e6
+    if log:
+        print(f"{s['frames']} images ({s['kinds']}), {s['fps']:.1f} img/s, {s['mb_s']:.2f} MB/s écrits", file=log)
+    return s
+
+
+def play(path, speed=1.0, start=0.0):
+    # Tk player: timeline slider to seek, replays at `speed`
+    import tkinter as tk
+    import dalton_display
+    recording = Recording(path)
+    if not len(recording):
+        print("Enregistrement vide")
+        return 1
+    root = tk.Tk()
+    root.title(f"DaltonFix: {os.path.basename(path)}")
+    label = tk.Label(root, bg="black")
+    label.pack(fill="both", expand=True)
+    surface = dalton_display.PhotoSurface(label)
+    pos = tk.IntVar(value=recording.index_at(start))
+    info = tk.Label(root, font=("Courier", 8), anchor="w")
+    info.pack(fill="x")
+    state = {"playing": True, "t0": 0.0, "base": 0.0}
+
+    def show(i):
+        f = recording.frames[i]
+        surface.show(recording.rgb(i))
+        info.config(text=f"#{f.seq} {f.timestamp - recording.frames[0].timestamp:8.2f} s  "
+                         f"{f.width}x{f.height} {KIND_NAMES[f.kind]:<5} mode {f.mode} intensité {f.intensity}")
+
+    def restart_clock():
+        state["t0"] = time.perf_counter()
+        state["base"] = recording.frames[pos.get()].timestamp
+
+    def on_seek(_=None):
+        show(pos.get())
+        restart_clock()
+
+    def toggle(_=None):
+        state["playing"] = not state["playing"]
+        restart_clock()
+
+    def tick():
+        if state["playing"]:
+            t = state["base"] + (time.perf_counter() - state["t0"]) * speed_var.get()
+            i = pos.get()
+            while i + 1 < len(recording) and recording.frames[i + 1].timestamp <= t:
+                i += 1
+            if i != pos.get():
+                pos.set(i)
+                show(i)
+        root.after(10, tick)
+
+    ctrl = tk.Frame(root)
+    ctrl.pack(fill="x")
+    tk.Button(ctrl, text="Lecture/Pause", command=toggle).pack(side="left")
+    speed_var = tk.DoubleVar(value=speed)
+    tk.Spinbox(ctrl, values=(0.25, 0.5, 1, 2, 4, 8, 16), textvariable=speed_var, width=5,
+               command=restart_clock).pack(side="left")
+    tk.Scale(ctrl, from_=0, to=len(recording) - 1, orient="horizontal", variable=pos, showvalue=False,
+             command=on_seek).pack(side="left", fill="x", expand=True)
+    root.bind("<space>", toggle)
+    speed_var.set(speed)
+    on_seek()
+    tick()
+    root.mainloop()
+    recording.close()
+    return 0
+
+
+def check(frames=300, size=(1280, 720), log=sys.stderr):
+    # Fake framebuffer with a moving box and a blinking cursor, recorded into a
+    # small ring (so it wraps), then every surviving frame is rebuilt and
+    # compared with what was on the "screen"
+    import tempfile
+    w, h = size
+    with tempfile.TemporaryDirectory() as tmp:
+        fb_path = os.path.join(tmp, "fb")
+        screen = np.memmap(fb_path, dtype=np.uint8, mode="w+", shape=(h, w, 4))
+        screen[:] = 40
+        reader = dalton_fb.FramebufferReader(fb_path, geometry=(w, h, w * 4, 32))
+        frame_bytes = w * h * 4
+        rec = Recorder(os.path.join(tmp, "rec"), size_mb=frame_bytes * 8 / (1 << 20), key_interval=60)
+        truth = {}
+        for n in range(frames):
+            if n % 3 == 0:
+                x = (n * 7) % (w - 64)
+                screen[100:164, :, :3] = 40
+                screen[100:164, x:x + 64, :3] = (0, 0, 255)
+            if n % 15 == 0:
+                screen[h - 20:h - 4, 8:10, :3] = 255 if n % 30 else 0
+            rec.record(reader, 2, 80, timestamp=n / FPS)
+            truth[rec.next_seq - 1] = np.array(screen[..., 2::-1])
+        stats = rec.stats()
+        rec.close()
+        recording = Recording(os.path.join(tmp, "rec"))
+        order = list(range(len(recording)))
+        # Forward, then random seeks
+        order += list(np.random.default_rng(0).permutation(len(recording)))
+        bad = sum(not np.array_equal(recording.rgb(i), truth[recording.frames[i].seq]) for i in order)
+        kept = len(recording)
+        recording.close()
+        reader.close()
+    ratio = stats["bytes"] / (frames * frame_bytes)
+    if log:
+        print(f"{frames} images {w}x{h}: {stats['kinds']}, {stats['bytes'] / frames / 1024:.0f} KB/image "
+              f"({ratio:.1%} d'une image brute), {kept} dans l'anneau, {bad} différences", file=log)
+    return bad == 0 and 0 < kept < frames
+
+
+def _parse_geometry(text):
+    # WxH[xSTRIDE[xBPP]] for a file standing in for /dev/fbN
+    parts = [int(v) for v in text.lower().split("x")]
+    w, h = parts[:2]
+    bpp = parts[3] if len(parts) > 3 else 32
+    stride = parts[2] if len(parts) > 2 else w * bpp // 8
+    return w, h, stride, bpp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record /dev/fbN into a ring file, replay it")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("rec", help="record a framebuffer")
+    p.add_argument("fb", help="/dev/fbN or a file standing in for it")
+    p.add_argument("output")
+    p.add_argument("--size-mb", type=float, default=SIZE_MB, help="ring size")
+    p.add_argument("--fps", type=float, default=FPS)
+    p.add_argument("--duration", type=float, default=None, help="seconds (default: until Ctrl-C)")
+    p.add_argument("--geometry", type=_parse_geometry, default=None, help="WxH[xSTRIDE[xBPP]] instead of sysfs")
+    p.add_argument("--sysfs", default=dalton_fb.SYSFS_GRAPHICS)
+    p = sub.add_parser("info", help="frames held by a recording")
+    p.add_argument("recording")
+    p = sub.add_parser("play", help="replay in a window (Tk)")
+    p.add_argument("recording")
+    p.add_argument("--speed", type=float, default=1.0)
+    p.add_argument("--at", type=float, default=0.0, help="start at this many seconds")
+    p = sub.add_parser("export", help="write one frame as an image")
+    p.add_argument("recording")
+    p.add_argument("--at", type=float, default=0.0)
+    p.add_argument("-o", "--output", required=True)
+    sub.add_parser("check", help="record a synthetic framebuffer and verify every frame")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "rec":
+        import dalton_driver
+        reader = dalton_fb.FramebufferReader(args.fb, args.sysfs, args.geometry)
+        driver = dalton_driver.DriverClient()
+        try:
+            record(reader, args.output, args.fps, args.duration, args.size_mb,
+                   driver if driver.get() is not None else None)
+        finally:
+            reader.close()
+        return 0
+    if args.cmd == "play":
+        return play(args.recording, args.speed, args.at)
+    if args.cmd == "check":
+        return 0 if check() else 1
+    recording = Recording(args.recording)
+    try:
+        if args.cmd == "info":
+            print(json.dumps(recording.summary(), indent=1))
+        else:
+            from PIL import Image
+            Image.fromarray(recording.rgb(recording.index_at(args.at))).save(args.output)
+    finally:
+        recording.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
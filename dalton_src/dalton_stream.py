@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# DaltonFix - Filtre vidéo brut (stdin -> stdout)
+# Lit des images brutes de taille fixe (rgb24, bgr0, ...) sur stdin ou un
+# FIFO, les corrige sur place et les écrit sur stdout. Un petit anneau de
+# tampons réutilisés circule entre le thread de lecture, la correction et
+# le thread d'écriture : aucune allocation par image.
+# Le mode et l'intensité peuvent changer en cours de flux via un fichier
+# de contrôle ("2 70" ou "mode=2\nintensity=70"), relu quand il change.
+#
+#   ffmpeg -i in.mp4 -f rawvideo -pix_fmt rgb24 - |
+#     python3 dalton_stream.py --size 1280x720 --mode deutan --control /tmp/dalton.ctl |
+#     ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - out.mp4
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+import numpy as np
+import dalton_engine
+
+# ffmpeg pix_fmt -> dalton_engine layout (X/A channel passed through)
+PIX_FMTS = {
+    "rgb24": "RGB",
+    "bgr0": "BGRX",
+    "bgra": "BGRA",
+    "rgb0": "RGBX",
+    "rgba": "RGBA",
+}
+RING_SIZE = 4
+STOP_TIMEOUT = 1.0 # seconds to wait for the reader after a broken pipe
+CONTROL_CHECK_S = 0.2
+
+
+def read_full(f, mv):
+    # readinto until the buffer is full. Returns False on a clean EOF
+    # (a trailing partial frame is dropped).
+    got = 0
+    while got < len(mv):
+        n = f.readinto(mv[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+
+def write_full(f, mv):
+    sent = 0
+    while sent < len(mv):
+        sent += f.write(mv[sent:])
+
+
+def parse_control(text, mode, intensity):
+    # "2 70", "deutan 70", "mode=2" / "intensity=70" lines; missing fields keep their value
+    fields = {}
+    plain = []
+    for token in text.replace(",", " ").split():
+        if "=" in token:
+            key, value = token.split("=", 1)
+            fields[key.strip().lower()] = value.strip()
+        else:
+            plain.append(token)
+    if plain:
+        fields.setdefault("mode", plain[0])
+    if len(plain) > 1:
+        fields.setdefault("intensity", plain[1])
+    if "mode" in fields:
+        mode = dalton_engine.parse_mode(fields["mode"])
+    if "intensity" in fields:
+        intensity = dalton_engine.clamp_intensity(fields["intensity"])
+    return mode, intensity
+
+
+class ControlFile:
+    # Polled by mtime/size at most every CONTROL_CHECK_S; bad content is ignored
+    def __init__(self, path, mode, intensity):
+        self.path = path
+        self.mode = mode
+        self.intensity = intensity
+        self.sig = None
+        self.last = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self.path and now - self.last >= CONTROL_CHECK_S:
+            self.last = now
+            try:
+                st = os.stat(self.path)
+                sig = (st.st_mtime_ns, st.st_size)
+                if sig != self.sig:
+                    self.sig = sig
+                    with open(self.path) as f:
+                        self.mode, self.intensity = parse_control(f.read(), self.mode, self.intensity)
+            except (OSError, ValueError, argparse.ArgumentTypeError):
+                pass
+        return self.mode, self.intensity
+
+
+class StreamFilter:
+    # Ring of RING_SIZE frame buffers: free -> reader -> correction -> writer -> free
+    def __init__(self, width, height, pix_fmt="rgb24", ring=RING_SIZE, method=dalton_engine.METHOD_SIMPLE):
+        self.layout = PIX_FMTS[pix_fmt]
+        self.method = method
+        nch = dalton_engine.LAYOUTS[self.layout][0]
+        self.shape = (height, width, nch)
+        self.buffers = [np.empty(self.shape, dtype=np.uint8) for _ in range(max(2, ring))]
+        self.scratch = dalton_engine.scratch_buffer(width * height) # correction work area, reused
+        self.frames = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.error = None
+        self.stop = threading.Event() # set by the writer when the output is gone
+
+    def _reader(self, f, free, filled):
+        try:
+            while not self.stop.is_set():
+                buf = free.get()
+                if buf is None or self.stop.is_set() or not read_full(f, memoryview(buf).cast("B")):
+                    break
+                filled.put(buf)
+        except Exception as e:
+            self.error = e
+        filled.put(None)
+
+    def _writer(self, f, done, free, filled):
+        try:
+            while True:
+                buf = done.get()
+                if buf is None:
+                    break
+                write_full(f, memoryview(buf).cast("B"))
+                free.put(buf)
+            f.flush()
+        except Exception as e:
+            # Downstream closed (broken pipe): stop the reader and the
+            # correction loop, which may be waiting on an idle input
+            self.error = e
+            self.stop.set()
+            free.put(None)
+            filled.put(None)
+            while done.get() is not None:
+                pass
+
+    def run(self, fin, fout, control):
+        free, filled, done = queue.Queue(), queue.Queue(), queue.Queue()
+        self.stop.clear()
+        for buf in self.buffers:
+            free.put(buf)
+        reader = threading.Thread(target=self._reader, args=(fin, free, filled), daemon=True)
+        writer = threading.Thread(target=self._writer, args=(fout, done, free, filled), daemon=True)
+        reader.start()
+        writer.start()
+        start = time.perf_counter()
+        while True:
+            buf = filled.get()
+            if buf is None or self.stop.is_set():
+                break
+            mode, intensity = control.get()
+            t0 = time.perf_counter()
+            dalton_engine.apply_array(buf, mode, intensity, self.layout, out=buf, method=self.method,
+                                      scratch=self.scratch)
+            self.busy += time.perf_counter() - t0
+            self.frames += 1
+            self.bytes += buf.nbytes
+            done.put(buf)
+        done.put(None)
+        writer.join()
+        # After a broken pipe the reader may still sit in readinto() on an
+        # idle input: it is a daemon thread, don't wait for it
+        reader.join(STOP_TIMEOUT if self.stop.is_set() else None)
+        self.elapsed = time.perf_counter() - start
+        return self.frames
+
+    def stats(self):
+        elapsed = max(getattr(self, "elapsed", 0.0), 1e-9)
+        return {
+            "frames": self.frames,
+            "fps": self.frames / elapsed,
+            "mb_s": self.bytes / elapsed / 1e6,
+            "correct_ms": self.busy / self.frames * 1000.0 if self.frames else 0.0,
+        }
+
+
+def _parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correct a raw video stream (stdin -> stdout)")
+    parser.add_argument("--size", type=_parse_size, required=True, help="WxH, e.g. 1920x1080")
+    parser.add_argument("--pix-fmt", choices=sorted(PIX_FMTS), default="rgb24")
+    parser.add_argument("--mode", type=dalton_engine.parse_mode, default=1, help="0-3 or off/protan/deutan/tritan")
+    parser.add_argument("--intensity", type=int, default=100)
+    parser.add_argument("--method", choices=dalton_engine.METHODS, default=dalton_engine.METHOD_SIMPLE)
+    parser.add_argument("--control", default=None, help="file holding 'mode intensity', re-read when it changes")
+    parser.add_argument("-i", "--input", default="-", help="input file or FIFO (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="output file or FIFO (default: stdout)")
+    parser.add_argument("--ring", type=int, default=RING_SIZE, help="number of frame buffers")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    w, h = args.size
+    if not (0 < w <= dalton_engine.MAX_WIDTH and 0 < h <= dalton_engine.MAX_HEIGHT):
+        parser.error(f"size must be at most {dalton_engine.MAX_WIDTH}x{dalton_engine.MAX_HEIGHT}")
+    fin = open(sys.stdin.fileno() if args.input == "-" else args.input, "rb", buffering=0, closefd=args.input != "-")
+    fout = open(sys.stdout.fileno() if args.output == "-" else args.output, "wb", buffering=0, closefd=args.output != "-")
+    control = ControlFile(args.control, args.mode, dalton_engine.clamp_intensity(args.intensity))
+    stream = StreamFilter(w, h, args.pix_fmt, args.ring, args.method)
+    try:
+        stream.run(fin, fout, control)
+    finally:
+        fin.close()
+        fout.close()
+    if not args.quiet:
+        s = stream.stats()
+        print(f"{s['frames']} frames, {s['fps']:.1f} fps, {s['mb_s']:.0f} MB/s, "
+              f"correction {s['correct_ms']:.2f} ms/frame", file=sys.stderr)
+    if isinstance(stream.error, BrokenPipeError):
+        return 0
+    return 1 if stream.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
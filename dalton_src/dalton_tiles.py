@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# DaltonFix - Correction incrémentale par tuiles
+# Equivalent userspace du suivi de "damage" du driver (dalton_pipe_update):
+# on compare chaque capture à la précédente tuile par tuile et on ne
+# recorrige que les tuiles modifiées dans une image de sortie persistante.
+import numpy as np
+import dalton_engine
+
+TILE_SIZE = 64
+PARALLEL_PIXELS = 128 * 1024 # dirty spans at least this big are split in row bands
+
+
+class DirtyTiles:
+    # Per-tile change detector. sample=n compares one row out of n inside
+    # each tile, starting at the tile's first row (cheaper, may miss
+    # 1px-high changes); sample=1 is exact.
+    def __init__(self, tile=TILE_SIZE, sample=1):
+        self.tile = tile
+        self.sample = max(1, min(int(sample), tile))
+        self.prev = None
+        self._rows = None # (height, sampled rows, band starts in them)
+        self.frames = 0
+        self.skipped = 0
+        self.tiles_total = 0
+        self.tiles_dirty = 0
+
+    def reset(self):
+        self.prev = None
+
+    def grid(self, shape):
+        h, w = shape[:2]
+        return (h + self.tile - 1) // self.tile, (w + self.tile - 1) // self.tile
+
+    def diff(self, frame):
+        # Boolean (rows, cols) map of tiles that differ from the previous frame
+        rows, cols = self.grid(frame.shape)
+        self.frames += 1
+        self.tiles_total += rows * cols
+        if self.prev is None or self.prev.shape != frame.shape:
+            self.prev = frame.copy()
+            self.tiles_dirty += rows * cols
+            return np.ones((rows, cols), dtype=bool)
+
+        t = self.tile
+        cur, word = _words(frame, t)
+        old, _ = _words(self.prev, t)
+        rows, row_starts = self._sampled_rows(frame.shape[0])
+        changed = cur[rows] != old[rows]
+        col_starts = np.arange(0, cur.shape[1], t * _channels(frame) // word)
+        dirty = np.logical_or.reduceat(changed, row_starts, axis=0)
+        dirty = np.logical_or.reduceat(dirty, col_starts, axis=1)
+
+        n = int(dirty.sum())
+        self.tiles_dirty += n
+        if n == 0:
+            self.skipped += 1
+        else:
+            for y0, y1, x0, x1 in spans(dirty, t, frame.shape):
+                self.prev[y0:y1, x0:x1] = frame[y0:y1, x0:x1]
+        return dirty
+
+    def _sampled_rows(self, height):
+        # Rows compared and where each tile band starts among them. Sampling
+        # restarts at every tile so each band, the last partial one
+        # included, has its own rows even when sample does not divide tile.
+        if self._rows is None or self._rows[0] != height:
+            t, s = self.tile, self.sample
+            if t % s == 0:
+                rows = slice(None, None, s)
+                starts = np.arange(0, height, t) // s
+            else:
+                offsets = np.arange(height) % t
+                rows = np.flatnonzero(offsets % s == 0)
+                starts = np.flatnonzero(offsets[rows] == 0)
+            self._rows = (height, rows, starts)
+        return self._rows[1], self._rows[2]
+
+
+def _channels(frame):
+    return frame.shape[2] if frame.ndim == 3 else 1
+
+
+def _words(frame, tile):
+    # View each row as the widest machine word that still splits on tile
+    # boundaries: comparing uint64 words is several times cheaper than bytes
+    rows = np.ascontiguousarray(frame).reshape(frame.shape[0], -1)
+    tile_bytes = tile * _channels(frame)
+    for word, dtype in ((8, np.uint64), (4, np.uint32), (2, np.uint16)):
+        if tile_bytes % word == 0 and rows.shape[1] % word == 0:
+            return rows.view(dtype), word
+    return rows, 1
+
+
+def spans(dirty, tile, shape):
+    # Merge horizontally adjacent dirty tiles into (y0, y1, x0, x1) rectangles
+    h, w = shape[:2]
+    for ty, row in enumerate(dirty):
+        tx = 0
+        cols = len(row)
+        while tx < cols:
+            if not row[tx]:
+                tx += 1
+                continue
+            start = tx
+            while tx < cols and row[tx]:
+                tx += 1
+            yield ty * tile, min(h, (ty + 1) * tile), start * tile, min(w, tx * tile)
+
+
+class IncrementalCorrector:
+    # Keeps a corrected output frame and only recorrects the dirty tiles.
+    # A change of (mode, intensity) or frame size recorrects everything.
+    # With a dalton_parallel.ParallelCorrector, spans of parallel_pixels or
+    # more (full frames, big redraws) are corrected in row bands on its pool.
+    def __init__(self, tile=TILE_SIZE, layout="RGB", sample=1, parallel=None, parallel_pixels=PARALLEL_PIXELS):
+        self.layout = layout
+        self.tracker = DirtyTiles(tile, sample)
+        self.parallel = parallel
+        self.parallel_pixels = parallel_pixels
+        self.output = None
+        self.setting = None
+
+    def process(self, frame, mode, intensity, method=dalton_engine.METHOD_SIMPLE):
+        # Returns (output, rects). rects is empty when nothing changed.
+        frame = np.asarray(frame)
+        setting = (int(mode), dalton_engine.clamp_intensity(intensity), method)
+        if setting != self.setting or self.output is None or self.output.shape != frame.shape:
+            self.setting = setting
+            self.tracker.reset()
+            self.output = np.empty_like(frame)
+
+        dirty = self.tracker.diff(frame)
+        rects = list(spans(dirty, self.tracker.tile, frame.shape))
+        for y0, y1, x0, x1 in rects:
+            engine = dalton_engine
+            if self.parallel is not None and (y1 - y0) * (x1 - x0) >= self.parallel_pixels:
+                engine = self.parallel
+            self.output[y0:y1, x0:x1] = engine.apply_array(
+                frame[y0:y1, x0:x1], setting[0], setting[1], self.layout, method=method)
+        return self.output, rects
+
+
+def check(tile=TILE_SIZE):
+    # Every sampled row, tile edges included, must mark its own tile and
+    # only it, for samples that divide the tile and samples that don't
+    h, w = 2 * tile + tile // 2, 2 * tile
+    base = np.zeros((h, w, 3), dtype=np.uint8)
+    ok = True
+    for sample in (1, 2, 3, 5, 7, tile):
+        tracker = DirtyTiles(tile, sample)
+        tracker.diff(base)
+        for y in range(h):
+            if (y % tile) % sample:
+                continue # not sampled, allowed to go unseen
+            frame = base.copy()
+            frame[y, w - 1] = 255
+            dirty = tracker.diff(frame)
+            want = np.zeros_like(dirty)
+            want[y // tile, (w - 1) // tile] = True
+            if not np.array_equal(dirty, want):
+                print(f"sample={sample} row {y}: {dirty.astype(int).tolist()}")
+                ok = False
+            tracker.diff(base)
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    ok = check()
+    print("tuiles: OK" if ok else "tuiles: ERREUR")
+    sys.exit(0 if ok else 1)
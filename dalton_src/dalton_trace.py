@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# DaltonFix - Instrumentation par étage
+# Chronomètre chaque étage (capture, redimensionnement, correction,
+# conversion PhotoImage, affichage Tk) dans des fenêtres glissantes de
+# WINDOW échantillons : p50/p95/p99 et cadence. Les erreurs jusque-là
+# avalées sont comptées (avec le dernier message). Export JSON lines
+# pour l'analyse hors ligne, texte court pour l'overlay à l'écran.
+# Désactivé, stage() rend un objet vide partagé : un appel de méthode.
+#
+#   DALTON_TRACE=1 python3 dalton_cam.py            (F3 : overlay)
+#   DALTON_TRACE=/tmp/cam.jsonl python3 dalton_viewer.py
+#   python3 dalton_trace.py                          (coût à vide / actif)
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+WINDOW = 1024 # samples kept per stage
+ENV = "DALTON_TRACE"
+
+
+class Histogram:
+    # Rolling window of the last `size` durations (seconds), preallocated
+    def __init__(self, size=WINDOW):
+        self.samples = np.zeros(size)
+        self.pos = 0
+        self.total = 0
+
+    def add(self, seconds):
+        self.samples[self.pos] = seconds
+        self.pos = (self.pos + 1) % len(self.samples)
+        self.total += 1
+
+    def summary(self):
+        n = min(self.total, len(self.samples))
+        if not n:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(self.samples[:n], (50, 95, 99)) * 1000.0
+        return {"count": self.total, "p50_ms": float(p50), "p95_ms": float(p95),
+                "p99_ms": float(p99), "max_ms": float(self.samples[:n].max() * 1000.0)}
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "t0")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    # Stage timings are only recorded while enabled; error counters always are
+    # (they only cost anything when something fails).
+    def __init__(self, enabled=False, path=None, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.path = path
+        self.out = None
+        self.hists = {}
+        self.counters = {}
+        self.last_errors = {}
+        self.lock = threading.Lock()
+        self.start = self.last_snapshot = time.perf_counter()
+        self.last_totals = {}
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        # DALTON_TRACE unset/0: disabled; 1: enabled; anything else: JSON lines path
+        value = environ.get(ENV, "")
+        if value in ("", "0"):
+            return cls()
+        return cls(True, None if value == "1" else value)
+
+    def stage(self, name):
+        # with tracer.stage("capture.grab"): ...
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.hists.get(name)
+            if hist is None:
+                hist = self.hists[name] = Histogram(self.window)
+            hist.add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, name, exc):
+        # Counts a swallowed exception under "<name>.errors" and keeps its message
+        key = name + ".errors"
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            self.last_errors[name] = f"{type(exc).__name__}: {exc}"
+
+    def snapshot(self):
+        # Percentiles over the window, rate (per second) since the previous snapshot
+        now = time.perf_counter()
+        with self.lock:
+            elapsed = max(now - self.last_snapshot, 1e-9)
+            stages = {}
+            for name, hist in sorted(self.hists.items()):
+                s = hist.summary()
+                s["rate"] = (hist.total - self.last_totals.get(name, 0)) / elapsed
+                self.last_totals[name] = hist.total
+                stages[name] = s
+            self.last_snapshot = now
+            return {"t": time.time(), "uptime_s": now - self.start, "stages": stages,
+                    "counters": dict(self.counters), "errors": dict(self.last_errors)}
+
+    def export(self, snapshot, **extra):
+        # One JSON line per call (e.g. once per stats tick) when a path is set
+        if self.path is None:
+            return
+        if self.out is None:
+            self.out = open(self.path, "a", buffering=1)
+        record = dict(snapshot)
+        record.update(extra)
+        self.out.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+def overlay_text(snapshot, rate_stage="display", latency_stage="latency"):
+    # A few short lines for the on-screen overlay
+    stages = snapshot["stages"]
+    head = stages.get(rate_stage, {})
+    lines = [f"{head.get('rate', 0.0):5.1f} img/s"]
+    lat = stages.get(latency_stage)
+    if lat and lat["count"]:
+        lines[0] += f"  latence p50 {lat['p50_ms']:.0f} / p95 {lat['p95_ms']:.0f} ms"
+    lines.append(f"{'ms':<18} {'p50':>6} {'p95':>6} {'p99':>6}")
+    for name, s in stages.items():
+        if name in (rate_stage, latency_stage) or not s["count"]:
+            continue
+        lines.append(f"{name:<18} {s['p50_ms']:6.1f} {s['p95_ms']:6.1f} {s['p99_ms']:6.1f}")
+    for name, n in snapshot["counters"].items():
+        lines.append(f"{name}: {n}")
+    return "\n".join(lines)
+
+
+DISABLED = Tracer()
+
+
+def overhead(n=200000):
+    # ns per `with tracer.stage(...)` disabled and enabled, bare loop subtracted
+    def timed(tracer):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with tracer.stage("x"):
+                pass
+        return time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(n):
+        pass
+    bare = time.perf_counter() - t0
+    off = timed(Tracer())
+    on = timed(Tracer(True))
+    return (off - bare) / n * 1e9, (on - bare) / n * 1e9
+
+
+if __name__ == "__main__":
+    off_ns, on_ns = overhead()
+    print(f"stage(): {off_ns:.0f} ns disabled, {on_ns:.0f} ns enabled")
+    # Budget: a 30 fps frame has ~10 spans, disabled they must stay far below 0.1 ms
+    sys.exit(0 if off_ns < 1000 else 1)
@@ -4,19 +4,32 @@ from tkinter import ttk, messagebox
 import os
 import subprocess
 import re
+import sys
+import threading
+import dalton_engine
+import dalton_apply
+import dalton_display
+import dalton_driver
+import dalton_preview
 
 # Paths to Sysfs interface
-SYSFS_MODE = "/sys/module/dalton_drv/parameters/mode"
-SYSFS_INTENSITY = "/sys/module/dalton_drv/parameters/intensity"
+SYSFS_PARAMS = dalton_driver.SYSFS_PARAMS
+SYSFS_MODE = os.path.join(SYSFS_PARAMS, "mode")
+SYSFS_INTENSITY = os.path.join(SYSFS_PARAMS, "intensity")
+APPLY_STATS_MS = 500
+DRIVER_POLL_MS = int(dalton_driver.POLL_S * 1000)
+MONITOR_POLL_MS = 50 # check for the xrandr result started after the first paint
 
 class DaltonApp:
     def __init__(self, root):
         self.root = root
         self.root.title("DaltonFix Controller & Preview (VMware Edition)")
-        self.root.geometry("800x550")
+        self.root.geometry("1100x560")
         
         self.check_permissions()
-        self.monitor_name = self.detect_monitor()
+        self.driver = dalton_driver.DriverClient(SYSFS_PARAMS)
+        # xrandr runs once the window is on screen (see start_monitor_detection)
+        self.monitor_name = None
 
         # Layout
         left_frame = tk.Frame(root, padx=10, pady=10)
@@ -29,8 +42,8 @@ class DaltonApp:
         tk.Label(left_frame, text="DaltonFix Controls", font=("Arial", 14, "bold")).pack(pady=5)
         
         # System Info
-        sys_msg = f"Ecran: {self.monitor_name}" if self.monitor_name else "Ecran: Non détecté"
-        tk.Label(left_frame, text=sys_msg, font=("Arial", 8)).pack(pady=2)
+        self.lbl_monitor = tk.Label(left_frame, text="Ecran: détection...", font=("Arial", 8))
+        self.lbl_monitor.pack(pady=2)
 
         # Mode Selection
         frame_mode = tk.LabelFrame(left_frame, text="Mode", padx=10, pady=10)
@@ -64,19 +77,61 @@ class DaltonApp:
         self.chk_global.pack()
         tk.Label(frame_global, text="Utilise xrandr --gamma au lieu de CTM.\nMoins précis mais marche sur VMware.", font=("Arial", 7, "italic"), fg="gray").pack()
 
-        # Preview Area
+        # sysfs writes and xrandr run off the Tk thread, coalesced while dragging
+        self.gamma = dalton_apply.GammaBackend(self.monitor_name)
+        self.scheduler = dalton_apply.ApplyScheduler([
+            dalton_apply.SysfsBackend(client=self.driver),
+            self.gamma,
+        ])
+        self.lbl_apply = tk.Label(left_frame, text="", font=("Arial", 7), fg="gray")
+        self.lbl_apply.pack(pady=2)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Preview Area: original / simulated / corrected panels in one image
         tk.Label(right_frame, text="Simulation (Algorithme Réel)", font=("Arial", 12, "bold")).pack(pady=5)
-        self.canvas = tk.Canvas(right_frame, width=400, height=400, bg="black")
-        self.canvas.pack()
-        
-        # Color Palettes for Test
-        self.rects = []
-        self.base_colors = []
-        self.create_test_pattern()
+        frame_chart = tk.Frame(right_frame)
+        frame_chart.pack()
+        self.chart_var = tk.StringVar(value="swatches")
+        for text, val in (("Nuancier", "swatches"), ("Dégradés", "gradients"), ("Image...", "image")):
+            tk.Radiobutton(frame_chart, text=text, variable=self.chart_var, value=val,
+                           command=self.on_chart).pack(side="left")
+        frame_titles = tk.Frame(right_frame)
+        frame_titles.pack()
+        for title in dalton_preview.PANELS:
+            tk.Label(frame_titles, text=title, width=dalton_preview.PANEL // 8).pack(side="left")
+        self.lbl_preview = tk.Label(right_frame, bg="black")
+        self.lbl_preview.pack()
+        self.lbl_preview_ms = tk.Label(right_frame, text="", font=("Arial", 7), fg="gray")
+        self.lbl_preview_ms.pack()
+        self.preview = dalton_preview.Preview()
+        self.surface = dalton_display.PhotoSurface(self.lbl_preview)
+        self.chart = "swatches"
+        self.preview.set_chart(self.chart)
 
         # Initial Load
         self.read_current_state()
         self.update_preview()
+        self.update_apply_stats()
+        self.driver.subscribe(self.on_driver_change)
+        self.root.after(DRIVER_POLL_MS, self.poll_driver)
+        self.root.after_idle(self.start_monitor_detection)
+
+    def start_monitor_detection(self):
+        # Idle callback: the first frame is painted. xrandr can take a while,
+        # so it runs on a thread and the Tk side polls for the result.
+        result = []
+        threading.Thread(target=lambda: result.append(self.detect_monitor()), daemon=True).start()
+        self.root.after(MONITOR_POLL_MS, self.finish_monitor_detection, result)
+
+    def finish_monitor_detection(self, result):
+        if not result:
+            self.root.after(MONITOR_POLL_MS, self.finish_monitor_detection, result)
+            return
+        self.monitor_name = self.gamma.monitor = result[0]
+        self.lbl_monitor.config(text=f"Ecran: {self.monitor_name}" if self.monitor_name else "Ecran: Non détecté")
+        if self.monitor_name and self.apply_global_var.get():
+            # Gamma was requested before the monitor was known
+            self.on_change()
 
     def detect_monitor(self):
         try:
@@ -87,113 +142,78 @@ class DaltonApp:
             return None
         return None
 
-    def create_test_pattern(self):
-        width = 400; height = 400
-        cols = 5; rows = 5
-        w = width / cols; h = height / rows
-        colors_hex = [
-            "#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#00FFFF", 
-            "#FF00FF", "#FFFFFF", "#FFCCAA", "#228822", "#55AAFF",
-            "#AA0000", "#00AA00", "#0000AA", "#AAAA00", "#00AAAA",
-            "#AA00AA", "#888888", "#AA8866", "#114411", "#225588",
-            "#550000", "#005500", "#000055", "#555500", "#005555"
-        ]
-        for i in range(rows * cols):
-            color = colors_hex[i] if i < len(colors_hex) else "#888888"
-            rr = int(color[1:3], 16); gg = int(color[3:5], 16); bb = int(color[5:7], 16)
-            self.base_colors.append((rr, gg, bb))
-            rect = self.canvas.create_rectangle((i%cols)*w, (i//cols)*h, ((i%cols)+1)*w, ((i//cols)+1)*h, fill=color, outline="black")
-            self.rects.append(rect)
+    def on_chart(self):
+        name = self.chart_var.get()
+        try:
+            if name == "image":
+                from tkinter import filedialog
+                path = filedialog.askopenfilename(title="Image de référence",
+                                                  filetypes=[("Images", "*.png *.jpg *.jpeg *.bmp *.webp"), ("Tous", "*")])
+                if not path:
+                    self.chart_var.set(self.chart)
+                    return
+                self.preview.set_chart(name, path)
+            else:
+                self.preview.set_chart(name)
+        except Exception as e:
+            self.chart_var.set(self.chart)
+            messagebox.showerror("Erreur", f"Image illisible:\n{e}")
+            return
+        self.chart = name
+        self.update_preview()
 
     def on_change(self, val=None):
-        self.update_driver()
+        # Preview is cheap and stays synchronous; driver/gamma go to the scheduler
         self.update_preview()
-        if self.apply_global_var.get():
-            self.apply_gamma_hack()
-        else:
-            self.reset_gamma()
+        self.scheduler.submit((self.mode_var.get(), self.intensity_var.get(),
+                               self.apply_global_var.get()))
+
+    def update_apply_stats(self):
+        st = self.scheduler.stats()
+        if st["applies"]:
+            self.lbl_apply.config(text=f"Appliqué en {st['last_ms']:.0f} ms "
+                                       f"({st['coalesced']} fusionnés)")
+        self.root.after(APPLY_STATS_MS, self.update_apply_stats)
+
+    def on_close(self):
+        self.scheduler.stop()
+        self.root.destroy()
 
     def get_correction_matrix(self):
-        mode = self.mode_var.get()
-        intensity = self.intensity_var.get() / 100.0
-        
-        sim_protan = [[0.567, 0.433, 0], [0.558, 0.442, 0], [0, 0.242, 0.758]]
-        sim_deutan = [[0.625, 0.375, 0], [0.700, 0.300, 0], [0, 0.300, 0.700]]
-        sim_tritan = [[0.950, 0.050, 0], [0, 0.433, 0.567], [0, 0.475, 0.525]]
-        
-        target_sim = [[1,0,0],[0,1,0],[0,0,1]] # Identity
-        if mode == 1: target_sim = sim_protan
-        elif mode == 2: target_sim = sim_deutan
-        elif mode == 3: target_sim = sim_tritan
-            
-        c_mat = [[0.0]*3 for _ in range(3)]
-        for i in range(3):
-            for j in range(3):
-                ident = 1.0 if i == j else 0.0
-                correction_val = (2.0 * ident) - target_sim[i][j]
-                c_mat[i][j] = ident * (1.0 - intensity) + correction_val * intensity
-        
-        return c_mat
+        return dalton_engine.correction_matrix(self.mode_var.get(), self.intensity_var.get())
 
     def update_preview(self):
-        c_mat = self.get_correction_matrix()
-        for idx, (r, g, b) in enumerate(self.base_colors):
-            nr = c_mat[0][0]*r + c_mat[0][1]*g + c_mat[0][2]*b
-            ng = c_mat[1][0]*r + c_mat[1][1]*g + c_mat[1][2]*b
-            nb = c_mat[2][0]*r + c_mat[2][1]*g + c_mat[2][2]*b
-            nr = min(255, max(0, int(nr))); ng = min(255, max(0, int(ng))); nb = min(255, max(0, int(nb)))
-            self.canvas.itemconfig(self.rects[idx], fill=f"#{nr:02x}{ng:02x}{nb:02x}")
-
-    def apply_gamma_hack(self):
-        if not self.monitor_name: return
-        mode = self.mode_var.get()
-        intensity = self.intensity_var.get() / 100.0
-        
-        # Gamma Hack: Simple channel scaling
-        # Not a true Dalton matrix, but gives a visual tint effect "Globally"
-        r_g = 1.0; g_g = 1.0; b_g = 1.0
-        
-        if mode == 1: # Protan (Red blind) -> Reduce Red, Boost Cyan?
-            # Reduce Red: 1.0 -> 0.0 based on intensity
-            # But xrandr gamma is 1.0 (normal) ... 0.1 (dark)
-            r_g = 1.0 - (0.8 * intensity)
-        elif mode == 2: # Deutan (Green blind)
-            g_g = 1.0 - (0.8 * intensity)
-        elif mode == 3: # Tritan (Blue blind)
-            b_g = 1.0 - (0.8 * intensity)
-
-        # Apply using xrandr --gamma
-        cmd = ["xrandr", "--output", self.monitor_name, "--gamma", f"{r_g}:{g_g}:{b_g}"]
-        try:
-            subprocess.run(cmd, check=False)
-        except: pass
-
-    def reset_gamma(self):
-        if not self.monitor_name: return
-        try:
-            subprocess.run(["xrandr", "--output", self.monitor_name, "--gamma", "1:1:1"], check=False)
-        except: pass
+        # One vectorized pass for the corrected panel, one paste for the whole image
+        if self.preview.update(self.mode_var.get(), self.intensity_var.get()):
+            self.surface.show(self.preview.image)
+            self.lbl_preview_ms.config(text=f"Aperçu {self.preview.last_ms:.1f} ms")
 
     def check_permissions(self):
         if not os.access(SYSFS_MODE, os.W_OK):
             pass # Demo mode
 
     def read_current_state(self):
-        # ... same as before
-        pass
-    
-    def update_driver(self):
-        if not os.access(SYSFS_MODE, os.W_OK): return
-        mode = self.mode_var.get()
-        intensity = self.intensity_var.get()
-        try:
-            with open(SYSFS_MODE, 'w') as f: f.write(str(mode))
-            with open(SYSFS_INTENSITY, 'w') as f: f.write(str(intensity))
-        except: pass
+        # Start from the live driver parameters (cached by the client)
+        state = self.driver.get()
+        if state is not None:
+            self.mode_var.set(state[0])
+            self.intensity_var.set(state[1])
+
+    def on_driver_change(self, mode, intensity):
+        # Another tool changed the driver: follow it
+        self.mode_var.set(mode)
+        self.intensity_var.set(intensity)
+        self.update_preview()
 
-if __name__ == "__main__":
-    try: import tkinter
-    except: exit(1)
+    def poll_driver(self):
+        self.driver.poll()
+        self.root.after(DRIVER_POLL_MS, self.poll_driver)
+
+def main(argv=None):
     root = tk.Tk()
     app = DaltonApp(root)
     root.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
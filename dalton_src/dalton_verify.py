@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# DaltonFix - Vérification de la sortie du driver
+# Une image de référence connue est affichée sur le moniteur virtuel ; la
+# sortie attendue est calculée avec le modèle virgule fixe du driver
+# (dalton_fixed) pour le mode/intensité de sysfs, puis comparée au contenu
+# de /dev/fbN. Le résultat : nombre de pixels faux, classés en « non
+# corrigé » (zone endommagée oubliée par dalton_pipe_update), « corrigé
+# deux fois » (correction en place réappliquée) ou « autre », une carte de
+# chaleur par cellules de CELL pixels et les boîtes englobantes des zones.
+# Le travail se fait par bandes de lignes : aucune copie pleine taille.
+#
+#   python3 dalton_verify.py run /dev/fb1 reference.png --heatmap diff.png
+#   python3 dalton_verify.py run fb.raw reference.png --geometry 1920x1080 --mode 2 --intensity 80
+#   python3 dalton_verify.py check
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import dalton_engine
+import dalton_fb
+import dalton_fixed
+
+BAND_ROWS = 64 # rows verified per step (multiple of CELL)
+CELL = 16 # heatmap cell size in pixels
+MAX_BOXES = 64
+HEAT_COLOR = (255, 0, 0)
+BOX_COLOR = (255, 255, 0)
+
+
+class VerifyResult:
+    def __init__(self, heat, cell, size):
+        self.heat = heat # (rows, cols) mismatching pixels per cell
+        self.cell = cell
+        self.size = size # (w, h) of the verified region
+        self.pixels = size[0] * size[1]
+        self.mismatched = 0
+        self.uncorrected = 0
+        self.double = 0
+        self.max_error = 0
+        self.boxes = []
+        self.seconds = 0.0
+
+    @property
+    def other(self):
+        return self.mismatched - self.uncorrected - self.double
+
+    @property
+    def ok(self):
+        return self.mismatched == 0
+
+    def summary(self):
+        return {
+            "ok": self.ok,
+            "pixels": self.pixels,
+            "mismatched": self.mismatched,
+            "uncorrected": self.uncorrected,
+            "double": self.double,
+            "other": self.other,
+            "max_error": self.max_error,
+            "boxes": [list(b) for b in self.boxes],
+            "ms": self.seconds * 1000.0,
+        }
+
+
+def boxes_from_heat(heat, cell, size, limit=MAX_BOXES):
+    # 8-connected groups of non-empty cells -> (left, top, right, bottom) in
+    # pixels, largest first. The grid is small (1080p: 68x120 cells).
+    seen = np.zeros(heat.shape, dtype=bool)
+    rows, cols = heat.shape
+    boxes = []
+    for y, x in zip(*np.nonzero(heat)):
+        if seen[y, x]:
+            continue
+        seen[y, x] = True
+        stack = [(y, x)]
+        y0 = y1 = y
+        x0 = x1 = x
+        count = 0
+        while stack:
+            cy, cx = stack.pop()
+            count += int(heat[cy, cx])
+            y0, y1, x0, x1 = min(y0, cy), max(y1, cy), min(x0, cx), max(x1, cx)
+            for ny in range(max(0, cy - 1), min(rows, cy + 2)):
+                for nx in range(max(0, cx - 1), min(cols, cx + 2)):
+                    if heat[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        box = (int(x0 * cell), int(y0 * cell), int(min(size[0], (x1 + 1) * cell)), int(min(size[1], (y1 + 1) * cell)))
+        boxes.append((count, box))
+    boxes.sort(key=lambda b: -b[0])
+    return [b for _, b in boxes[:limit]]
+
+
+class Verifier:
+    # reference: (H, W, 4) uint8 BGRX frame (what was put on screen) or an RGB
+    # (H, W, 3) frame, converted once. offset = where it sits in the framebuffer.
+    def __init__(self, reference, offset=(0, 0), band_rows=BAND_ROWS, cell=CELL):
+        reference = np.asarray(reference)
+        if reference.shape[2] == 3:
+            bgrx = np.zeros(reference.shape[:2] + (4,), dtype=np.uint8)
+            bgrx[..., 2::-1] = reference
+            reference = bgrx
+        self.reference = reference
+        self.offset = offset
+        self.cell = cell
+        self.band_rows = max(cell, band_rows // cell * cell)
+        h, w = reference.shape[:2]
+        # Band scratch buffers, reused for every band and every run
+        self.expected = np.empty((self.band_rows, w, 4), dtype=np.uint8)
+        self.twice = np.empty_like(self.expected)
+        self.col_starts = np.arange(0, w, cell)
+
+    @classmethod
+    def from_image(cls, path, offset=(0, 0), **kw):
+        from PIL import Image
+        with Image.open(path) as img:
+            return cls(np.asarray(img.convert("RGB")), offset, **kw)
+
+    def region(self, frame):
+        # Part of the framebuffer view (H, W, 4) covered by the reference
+        if frame.ndim != 3:
+            raise ValueError("only XRGB8888 framebuffers are produced by dalton_drv")
+        x, y = self.offset
+        h, w = self.reference.shape[:2]
+        if frame.shape[0] < y + h or frame.shape[1] < x + w:
+            raise ValueError(f"reference {w}x{h} at {x},{y} does not fit a "
+                             f"{frame.shape[1]}x{frame.shape[0]} framebuffer")
+        return frame[y:y + h, x:x + w]
+
+    def run(self, frame, mode, intensity):
+        # frame: framebuffer view (H, W, 4) BGRX, e.g. FramebufferReader.frame()
+        t0 = time.perf_counter()
+        got_all = self.region(frame)
+        h, w = self.reference.shape[:2]
+        heat = np.zeros(((h + self.cell - 1) // self.cell, len(self.col_starts)), dtype=np.int32)
+        res = VerifyResult(heat, self.cell, (w, h))
+        mat = dalton_fixed.recalc_matrix(mode, intensity)
+        for y0 in range(0, h, self.band_rows):
+            y1 = min(h, y0 + self.band_rows)
+            n = y1 - y0
+            src = self.reference[y0:y1]
+            got = got_all[y0:y1, :, :3]
+            if mode:
+                exp = dalton_fixed.apply_frame(src, mode, intensity, out=self.expected[:n], matrix=mat)
+            else:
+                exp = src # mode 0: the driver leaves the buffer alone
+            bad = (got != exp[..., :3]).any(axis=2)
+            count = int(np.count_nonzero(bad))
+            if not count:
+                continue
+            res.mismatched += count
+            ys, xs = np.nonzero(bad)
+            err = np.abs(got[ys, xs].astype(np.int16) - exp[ys, xs, :3]).max()
+            res.max_error = max(res.max_error, int(err))
+            # What went wrong: damage not corrected, or corrected a second time
+            res.uncorrected += int(np.count_nonzero((got[ys, xs] == src[ys, xs, :3]).all(axis=1)))
+            if mode:
+                twice = dalton_fixed.apply_frame(exp, mode, intensity, out=self.twice[:n], matrix=mat)
+                res.double += int(np.count_nonzero((got[ys, xs] == twice[ys, xs, :3]).all(axis=1)))
+            cells = np.add.reduceat(bad, np.arange(0, n, self.cell), axis=0, dtype=np.int32)
+            heat[y0 // self.cell:(y1 + self.cell - 1) // self.cell] += np.add.reduceat(
+                cells, self.col_starts, axis=1, dtype=np.int32)
+        res.boxes = boxes_from_heat(heat, self.cell, (w, h))
+        res.seconds = time.perf_counter() - t0
+        return res
+
+
+def draw_overlay(view, result, offset=(0, 0), fb_size=None):
+    # Marks the mismatching cells (tint) and boxes on a scaled RGB view
+    # (h, w, 3) of the framebuffer, in place
+    vh, vw = view.shape[:2]
+    fw, fh = fb_size or result.size
+    sx, sy = vw / fw, vh / fh
+    ox, oy = offset
+    # Cell grid -> view pixels through the nearest cell of each view pixel
+    xs = ((np.arange(vw) + 0.5) / sx - ox) // result.cell
+    ys = ((np.arange(vh) + 0.5) / sy - oy) // result.cell
+    inside_x = (xs >= 0) & (xs < result.heat.shape[1])
+    inside_y = (ys >= 0) & (ys < result.heat.shape[0])
+    hot = np.zeros((vh, vw), dtype=bool)
+    grid = result.heat[ys[inside_y].astype(np.intp)][:, xs[inside_x].astype(np.intp)] > 0
+    hot[np.ix_(inside_y, inside_x)] = grid
+    view[hot] = (view[hot] // 2 + np.array(HEAT_COLOR, dtype=np.uint8) // 2)
+    for left, top, right, bottom in result.boxes:
+        l, r = int((left + ox) * sx), min(vw - 1, int((right + ox) * sx))
+        t, b = int((top + oy) * sy), min(vh - 1, int((bottom + oy) * sy))
+        view[t, l:r + 1] = BOX_COLOR
+        view[b, l:r + 1] = BOX_COLOR
+        view[t:b + 1, l] = BOX_COLOR
+        view[t:b + 1, r] = BOX_COLOR
+    return view
+
+
+def heatmap_image(result, scale=None):
+    # Heatmap as an RGB array: black = exact, red intensity = share of bad pixels in the cell
+    frac = result.heat / float(result.cell * result.cell)
+    rgb = np.zeros(result.heat.shape + (3,), dtype=np.uint8)
+    rgb[..., 0] = np.where(result.heat > 0, 64 + frac * 191, 0).astype(np.uint8)
+    if scale:
+        rgb = rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+    return rgb
+
+
+def test_pattern(w, h):
+    # Reference with every kind of colour: hue/value ramps and grey steps
+    x = np.linspace(0.0, 1.0, w)[None, :]
+    y = np.linspace(0.0, 1.0, h)[:, None]
+    rgb = np.empty((h, w, 3))
+    rgb[..., 0] = x
+    rgb[..., 1] = y
+    rgb[..., 2] = (1.0 - x) * (1.0 - y) + x * y
+    rgb[:, ::37] = 0.5
+    return (rgb * 255).round().astype(np.uint8)
+
+
+def check(size=(1920, 1080), mode=2, intensity=80, log=sys.stderr):
+    # File-backed fake framebuffer: the driver's correct output with three
+    # injected faults, each must be found, classified and boxed
+    import os
+    import tempfile
+    w, h = size
+    ref = Verifier(test_pattern(w, h))
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fb")
+        screen = np.memmap(path, dtype=np.uint8, mode="w+", shape=(h, w, 4))
+        dalton_fixed.apply_frame(ref.reference, mode, intensity, out=screen)
+        reader = dalton_fb.FramebufferReader(path, geometry=(w, h, w * 4, 32))
+        clean = ref.run(reader.frame(), mode, intensity)
+        ok &= clean.ok
+        # Missed damage rect, a double-applied rect, and corrupted pixels
+        screen[100:180, 200:500] = ref.reference[100:180, 200:500]
+        twice = dalton_fixed.apply_frame(np.array(screen[600:650, 1000:1300]), mode, intensity)
+        screen[600:650, 1000:1300] = twice
+        screen[900:903, 50:53, 1] ^= 0xFF
+        res = ref.run(reader.frame(), mode, intensity)
+        area_u = 80 * 300
+        area_d = 50 * 300
+        # Pixels already left unchanged by the correction cannot be told apart
+        ok &= res.uncorrected <= area_u and res.uncorrected > area_u * 0.9
+        ok &= res.double <= area_d and res.double > area_d * 0.9
+        ok &= res.other > 0 and len(res.boxes) == 3
+        for box, want in zip(sorted(res.boxes), sorted([(200, 100, 500, 180), (1000, 600, 1300, 650), (50, 900, 53, 903)])):
+            ok &= box[0] <= want[0] and box[1] <= want[1] and box[2] >= want[2] and box[3] >= want[3]
+        view = reader.scaled_rgb((800, 450))
+        draw_overlay(view, res, fb_size=(w, h))
+        reader.close()
+        del screen
+    if log:
+        s = res.summary()
+        print(f"{w}x{h}: propre {clean.mismatched} px en {clean.seconds * 1000:.0f} ms ; avec défauts "
+              f"{s['mismatched']} px (non corrigés {s['uncorrected']}, doublés {s['double']}, "
+              f"autres {s['other']}), {len(s['boxes'])} zones, {s['ms']:.0f} ms", file=log)
+    return ok
+
+
+def _parse_geometry(text):
+    parts = [int(v) for v in text.lower().split("x")]
+    w, h = parts[:2]
+    return w, h, parts[2] if len(parts) > 2 else w * 4, 32
+
+
+def main(argv=None):
+    import dalton_driver
+    parser = argparse.ArgumentParser(description="Check the driver output against the expected correction")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run", help="verify a framebuffer showing a reference image")
+    p.add_argument("fb", help="/dev/fbN or a file standing in for it")
+    p.add_argument("reference", help="image shown on the virtual display")
+    p.add_argument("--offset", default="0,0", help="x,y of the reference on screen")
+    p.add_argument("--mode", type=dalton_engine.parse_mode, default=None, help="default: sysfs")
+    p.add_argument("--intensity", type=int, default=None, help="default: sysfs")
+    p.add_argument("--geometry", type=_parse_geometry, default=None, help="WxH[xSTRIDE] instead of sysfs")
+    p.add_argument("--heatmap", default=None, help="write the heatmap as an image")
+    sub.add_parser("check", help="inject faults into a fake framebuffer and verify them")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "check":
+        return 0 if check() else 1
+    state = dalton_driver.DriverClient().get() or (0, 0)
+    mode = state[0] if args.mode is None else args.mode
+    intensity = state[1] if args.intensity is None else args.intensity
+    offset = tuple(int(v) for v in args.offset.split(","))
+    verifier = Verifier.from_image(args.reference, offset)
+    reader = dalton_fb.FramebufferReader(args.fb, geometry=args.geometry)
+    try:
+        result = verifier.run(reader.frame(), mode, intensity)
+    finally:
+        reader.close()
+    out = result.summary()
+    out.update(mode=mode, intensity=intensity)
+    print(json.dumps(out, indent=1))
+    if args.heatmap:
+        from PIL import Image
+        Image.fromarray(heatmap_image(result, scale=4)).save(args.heatmap)
+    return 0 if result.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
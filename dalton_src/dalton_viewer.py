@@ -1,98 +1,181 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
 import os
-import mmap
+import sys
 import time
+import numpy as np
+import dalton_display
+import dalton_driver
+import dalton_fb
+import dalton_record
+import dalton_trace
+import dalton_verify
 
 # Configuration
 FB_DEVICE = "/dev/fb0" # Might be fb1, logic to detect below
 WIDTH = 800
 HEIGHT = 600
-BPP = 4 # 32 bits = 4 bytes
+POLL_MIN_MS = 50 # Poll delay while the framebuffer changes
+POLL_MAX_MS = 1000 # Poll delay when idle
+STATS_DELAY_MS = 1000 # Trace export / overlay refresh
+RECORD_ENV = "DALTON_RECORD" # ring file for the R key (default /tmp/dalton_<time>.drec)
+VERIFY_ENV = "DALTON_VERIFY_REF" # reference image for the V key (asked for if unset)
 
 class DaltonViewer:
-    def __init__(self, root, fb_path):
+    def __init__(self, root, fb_path, min_ms=POLL_MIN_MS, max_ms=POLL_MAX_MS):
         self.root = root
         self.root.title("DaltonFix: Sortie Moniteur Virtuel")
         self.root.geometry(f"{WIDTH}x{HEIGHT}")
         
         self.fb_path = fb_path
         self.img_data = None
-        self.tk_img = None
+        self.detector = dalton_fb.ChangeDetector()
+        self.poll = dalton_fb.AdaptivePoll(min_ms, max_ms)
         
         self.label = tk.Label(root)
         self.label.pack(fill="both", expand=True)
+        # Stage timings: DALTON_TRACE=1 (or =file.jsonl to export), F3 for the overlay
+        self.tracer = dalton_trace.Tracer.from_env()
+        self.overlay = tk.Label(self.label, font=("Courier", 8), bg="black", fg="#7f7", justify="left", anchor="nw")
+        self.overlay_on = False
+        self.root.bind("<F3>", self.toggle_overlay)
+        # R: record the framebuffer into a ring file (dalton_record.py play to replay it)
+        self.recorder = None
+        self.driver = None
+        self.root.bind("<r>", self.toggle_recording)
+        # V: compare the screen with the expected driver output for a reference image
+        self.verifier = None
+        self.verify_state = None
+        self.verify_label = tk.Label(self.label, font=("Courier", 9), bg="black", fg="#ff7", justify="left", anchor="sw")
+        self.root.bind("<v>", self.toggle_verify)
+        # One PhotoImage and one RGB buffer, updated in place every frame
+        self.surface = dalton_display.PhotoSurface(self.label, self.tracer)
+        self.display = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
 
         try:
-            self.f = open(self.fb_path, 'rb')
-            # Memory map the screen buffer
-            # Size = W * H * BPP (assuming we know resolution, or read from fbset stuff)
-            # For simplicity, we try to read small chunk or use os.fstat
-            stat = os.fstat(self.f.fileno())
-            self.fsize = stat.st_size
-            self.mm = mmap.mmap(self.f.fileno(), self.fsize, mmap.MAP_SHARED, mmap.PROT_READ)
-            
-            print(f"Opened {fb_path}, Size: {self.fsize} bytes")
+            # Memory map the screen buffer once; stride and bits_per_pixel
+            # come from /sys/class/graphics/<fb> and are re-read only if they change
+            self.reader = dalton_fb.FramebufferReader(self.fb_path)
+            w, h = self.reader.size
+            print(f"Opened {fb_path}, {w}x{h} {self.reader.format}, stride {self.reader.geometry[2]}")
             self.refresh()
+            self.root.after(STATS_DELAY_MS, self.update_stats)
         except Exception as e:
             messagebox.showerror("Erreur", f"Impossible d'ouvrir {fb_path}:\n{e}\n\nAssurez-vous que le driver est chargé et que vous êtes root.")
             root.destroy()
 
     def refresh(self):
-        # Seek to start
-        self.mm.seek(0)
-        
-        # Read raw data. 
-        # CAUTION: This is raw ARGB/XRGB. PIL Image.frombuffer can handle "RGBA" or "RGBX".
-        # Linux fb often BGRA or RGBA. We try "RGBA".
+        changed = False
+        t0 = time.perf_counter()
         try:
-            # We assume a standard resolution for the viewer (e.g. 800x600 or whatever kernel default)
-            # A robust viewer would parse /sys/class/graphics/fbX/virtual_size
-            # Let's try to detect square size
-            import math
-            pixels = self.fsize // 4
-            w = int(math.sqrt(pixels * (4/3))) # aspect ratio guess
-            h = pixels // w
-            
-            # Or just use fixed generic size if small?
-            # 320x240 min config in driver.
-            # Let's try a safe approach: read resolution from sysfs if possible
-            w, h = self.get_res()
-            
-            raw = self.mm.read(w * h * 4)
-            image = Image.frombytes('RGB', (w, h), raw, 'raw', 'BGRX')
-            
-            # Resize for viewing
-            display_img = image.resize((WIDTH, HEIGHT))
-            self.tk_img = ImageTk.PhotoImage(display_img)
-            
-            self.label.config(image=self.tk_img)
-            self.label.image = self.tk_img
+            if self.reader.check_geometry():
+                self.detector.reset()
+            # Unchanged framebuffer: no decode, no PhotoImage
+            with self.tracer.stage("detect"):
+                changed = self.detector.changed(self.reader, self.poll.full_scan(self.detector.row_step))
+            state = None
+            if self.verifier is not None:
+                # A new mode/intensity also calls for a new comparison
+                self.driver.poll()
+                state = self.driver.get() or (0, 0)
+            if changed or state != self.verify_state:
+                # Only the pixels needed for the WIDTHxHEIGHT view are read from the mmap
+                with self.tracer.stage("read"):
+                    self.reader.scaled_rgb((WIDTH, HEIGHT), out=self.display)
+                if self.verifier is not None:
+                    self.verify(state)
+                self.surface.show(self.display)
+                self.tracer.add("display", time.perf_counter() - t0)
+            if self.recorder is not None:
+                # Every poll is recorded: unchanged frames only cost a header
+                self.driver.poll()
+                mode, intensity = self.driver.get() or (0, 0)
+                with self.tracer.stage("record"):
+                    self.recorder.record(self.reader, mode, intensity)
             
         except Exception as e:
+            self.tracer.error("frame", e)
             print(f"Frame error: {e}")
 
-        # Refresh loop (10 FPS)
-        self.root.after(100, self.refresh)
+        # Refresh loop: fast while the screen changes, backs off toward 1 Hz when idle
+        # While recording, keep the fast rate so the timeline stays dense
+        self.root.after(self.poll.next_delay(changed or self.recorder is not None), self.refresh)
+
+    def toggle_recording(self, event=None):
+        if self.recorder is not None:
+            stats = self.recorder.stats()
+            self.recorder.close()
+            self.recorder = None
+            self.root.title("DaltonFix: Sortie Moniteur Virtuel")
+            print(f"Enregistrement terminé: {stats['frames']} images {stats['kinds']}, "
+                  f"{stats['bytes'] / 1e6:.1f} MB")
+            return
+        path = os.environ.get(RECORD_ENV) or time.strftime("/tmp/dalton_%Y%m%d_%H%M%S.drec")
+        if self.driver is None:
+            self.driver = dalton_driver.DriverClient()
+        self.recorder = dalton_record.Recorder(path)
+        self.root.title(f"DaltonFix: Sortie Moniteur Virtuel - REC {path}")
+
+    def verify(self, state):
+        # Banded comparison against the fixed-point model, drawn over the view
+        with self.tracer.stage("verify"):
+            result = self.verifier.run(self.reader.frame(), *state)
+        self.verify_state = state
+        dalton_verify.draw_overlay(self.display, result, self.verifier.offset, self.reader.size)
+        s = result.summary()
+        text = (f"mode {state[0]} intensité {state[1]} : "
+                + ("sortie conforme" if result.ok else
+                   f"{s['mismatched']} px faux (non corrigés {s['uncorrected']}, doublés {s['double']}, "
+                   f"autres {s['other']}), écart max {s['max_error']}, {len(s['boxes'])} zones")
+                + f"  [{s['ms']:.0f} ms]")
+        self.verify_label.config(text=text)
 
-    def get_res(self):
-        # Try to read /sys
+    def toggle_verify(self, event=None):
+        if self.verifier is not None:
+            self.verifier = None
+            self.verify_state = None
+            self.verify_label.place_forget()
+            self.detector.reset() # redraw without the marks
+            return
+        path = os.environ.get(VERIFY_ENV)
+        if not path:
+            from tkinter import filedialog
+            path = filedialog.askopenfilename(title="Image de référence affichée sur le moniteur virtuel")
+            if not path:
+                return
         try:
-            # name = fb0 or fb1
-            name = os.path.basename(self.fb_path)
-            with open(f"/sys/class/graphics/{name}/virtual_size", 'r') as f:
-                # "800,600"
-                data = f.read().strip().split(',')
-                return int(data[0]), int(data[1])
-        except:
-            # Fallback
-            return 800, 600
+            self.verifier = dalton_verify.Verifier.from_image(path)
+            self.verifier.region(self.reader.frame())
+        except Exception as e:
+            self.verifier = None
+            messagebox.showerror("Erreur", f"Référence inutilisable ({path}):\n{e}")
+            return
+        if self.driver is None:
+            self.driver = dalton_driver.DriverClient()
+        self.verify_label.config(text="...")
+        self.verify_label.place(x=4, rely=1.0, y=-4, anchor="sw")
 
-if __name__ == "__main__":
-    import sys
-    
+    def update_stats(self):
+        if self.tracer.enabled:
+            snap = self.tracer.snapshot()
+            self.tracer.export(snap, fb=self.fb_path)
+            if self.overlay_on:
+                self.overlay.config(text=dalton_trace.overlay_text(snap))
+        self.root.after(STATS_DELAY_MS, self.update_stats)
+
+    def toggle_overlay(self, event=None):
+        # F3: per-stage timings over the image; tracing is switched on with it
+        self.overlay_on = not self.overlay_on
+        if self.overlay_on:
+            self.tracer.enabled = True
+            self.overlay.config(text="...")
+            self.overlay.place(x=4, y=4)
+        else:
+            self.overlay.place_forget()
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
     # Detect FB device
     target_fb = None
     # We look for the one created by dalton_drv.
@@ -100,11 +183,11 @@ if __name__ == "__main__":
     fbs = sorted([f for f in os.listdir("/dev") if f.startswith("fb")])
     if not fbs:
         print("Aucun framebuffer trouvé.")
-        exit(1)
+        return 1
         
     # Pick the last one (likely the new one) or explicit argument
-    if len(sys.argv) > 1:
-        target_fb = sys.argv[1]
+    if argv:
+        target_fb = argv[0]
     else:
         # Heuristic: fb0 is usually system (VMware), fb1 is ours.
         # Check driver name in sysfs
@@ -119,6 +202,14 @@ if __name__ == "__main__":
         
         if not target_fb: target_fb = f"/dev/{fbs[-1]}"
 
+    # Optional poll bounds: dalton_viewer.py [fb] [min_ms] [max_ms]
+    min_ms = int(argv[1]) if len(argv) > 1 else POLL_MIN_MS
+    max_ms = int(argv[2]) if len(argv) > 2 else POLL_MAX_MS
+
     root = tk.Tk()
-    app = DaltonViewer(root, target_fb)
+    app = DaltonViewer(root, target_fb, min_ms, max_ms)
     root.mainloop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())